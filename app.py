@@ -20,7 +20,12 @@ def make_shell_context():
         'Review': Review,
         'Coupon': Coupon,
         'ActivityLog': ActivityLog,
-        'ProductImage': ProductImage
+        'ProductImage': ProductImage,
+        'InventoryReservation': InventoryReservation,
+        'IdempotencyKey': IdempotencyKey,
+        'Job': Job,
+        'TaxRate': TaxRate,
+        'ShippingRule': ShippingRule
     }
 
 if __name__ == '__main__':
@@ -4,6 +4,8 @@ from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_marshmallow import Marshmallow
+from app.compression import Compress
+from app.json_provider import FastJSONProvider
 from config import config
 import os
 
@@ -13,6 +15,7 @@ migrate = Migrate()
 jwt = JWTManager()
 cors = CORS()
 ma = Marshmallow()
+compress = Compress()
 
 # JWT blacklist set (in production, use Redis)
 blacklisted_tokens = set()
@@ -24,6 +27,7 @@ def create_app(config_name=None):
     
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.json = FastJSONProvider(app)
     
     # Initialize extensions with app
     db.init_app(app)
@@ -31,6 +35,29 @@ def create_app(config_name=None):
     jwt.init_app(app)
     cors.init_app(app)
     ma.init_app(app)
+    compress.init_app(app)
+    
+    # In-process caches, search analytics and the cart store
+    from app import cache
+    cache.init_app(app)
+    
+    from app.products.search import search_analytics
+    search_analytics.init_app(app)
+    
+    from app.cart.store import cart_store
+    cart_store.init_app(app)
+    
+    from app.products import availability
+    availability.init_app(app)
+    
+    from app import pricing
+    pricing.init_app(app)
+    
+    from app import coupons
+    coupons.init_app(app)
+    
+    from app.orders import snapshots
+    snapshots.init_app(app)
     
     # Create upload directory if it doesn't exist
     upload_dir = os.path.join(app.instance_path, app.config['UPLOAD_FOLDER'])
@@ -67,6 +94,10 @@ def create_app(config_name=None):
     from app.shipping import bp as shipping_bp
     app.register_blueprint(shipping_bp, url_prefix='/api/v1/shipping')
     
+    # CLI maintenance commands
+    from app.commands import register_commands
+    register_commands(app)
+    
     # Setup and health endpoints
     from app.setup import setup_bp
     app.register_blueprint(setup_bp)
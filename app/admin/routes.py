@@ -1,12 +1,21 @@
 from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime, timezone, timedelta
+from decimal import Decimal
 from sqlalchemy import func, desc
+from sqlalchemy.exc import IntegrityError
 from app.admin import bp
 from app.models import (
     User, Product, Order, OrderItem, Category, 
-    UserRole, OrderStatus, PaymentStatus
+    UserRole, OrderStatus, PaymentStatus, SearchQueryStat, TaxRate, ShippingRule, Coupon
 )
+from app.products.search import search_analytics
+from app.cache import cached_response
+from app.pagination import paginate
+from app.jobs import queue_stats
+from app.coupons import normalize_code
+from app.orders import snapshots
+from app.pricing import SHIPPING_METHODS, parse_amount
 from app import db
 
 def require_admin():
@@ -198,9 +207,7 @@ def get_users():
     # Order by created date (newest first)
     query = query.order_by(User.created_at.desc())
     
-    users = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    users = paginate(query, page, per_page, 'admin_users')
     
     user_list = [
         {
@@ -223,14 +230,7 @@ def get_users():
     return jsonify({
         'message': 'Users retrieved successfully',
         'data': user_list,
-        'pagination': {
-            'page': users.page,
-            'pages': users.pages,
-            'per_page': users.per_page,
-            'total': users.total,
-            'has_next': users.has_next,
-            'has_prev': users.has_prev
-        }
+        'pagination': users.to_dict()
     }), 200
 
 @bp.route('/users/<int:user_id>', methods=['PUT'])
@@ -319,9 +319,7 @@ def get_orders():
     # Order by created date (newest first)
     query = query.order_by(Order.created_at.desc())
     
-    orders = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    orders = paginate(query, page, per_page, 'admin_orders')
     
     order_list = [
         {
@@ -333,7 +331,7 @@ def get_orders():
             'status': order.status.value,
             'total_amount': float(order.total_amount),
             'currency': order.currency,
-            'items_count': order.get_total_items(),
+            'items_count': order.item_count,
             'payment_status': order.payment.status.value if order.payment else None,
             'created_at': order.created_at.isoformat(),
             'updated_at': order.updated_at.isoformat()
@@ -344,14 +342,29 @@ def get_orders():
     return jsonify({
         'message': 'Orders retrieved successfully',
         'data': order_list,
-        'pagination': {
-            'page': orders.page,
-            'pages': orders.pages,
-            'per_page': orders.per_page,
-            'total': orders.total,
-            'has_next': orders.has_next,
-            'has_prev': orders.has_prev
-        }
+        'pagination': orders.to_dict()
+    }), 200
+
+@bp.route('/orders/<int:order_id>', methods=['GET'])
+@jwt_required()
+@require_admin()
+def get_order(order_id):
+    """Get order details (Admin only)"""
+    order = snapshots.order_details_query().filter_by(id=order_id).first()
+    
+    if not order:
+        return jsonify({'error': 'Order not found'}), 404
+    
+    order_data = dict(snapshots.get_order_data(order))
+    order_data.update({
+        'user_id': order.user_id,
+        'customer_name': order.user.get_full_name() if order.user else 'Guest',
+        'customer_email': order.user.email if order.user else None
+    })
+    
+    return jsonify({
+        'message': 'Order retrieved successfully',
+        'data': order_data
     }), 200
 
 @bp.route('/orders/<int:order_id>', methods=['PUT'])
@@ -398,6 +411,7 @@ def update_order(order_id):
     order.updated_at = datetime.now(timezone.utc)
     
     try:
+        snapshots.refresh_snapshot(order)
         db.session.commit()
         
         return jsonify({
@@ -454,6 +468,7 @@ def get_low_stock_products():
 @bp.route('/analytics/sales', methods=['GET'])
 @jwt_required()
 @require_admin()
+@cached_response(ttl=300)
 def get_sales_analytics():
     """Get sales analytics"""
     days = request.args.get('days', 30, type=int)
@@ -516,6 +531,72 @@ def get_sales_analytics():
         'data': analytics_data
     }), 200
 
+@bp.route('/analytics/search', methods=['GET'])
+@jwt_required()
+@require_admin()
+def get_search_analytics():
+    """Get search query analytics"""
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    
+    # Read-only: counts lag by up to SEARCH_ANALYTICS_FLUSH_INTERVAL while the
+    # background thread aggregates buffered searches
+    totals = db.session.query(
+        func.count(SearchQueryStat.id),
+        func.sum(SearchQueryStat.search_count),
+        func.sum(SearchQueryStat.zero_result_count)
+    ).one()
+    unique_queries, total_searches, zero_result_searches = totals
+    total_searches = total_searches or 0
+    zero_result_searches = zero_result_searches or 0
+    
+    top_queries = SearchQueryStat.query.order_by(
+        SearchQueryStat.search_count.desc()
+    ).limit(limit).all()
+    
+    zero_result_queries = SearchQueryStat.query.filter(
+        SearchQueryStat.zero_result_count > 0
+    ).order_by(
+        SearchQueryStat.zero_result_count.desc()
+    ).limit(limit).all()
+    
+    def format_stat(stat):
+        return {
+            'query': stat.query_text,
+            'search_count': stat.search_count,
+            'zero_result_count': stat.zero_result_count,
+            'zero_result_rate': round(stat.get_zero_result_rate(), 4),
+            'last_result_count': stat.last_result_count,
+            'last_searched_at': stat.last_searched_at.isoformat() if stat.last_searched_at else None,
+            'is_hot': stat.query_text in search_analytics.hot_queries
+        }
+    
+    return jsonify({
+        'message': 'Search analytics retrieved successfully',
+        'data': {
+            'summary': {
+                'unique_queries': unique_queries,
+                'total_searches': total_searches,
+                'zero_result_searches': zero_result_searches,
+                'zero_result_rate': round(zero_result_searches / total_searches, 4) if total_searches else 0,
+                'buffered_events': search_analytics.buffered(),
+                'dropped_events': search_analytics.dropped,
+                'cached_queries': len(search_analytics.results)
+            },
+            'top_queries': [format_stat(stat) for stat in top_queries],
+            'zero_result_queries': [format_stat(stat) for stat in zero_result_queries]
+        }
+    }), 200
+
+@bp.route('/jobs/stats', methods=['GET'])
+@jwt_required()
+@require_admin()
+def get_job_stats():
+    """Get background job queue metrics"""
+    return jsonify({
+        'message': 'Job queue stats retrieved successfully',
+        'data': queue_stats()
+    }), 200
+
 @bp.route('/admin-users', methods=['GET'])
 @jwt_required()
 @require_admin()
@@ -949,3 +1030,391 @@ def generate_secure_password_endpoint():
         'length': len(password),
         'note': 'Use this password with password reset endpoints'
     }), 200
+
+# ----------------- Pricing tables -----------------
+
+TAX_RATE_FIELDS = ['country', 'state', 'rate', 'name', 'is_active']
+SHIPPING_RULE_FIELDS = [
+    'method', 'name', 'country', 'min_weight', 'max_weight', 'min_subtotal', 'max_subtotal',
+    'base_cost', 'cost_per_kg', 'estimated_days', 'priority', 'is_active'
+]
+AMOUNT_FIELDS = ['rate', 'min_weight', 'max_weight', 'min_subtotal', 'max_subtotal', 'base_cost', 'cost_per_kg']
+UPPER_BOUND_FIELDS = {'max_weight': 'min_weight', 'max_subtotal': 'min_subtotal'}  # None means no limit
+
+def serialize_tax_rate(rate):
+    return {
+        'id': rate.id,
+        'country': rate.country,
+        'state': rate.state,
+        'rate': float(rate.rate),
+        'name': rate.name,
+        'is_active': rate.is_active
+    }
+
+def serialize_shipping_rule(rule):
+    def number(value):
+        return float(value) if value is not None else None
+    
+    return {
+        'id': rule.id,
+        'method': rule.method,
+        'name': rule.name,
+        'country': rule.country,
+        'min_weight': number(rule.min_weight),
+        'max_weight': number(rule.max_weight),
+        'min_subtotal': number(rule.min_subtotal),
+        'max_subtotal': number(rule.max_subtotal),
+        'base_cost': number(rule.base_cost),
+        'cost_per_kg': number(rule.cost_per_kg),
+        'estimated_days': rule.estimated_days,
+        'priority': rule.priority,
+        'is_active': rule.is_active
+    }
+
+def apply_pricing_fields(obj, data, fields):
+    """Copy the given fields from request data, normalizing region codes; returns an error message or None"""
+    for field in fields:
+        if field not in data:
+            continue
+        value = data[field]
+        if field in ('country', 'state'):
+            if value is not None and not isinstance(value, str):
+                return f'{field} must be a string'
+            value = value.strip().upper() if value else None
+        elif field in AMOUNT_FIELDS:
+            if value is not None or field not in UPPER_BOUND_FIELDS:
+                value = parse_amount(value)
+                if value is None:
+                    return f'{field} must be a non-negative number'
+        elif field == 'priority':
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                return 'priority must be a non-negative integer'
+        elif field == 'method' and value not in SHIPPING_METHODS:
+            return f"method must be one of {', '.join(SHIPPING_METHODS)}"
+        elif field == 'name' and isinstance(obj, ShippingRule) and not (isinstance(value, str) and value.strip()):
+            return 'name is required'
+        elif field == 'is_active' and not isinstance(value, bool):
+            return 'is_active must be true or false'
+        setattr(obj, field, value)
+    
+    if isinstance(obj, TaxRate) and obj.rate is not None and obj.rate > 1:
+        return 'rate must be a fraction, e.g. 0.10 for 10%'
+    if isinstance(obj, ShippingRule):
+        for upper, lower in UPPER_BOUND_FIELDS.items():
+            maximum, minimum = getattr(obj, upper), getattr(obj, lower) or 0
+            if maximum is not None and Decimal(maximum) <= Decimal(minimum):
+                return f'{upper} must be greater than {lower}'
+    return None
+
+@bp.route('/pricing', methods=['GET'])
+@jwt_required()
+@require_admin()
+def get_pricing_tables():
+    """List tax rates and shipping rules"""
+    return jsonify({
+        'message': 'Pricing tables retrieved successfully',
+        'data': {
+            'tax_rates': [
+                serialize_tax_rate(rate)
+                for rate in TaxRate.query.order_by(TaxRate.country, TaxRate.state).all()
+            ],
+            'shipping_rules': [
+                serialize_shipping_rule(rule)
+                for rule in ShippingRule.query.order_by(
+                    ShippingRule.country, ShippingRule.method, ShippingRule.priority
+                ).all()
+            ]
+        }
+    }), 200
+
+@bp.route('/pricing/tax-rates', methods=['POST'])
+@jwt_required()
+@require_admin()
+def create_tax_rate():
+    """Create a tax rate for a country or state"""
+    data = request.get_json()
+    
+    if not data or data.get('rate') is None:
+        return jsonify({'error': 'rate is required'}), 400
+    
+    rate = TaxRate()
+    error = apply_pricing_fields(rate, data, TAX_RATE_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    if TaxRate.query.filter_by(country=rate.country, state=rate.state).first():
+        return jsonify({'error': 'A tax rate for this region already exists'}), 409
+    
+    try:
+        db.session.add(rate)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Tax rate created successfully',
+            'data': serialize_tax_rate(rate)
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create tax rate', 'details': str(e)}), 500
+
+@bp.route('/pricing/tax-rates/<int:rate_id>', methods=['PUT', 'DELETE'])
+@jwt_required()
+@require_admin()
+def update_tax_rate(rate_id):
+    """Update or delete a tax rate"""
+    rate = db.session.get(TaxRate, rate_id)
+    
+    if not rate:
+        return jsonify({'error': 'Tax rate not found'}), 404
+    
+    try:
+        if request.method == 'DELETE':
+            db.session.delete(rate)
+            db.session.commit()
+            return jsonify({'message': 'Tax rate deleted successfully'}), 200
+        
+        error = apply_pricing_fields(rate, request.get_json() or {}, TAX_RATE_FIELDS)
+        if error:
+            db.session.rollback()
+            return jsonify({'error': error}), 400
+        
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Tax rate updated successfully',
+            'data': serialize_tax_rate(rate)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update tax rate', 'details': str(e)}), 500
+
+@bp.route('/pricing/shipping-rules', methods=['POST'])
+@jwt_required()
+@require_admin()
+def create_shipping_rule():
+    """Create a shipping rule for a weight and subtotal tier"""
+    data = request.get_json()
+    
+    if not data or not data.get('name'):
+        return jsonify({'error': 'name is required'}), 400
+    
+    rule = ShippingRule()
+    error = apply_pricing_fields(rule, data, SHIPPING_RULE_FIELDS)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    try:
+        db.session.add(rule)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Shipping rule created successfully',
+            'data': serialize_shipping_rule(rule)
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create shipping rule', 'details': str(e)}), 500
+
+@bp.route('/pricing/shipping-rules/<int:rule_id>', methods=['PUT', 'DELETE'])
+@jwt_required()
+@require_admin()
+def update_shipping_rule(rule_id):
+    """Update or delete a shipping rule"""
+    rule = db.session.get(ShippingRule, rule_id)
+    
+    if not rule:
+        return jsonify({'error': 'Shipping rule not found'}), 404
+    
+    try:
+        if request.method == 'DELETE':
+            db.session.delete(rule)
+            db.session.commit()
+            return jsonify({'message': 'Shipping rule deleted successfully'}), 200
+        
+        error = apply_pricing_fields(rule, request.get_json() or {}, SHIPPING_RULE_FIELDS)
+        if error:
+            db.session.rollback()
+            return jsonify({'error': error}), 400
+        
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Shipping rule updated successfully',
+            'data': serialize_shipping_rule(rule)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update shipping rule', 'details': str(e)}), 500
+
+# ----------------- Coupons -----------------
+
+COUPON_FIELDS = [
+    'code', 'description', 'type', 'value', 'minimum_amount', 'maximum_discount',
+    'usage_limit', 'is_active', 'expires_at'
+]
+
+def serialize_coupon(coupon):
+    def number(value):
+        return float(value) if value is not None else None
+    
+    return {
+        'id': coupon.id,
+        'code': coupon.code,
+        'description': coupon.description,
+        'type': coupon.type,
+        'value': number(coupon.value),
+        'minimum_amount': number(coupon.minimum_amount),
+        'maximum_discount': number(coupon.maximum_discount),
+        'usage_limit': coupon.usage_limit,
+        'used_count': coupon.used_count,
+        'is_active': coupon.is_active,
+        'expires_at': coupon.expires_at.isoformat() if coupon.expires_at else None,
+        'created_at': coupon.created_at.isoformat() if coupon.created_at else None
+    }
+
+def apply_coupon_fields(coupon, data):
+    """Copy coupon fields from request data; returns an error message or None"""
+    for field in COUPON_FIELDS:
+        if field not in data:
+            continue
+        value = data[field]
+        if field == 'code':
+            value = normalize_code(value)
+            if value is None:
+                return 'code must be a non-empty string'
+        elif field == 'type' and value not in ('percentage', 'fixed'):
+            return 'type must be percentage or fixed'
+        elif field in ('value', 'minimum_amount', 'maximum_discount'):
+            # Only value is required; a null minimum or maximum means no limit
+            if value is not None or field == 'value':
+                value = parse_amount(value)
+                if value is None:
+                    return f'{field} must be a non-negative number'
+        elif field == 'usage_limit' and value is not None:
+            if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                return 'usage_limit must be a positive integer'
+        elif field == 'description' and value is not None and not isinstance(value, str):
+            return 'description must be a string'
+        elif field == 'is_active' and not isinstance(value, bool):
+            return 'is_active must be true or false'
+        elif field == 'expires_at' and value:
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                return 'expires_at must be an ISO 8601 date'
+        setattr(coupon, field, value)
+    
+    if coupon.type == 'percentage' and coupon.value is not None and Decimal(coupon.value) > 100:
+        return 'a percentage value must be at most 100'
+    return None
+
+@bp.route('/coupons', methods=['GET'])
+@jwt_required()
+@require_admin()
+def get_coupons():
+    """List coupons"""
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    
+    coupons = Coupon.query.order_by(Coupon.created_at.desc()).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    
+    return jsonify({
+        'message': 'Coupons retrieved successfully',
+        'data': [serialize_coupon(coupon) for coupon in coupons.items],
+        'pagination': {
+            'page': coupons.page,
+            'pages': coupons.pages,
+            'per_page': coupons.per_page,
+            'total': coupons.total
+        }
+    }), 200
+
+@bp.route('/coupons', methods=['POST'])
+@jwt_required()
+@require_admin()
+def create_coupon():
+    """Create a coupon"""
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({'error': 'Coupon data is required'}), 400
+    
+    for field in ('code', 'type', 'value'):
+        if data.get(field) in (None, ''):
+            return jsonify({'error': f'{field} is required'}), 400
+    
+    coupon = Coupon(used_count=0)
+    error = apply_coupon_fields(coupon, data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    if Coupon.query.filter_by(code=coupon.code).first():
+        return jsonify({'error': 'Coupon code already exists'}), 409
+    
+    try:
+        db.session.add(coupon)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Coupon created successfully',
+            'data': serialize_coupon(coupon)
+        }), 201
+        
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Coupon code already exists'}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create coupon', 'details': str(e)}), 500
+
+@bp.route('/coupons/<int:coupon_id>', methods=['PUT', 'DELETE'])
+@jwt_required()
+@require_admin()
+def update_coupon(coupon_id):
+    """Update or delete a coupon"""
+    coupon = db.session.get(Coupon, coupon_id)
+    
+    if not coupon:
+        return jsonify({'error': 'Coupon not found'}), 404
+    
+    try:
+        if request.method == 'DELETE':
+            db.session.delete(coupon)
+            db.session.commit()
+            return jsonify({'message': 'Coupon deleted successfully'}), 200
+        
+        data = request.get_json() or {}
+        error = apply_coupon_fields(coupon, data)
+        if error:
+            db.session.rollback()
+            return jsonify({'error': error}), 400
+        
+        # Flushing the new code before the check would hit the unique index
+        with db.session.no_autoflush:
+            duplicate = 'code' in data and Coupon.query.filter(
+                Coupon.code == coupon.code, Coupon.id != coupon.id
+            ).first()
+        if duplicate:
+            db.session.rollback()
+            return jsonify({'error': 'Coupon code already exists'}), 409
+        
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Coupon updated successfully',
+            'data': serialize_coupon(coupon)
+        }), 200
+        
+    except IntegrityError:
+        # Another request took the code between the check and the commit
+        db.session.rollback()
+        return jsonify({'error': 'Coupon code already exists'}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update coupon', 'details': str(e)}), 500
@@ -0,0 +1,187 @@
+"""
+In-process caches shared by the API blueprints.
+
+Every gunicorn worker keeps its own copy of these caches, so entries are
+bounded by a TTL in addition to explicit invalidation.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.i18n import get_request_language
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+# ----------------- Catalog invalidation -----------------
+
+CATALOG_MODELS = ('Product', 'ProductImage', 'Category', 'Tag')
+
+_catalog_callbacks = []
+_catalog_version = 0
+_listeners_registered = False
+
+
+def on_catalog_change(func):
+    """Register a callback run after any committed catalog change"""
+    _catalog_callbacks.append(func)
+    return func
+
+
+def get_catalog_version():
+    return _catalog_version
+
+
+def invalidate_catalog():
+    """Bump the catalog version and notify registered caches"""
+    global _catalog_version
+    _catalog_version += 1
+    for callback in _catalog_callbacks:
+        callback()
+
+
+def mark_catalog_changed(session):
+    """Invalidate the catalog once the session commits, e.g. after a bulk UPDATE the flush hooks cannot see"""
+    session.info['catalog_changed'] = True
+
+
+def _touches_catalog(session):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if type(obj).__name__ in CATALOG_MODELS:
+            return True
+    return False
+
+
+def _after_flush(session, flush_context):
+    if _touches_catalog(session):
+        session.info['catalog_changed'] = True
+
+
+def _after_commit(session):
+    if session.info.pop('catalog_changed', False):
+        invalidate_catalog()
+
+
+def _after_rollback(session):
+    session.info.pop('catalog_changed', None)
+
+
+def init_app(app):
+    """Hook catalog invalidation into every SQLAlchemy session"""
+    global _listeners_registered
+    response_cache.maxsize = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 256)
+    response_cache.ttl = app.config.get('RESPONSE_CACHE_TTL', 60)
+    if _listeners_registered:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _listeners_registered = True
+
+
+# ----------------- Response cache -----------------
+
+class CachedResponse:
+    """A cached response body plus lazily added compressed variants"""
+
+    def __init__(self, body, status, mimetype):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.encodings = {}
+
+    def get_encoded(self, encoding, compress):
+        data = self.encodings.get(encoding)
+        if data is None:
+            data = compress(self.body, encoding)
+            self.encodings[encoding] = data
+        return data
+
+
+response_cache = TTLCache(maxsize=256, ttl=60)
+
+
+def cached_response(ttl=None, catalog=False):
+    """Cache successful responses by path, query string and language
+
+    With catalog=True entries are keyed on the catalog version, so any
+    committed catalog change makes them unreachable.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('RESPONSE_CACHE_ENABLED', True):
+                return f(*args, **kwargs)
+
+            key = (
+                f.__name__,
+                request.full_path,
+                get_request_language(),
+                get_catalog_version() if catalog else None
+            )
+
+            entry = response_cache.get(key)
+            if entry is None:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                entry = CachedResponse(response.get_data(), response.status_code, response.mimetype)
+                response_cache.set(key, entry, ttl)
+            else:
+                response = current_app.response_class(
+                    entry.body, status=entry.status, mimetype=entry.mimetype
+                )
+
+            response.cache_entry = entry
+            return response
+        return wrapper
+    return decorator
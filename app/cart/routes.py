@@ -2,8 +2,18 @@ from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timezone
 from app.cart import bp
-from app.models import Cart, CartItem, Product, User
-from app import db
+from app.models import Address, Cart, CartItem, Product, User
+from app.cart.services import (
+    serialize_cart, empty_cart, get_cart_totals, get_user_cart_totals, get_user_cart_measures,
+    parse_batch_operations, apply_batch_operations,
+    get_or_create_cart_id, upsert_cart_item,
+    serialize_snapshot, get_snapshot_totals,
+    load_batch_products, resolve_batch_quantities,
+    find_cart_issues, suggested_fixes
+)
+from app.cart.store import cart_store, CartUpdateError
+from app.orders.services import price_measures
+from app import db, inventory, pricing
 
 @bp.route('', methods=['GET'])
 @jwt_required()
@@ -11,47 +21,18 @@ def get_cart():
     """Get current user's cart"""
     user_id = int(get_jwt_identity())
     
-    # Get or create cart
-    cart = Cart.query.filter_by(user_id=user_id).first()
-    if not cart:
-        cart = Cart(user_id=user_id)
-        db.session.add(cart)
-        db.session.commit()
+    if cart_store.enabled:
+        return jsonify({
+            'message': 'Cart retrieved successfully',
+            'data': serialize_snapshot(cart_store.get(user_id))
+        }), 200
     
-    # Format cart data
-    cart_data = {
-        'id': cart.id,
-        'user_id': cart.user_id,
-        'total_items': cart.get_total_items(),
-        'total_price': float(cart.get_total_price()),
-        'items': [
-            {
-                'id': item.id,
-                'product_id': item.product_id,
-                'product': {
-                    'id': item.product.id,
-                    'name': item.product.name,
-                    'nameAr': item.product.nameAr,
-                    'sku': item.product.sku,
-                    'price': float(item.product.price),
-                    'stock_quantity': item.product.stock_quantity,
-                    'is_in_stock': item.product.is_in_stock(),
-                    'main_image': item.product.get_main_image()
-                },
-                'quantity': item.quantity,
-                'unit_price': float(item.product.price),
-                'total_price': float(item.get_total_price()),
-                'added_at': item.added_at.isoformat()
-            }
-            for item in cart.items
-        ],
-        'created_at': cart.created_at.isoformat(),
-        'updated_at': cart.updated_at.isoformat()
-    }
+    # Carts are created on first mutation, so reading never writes
+    cart = Cart.query.filter_by(user_id=user_id).first()
     
     return jsonify({
         'message': 'Cart retrieved successfully',
-        'data': cart_data
+        'data': serialize_cart(cart) if cart else empty_cart(user_id)
     }), 200
 
 @bp.route('/add', methods=['POST'])
@@ -79,45 +60,52 @@ def add_to_cart():
     if product.stock_quantity < quantity:
         return jsonify({'error': 'Insufficient stock'}), 400
     
-    # Get or create cart
-    cart = Cart.query.filter_by(user_id=user_id).first()
-    if not cart:
-        cart = Cart(user_id=user_id)
-        db.session.add(cart)
-        db.session.flush()  # Get cart ID
-    
-    # Check if item already exists in cart
-    cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product_id).first()
+    if cart_store.enabled:
+        try:
+            new_quantity, snapshot = cart_store.add_item(
+                user_id, product_id, quantity, product.stock_quantity, product.price
+            )
+        except CartUpdateError as e:
+            return jsonify({'error': e.message}), 400
+        
+        totals = get_snapshot_totals(snapshot)
+        return jsonify({
+            'message': 'Item added to cart successfully',
+            'data': {
+                'cart_id': snapshot.cart_id,
+                'item_id': product_id,
+                'product_id': product_id,
+                'quantity': new_quantity,
+                'total_items': totals['total_items'],
+                'total_price': totals['total_price']
+            }
+        }), 200
     
-    if cart_item:
-        # Update quantity
-        new_quantity = cart_item.quantity + quantity
-        if product.stock_quantity < new_quantity:
+    try:
+        # Insert the line or add to its quantity in one statement
+        cart_id = get_or_create_cart_id(user_id)
+        item_id, new_quantity = upsert_cart_item(cart_id, product_id, quantity, product.price)
+        
+        # Hold stock for the whole line; fails if other carts hold the rest
+        if product.stock_quantity < new_quantity or not inventory.hold(user_id, product_id, new_quantity):
+            db.session.rollback()
             return jsonify({'error': 'Insufficient stock for total quantity'}), 400
-        cart_item.quantity = new_quantity
-    else:
-        # Add new item
-        cart_item = CartItem(
-            cart_id=cart.id,
-            product_id=product_id,
-            quantity=quantity
+        
+        Cart.query.filter_by(id=cart_id).update(
+            {'updated_at': datetime.now(timezone.utc)}, synchronize_session=False
         )
-        db.session.add(cart_item)
-    
-    cart.updated_at = datetime.now(timezone.utc)
-    
-    try:
         db.session.commit()
+        totals = get_cart_totals(cart_id)
         
         return jsonify({
             'message': 'Item added to cart successfully',
             'data': {
-                'cart_id': cart.id,
-                'item_id': cart_item.id,
+                'cart_id': cart_id,
+                'item_id': item_id,
                 'product_id': product_id,
-                'quantity': cart_item.quantity,
-                'total_items': cart.get_total_items(),
-                'total_price': float(cart.get_total_price())
+                'quantity': new_quantity,
+                'total_items': totals['total_items'],
+                'total_price': totals['total_price']
             }
         }), 200
         
@@ -125,6 +113,57 @@ def add_to_cart():
         db.session.rollback()
         return jsonify({'error': 'Failed to add item to cart', 'details': str(e)}), 500
 
+@bp.route('/items/batch', methods=['POST'])
+@jwt_required()
+def batch_update_cart():
+    """Apply many add/set/remove operations to the cart atomically"""
+    user_id = int(get_jwt_identity())
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({'error': 'Operations are required'}), 400
+    
+    operations, errors = parse_batch_operations(data.get('operations'))
+    if errors:
+        return jsonify({'error': 'Invalid operations', 'details': errors}), 400
+    
+    if cart_store.enabled:
+        products = load_batch_products(operations)
+        
+        def apply(quantities):
+            errors = resolve_batch_quantities(operations, quantities, products)
+            if errors:
+                raise CartUpdateError('Cart update failed', errors)
+        
+        try:
+            _, snapshot = cart_store.update(user_id, apply, {
+                product_id: product.price for product_id, product in products.items()
+            })
+        except CartUpdateError as e:
+            return jsonify({'error': e.message, 'details': e.details}), 400
+        
+        return jsonify({
+            'message': 'Cart updated successfully',
+            'data': serialize_snapshot(snapshot)
+        }), 200
+    
+    cart, errors = apply_batch_operations(user_id, operations)
+    if errors:
+        db.session.rollback()
+        return jsonify({'error': 'Cart update failed', 'details': errors}), 400
+    
+    try:
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Cart updated successfully',
+            'data': serialize_cart(cart)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update cart', 'details': str(e)}), 500
+
 @bp.route('/update/<int:item_id>', methods=['PUT'])
 @jwt_required()
 def update_cart_item(item_id):
@@ -140,6 +179,26 @@ def update_cart_item(item_id):
     if quantity < 0:
         return jsonify({'error': 'Quantity cannot be negative'}), 400
     
+    if cart_store.enabled:
+        # Item IDs are product IDs in memory mode
+        if quantity > 0:
+            product = db.session.get(Product, item_id)
+            if product and product.stock_quantity < quantity:
+                return jsonify({'error': 'Insufficient stock'}), 400
+        try:
+            snapshot = cart_store.set_item(user_id, item_id, quantity)
+        except CartUpdateError as e:
+            return jsonify({'error': e.message}), 404
+        
+        totals = get_snapshot_totals(snapshot)
+        return jsonify({
+            'message': 'Cart item updated successfully',
+            'data': {
+                'total_items': totals['total_items'],
+                'total_price': totals['total_price']
+            }
+        }), 200
+    
     # Get cart item
     cart_item = CartItem.query.join(Cart).filter(
         CartItem.id == item_id,
@@ -152,26 +211,31 @@ def update_cart_item(item_id):
     if quantity == 0:
         # Remove item
         db.session.delete(cart_item)
+        inventory.release(user_id, [cart_item.product_id])
     else:
         # Check stock availability
         if cart_item.product.stock_quantity < quantity:
             return jsonify({'error': 'Insufficient stock'}), 400
         
         cart_item.quantity = quantity
+        if not inventory.hold(user_id, cart_item.product_id, quantity):
+            db.session.rollback()
+            return jsonify({'error': 'Insufficient stock'}), 400
     
+    cart_id = cart_item.cart_id
     cart_item.cart.updated_at = datetime.now(timezone.utc)
     
     try:
         db.session.commit()
         
         # Get updated cart totals
-        cart = cart_item.cart if quantity > 0 else Cart.query.filter_by(user_id=user_id).first()
+        totals = get_cart_totals(cart_id)
         
         return jsonify({
             'message': 'Cart item updated successfully',
             'data': {
-                'total_items': cart.get_total_items() if cart else 0,
-                'total_price': float(cart.get_total_price()) if cart else 0
+                'total_items': totals['total_items'],
+                'total_price': totals['total_price']
             }
         }), 200
         
@@ -185,6 +249,21 @@ def remove_cart_item(item_id):
     """Remove item from cart"""
     user_id = int(get_jwt_identity())
     
+    if cart_store.enabled:
+        try:
+            snapshot = cart_store.set_item(user_id, item_id, 0)
+        except CartUpdateError as e:
+            return jsonify({'error': e.message}), 404
+        
+        totals = get_snapshot_totals(snapshot)
+        return jsonify({
+            'message': 'Item removed from cart successfully',
+            'data': {
+                'total_items': totals['total_items'],
+                'total_price': totals['total_price']
+            }
+        }), 200
+    
     # Get cart item
     cart_item = CartItem.query.join(Cart).filter(
         CartItem.id == item_id,
@@ -194,18 +273,20 @@ def remove_cart_item(item_id):
     if not cart_item:
         return jsonify({'error': 'Cart item not found'}), 404
     
-    cart = cart_item.cart
+    cart_id = cart_item.cart_id
+    cart_item.cart.updated_at = datetime.now(timezone.utc)
     db.session.delete(cart_item)
-    cart.updated_at = datetime.now(timezone.utc)
+    inventory.release(user_id, [cart_item.product_id])
     
     try:
         db.session.commit()
+        totals = get_cart_totals(cart_id)
         
         return jsonify({
             'message': 'Item removed from cart successfully',
             'data': {
-                'total_items': cart.get_total_items(),
-                'total_price': float(cart.get_total_price())
+                'total_items': totals['total_items'],
+                'total_price': totals['total_price']
             }
         }), 200
         
@@ -219,12 +300,17 @@ def clear_cart():
     """Clear all items from cart"""
     user_id = int(get_jwt_identity())
     
+    if cart_store.enabled:
+        cart_store.clear(user_id)
+        return jsonify({'message': 'Cart cleared successfully'}), 200
+    
     cart = Cart.query.filter_by(user_id=user_id).first()
     if not cart:
         return jsonify({'message': 'Cart is already empty'}), 200
     
     cart.clear()
     cart.updated_at = datetime.now(timezone.utc)
+    inventory.release(user_id)
     
     try:
         db.session.commit()
@@ -239,13 +325,17 @@ def get_cart_count():
     """Get cart item count"""
     user_id = int(get_jwt_identity())
     
-    cart = Cart.query.filter_by(user_id=user_id).first()
+    if cart_store.enabled:
+        snapshot = cart_store.get(user_id)
+        totals = {'total_items': snapshot.total_items, 'unique_items': len(snapshot.items)}
+    else:
+        totals = get_user_cart_totals(user_id)
     
     return jsonify({
         'message': 'Cart count retrieved successfully',
         'data': {
-            'total_items': cart.get_total_items() if cart else 0,
-            'unique_items': len(cart.items) if cart else 0
+            'total_items': totals['total_items'],
+            'unique_items': totals['unique_items']
         }
     }), 200
 
@@ -255,43 +345,51 @@ def validate_cart():
     """Validate cart items (stock availability, price changes)"""
     user_id = int(get_jwt_identity())
     
-    cart = Cart.query.filter_by(user_id=user_id).first()
-    if not cart or not cart.items:
+    if cart_store.enabled:
+        cart_store.flush_user(user_id)
+    
+    totals, measures = get_user_cart_measures(user_id)
+    if not totals['unique_items']:
         return jsonify({'error': 'Cart is empty'}), 400
     
-    issues = []
+    issues = find_cart_issues(user_id)
+    if cart_store.enabled:
+        # Item IDs are product IDs in memory mode
+        for issue in issues:
+            issue['item_id'] = issue['product_id']
+    
+    # Estimate the order totals for the given address (else the default one) and coupon
+    data = request.get_json(silent=True) or {}
+    address_query = Address.query.filter_by(user_id=user_id)
+    if data.get('address_id'):
+        address = address_query.filter_by(id=data['address_id']).first()
+        if not address:
+            return jsonify({'error': 'Address not found'}), 404
+    else:
+        address = address_query.order_by(Address.is_default.desc(), Address.id).first()
     
-    for item in cart.items:
-        product = item.product
-        
-        # Check if product is still active
-        if not product.is_active:
-            issues.append({
-                'item_id': item.id,
-                'product_id': product.id,
-                'product_name': product.name,
-                'issue': 'Product is no longer available',
-                'action': 'remove'
-            })
-            continue
-        
-        # Check stock availability
-        if product.stock_quantity < item.quantity:
-            issues.append({
-                'item_id': item.id,
-                'product_id': product.id,
-                'product_name': product.name,
-                'issue': f'Only {product.stock_quantity} items available',
-                'action': 'reduce_quantity',
-                'available_quantity': product.stock_quantity
-            })
+    try:
+        # Priced from the aggregate above, without loading the lines
+        quote, coupon = price_measures(
+            measures,
+            address.country if address else None,
+            address.state if address else None,
+            data
+        )
+        estimate = {**quote.as_dict(), 'coupon_code': coupon.code if coupon else None}
+    except pricing.PricingError as e:
+        estimate = {'error': str(e)}
     
     return jsonify({
         'message': 'Cart validation completed',
         'data': {
-            'valid': len(issues) == 0,
+            # Price changes are informational and do not block checkout
+            'valid': all(issue['action'] == 'review_price' for issue in issues),
             'issues': issues,
-            'total_items': cart.get_total_items(),
-            'total_price': float(cart.get_total_price())
+            'suggested_fixes': suggested_fixes(issues),
+            'total_items': totals['total_items'],
+            'total_price': totals['total_price'],
+            'pricing': estimate,
+            'address_id': address.id if address else None
         }
     }), 200
@@ -0,0 +1,503 @@
+"""
+Cart data access shared by the cart routes.
+"""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from sqlalchemy import select, func, and_, case, insert, or_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from app import db, inventory
+from app.models import Cart, CartItem, Product, ProductImage, InventoryReservation
+
+
+# ----------------- Atomic writes -----------------
+
+def dialect_insert(table):
+    """Dialect-specific INSERT supporting upserts, or None if unsupported"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    if dialect == 'mysql':
+        return mysql.insert(table)
+    return None
+
+
+def get_or_create_cart_id(user_id):
+    """Return the user's cart ID, creating the cart without racing other requests"""
+    cart_id = db.session.query(Cart.id).filter_by(user_id=user_id).scalar()
+    if cart_id:
+        return cart_id
+    
+    now = datetime.now(timezone.utc)
+    stmt = dialect_insert(Cart.__table__)
+    if stmt is None:
+        cart = Cart(user_id=user_id)
+        db.session.add(cart)
+        db.session.flush()
+        return cart.id
+    
+    stmt = stmt.values(user_id=user_id, created_at=now, updated_at=now)
+    if db.session.get_bind().dialect.name == 'mysql':
+        stmt = stmt.prefix_with('IGNORE')
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=['user_id'])
+    db.session.execute(stmt)
+    return db.session.query(Cart.id).filter_by(user_id=user_id).scalar()
+
+
+def upsert_cart_item(cart_id, product_id, quantity, unit_price):
+    """Add quantity to a cart line in a single statement; returns (item_id, quantity)
+
+    Uses INSERT ... ON CONFLICT DO UPDATE on PostgreSQL and SQLite and
+    ON DUPLICATE KEY UPDATE on MySQL, relying on the unique
+    (cart_id, product_id) constraint. The line's price snapshot is set to
+    unit_price, the price the customer saw when adding.
+    """
+    table = CartItem.__table__
+    stmt = dialect_insert(table)
+    
+    if stmt is None:
+        item = CartItem.query.filter_by(cart_id=cart_id, product_id=product_id).with_for_update().first()
+        if item:
+            item.quantity += quantity
+            item.unit_price = unit_price
+        else:
+            item = CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity, unit_price=unit_price)
+            db.session.add(item)
+        db.session.flush()
+        return item.id, item.quantity
+    
+    stmt = stmt.values(
+        cart_id=cart_id,
+        product_id=product_id,
+        quantity=quantity,
+        unit_price=unit_price,
+        added_at=datetime.now(timezone.utc)
+    )
+    
+    if db.session.get_bind().dialect.name == 'mysql':
+        db.session.execute(stmt.on_duplicate_key_update(
+            quantity=table.c.quantity + stmt.inserted.quantity,
+            unit_price=stmt.inserted.unit_price
+        ))
+        return db.session.query(CartItem.id, CartItem.quantity).filter_by(
+            cart_id=cart_id, product_id=product_id
+        ).one()
+    
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['cart_id', 'product_id'],
+        set_={
+            'quantity': table.c.quantity + stmt.excluded.quantity,
+            'unit_price': stmt.excluded.unit_price
+        }
+    ).returning(table.c.id, table.c.quantity)
+    return tuple(db.session.execute(stmt).one())
+
+
+def main_image_subquery():
+    """Correlated subquery selecting a product's main (first) image URL"""
+    return select(ProductImage.url).where(
+        ProductImage.product_id == Product.id
+    ).order_by(ProductImage.id).limit(1).correlate(Product).scalar_subquery()
+
+
+def load_cart_lines(cart_id):
+    """Load cart items with their products and main images in one query"""
+    return db.session.query(
+        CartItem, Product, main_image_subquery().label('main_image')
+    ).join(
+        Product, CartItem.product_id == Product.id
+    ).filter(
+        CartItem.cart_id == cart_id
+    ).order_by(CartItem.id).all()
+
+
+def cart_totals_query():
+    return db.session.query(
+        func.coalesce(func.sum(CartItem.quantity), 0).label('total_items'),
+        func.coalesce(func.sum(CartItem.quantity * Product.price), 0).label('total_price'),
+        func.count(CartItem.id).label('unique_items')
+    ).join(Product, CartItem.product_id == Product.id)
+
+
+def format_totals(row):
+    return {
+        'total_items': int(row.total_items),
+        'total_price': float(row.total_price),
+        'unique_items': row.unique_items
+    }
+
+
+def get_cart_totals(cart_id):
+    """Quantity and price totals for a cart with a single aggregate query"""
+    return format_totals(cart_totals_query().filter(CartItem.cart_id == cart_id).one())
+
+
+def get_user_cart_totals(user_id):
+    """Same as get_cart_totals, resolving the cart by user in the same query"""
+    return format_totals(
+        cart_totals_query().join(Cart, CartItem.cart_id == Cart.id).filter(Cart.user_id == user_id).one()
+    )
+
+
+def get_user_cart_measures(user_id):
+    """Totals of the user's cart and its pricing measures in one aggregate query
+
+    Returns (totals, (subtotal, shipping weight, whether anything ships)),
+    the measures pricing.measure takes from loaded lines.
+    """
+    ships = and_(Product.requires_shipping == True, Product.is_digital == False)
+    row = cart_totals_query().add_columns(
+        func.coalesce(func.sum(case((ships, CartItem.quantity * Product.weight), else_=0)), 0).label('weight'),
+        func.coalesce(func.max(case((ships, 1), else_=0)), 0).label('ships')
+    ).join(Cart, CartItem.cart_id == Cart.id).filter(Cart.user_id == user_id).one()
+    measures = (Decimal(str(row.total_price)), Decimal(str(row.weight)), bool(row.ships))
+    return format_totals(row), measures
+
+
+def empty_cart(user_id):
+    """Representation of a cart that has not been materialized yet"""
+    return {
+        'id': None,
+        'user_id': user_id,
+        'total_items': 0,
+        'total_price': 0.0,
+        'items': [],
+        'created_at': None,
+        'updated_at': None
+    }
+
+
+def serialize_cart(cart):
+    """Format a cart, computing totals in the same pass over its lines"""
+    items = []
+    total_items = 0
+    total_price = Decimal('0')
+    
+    for item, product, main_image in load_cart_lines(cart.id):
+        line_total = product.price * item.quantity
+        total_items += item.quantity
+        total_price += line_total
+        items.append({
+            'id': item.id,
+            'product_id': item.product_id,
+            'product': {
+                'id': product.id,
+                'name': product.name,
+                'nameAr': product.nameAr,
+                'sku': product.sku,
+                'price': float(product.price),
+                'stock_quantity': product.stock_quantity,
+                'is_in_stock': product.is_in_stock(),
+                'main_image': main_image
+            },
+            'quantity': item.quantity,
+            'unit_price': float(product.price),
+            'total_price': float(line_total),
+            'added_at': item.added_at.isoformat()
+        })
+    
+    return {
+        'id': cart.id,
+        'user_id': cart.user_id,
+        'total_items': total_items,
+        'total_price': float(total_price),
+        'items': items,
+        'created_at': cart.created_at.isoformat(),
+        'updated_at': cart.updated_at.isoformat()
+    }
+
+
+# ----------------- Validation -----------------
+
+def find_cart_issues(user_id):
+    """Return issues for the user's cart lines, found with a single query
+
+    Only problem lines are returned: inactive products, lines exceeding the
+    stock available to the user (unreserved stock plus the user's own
+    hold), and lines whose price snapshot differs from the current price.
+    Lines without a snapshot are not checked for price changes.
+    """
+    available = (
+        Product.stock_quantity - Product.reserved_quantity
+        + func.coalesce(InventoryReservation.quantity, 0)
+    )
+    rows = db.session.query(
+        CartItem.id,
+        CartItem.product_id,
+        CartItem.quantity,
+        CartItem.unit_price.label('previous_price'),
+        Product.name,
+        Product.price,
+        Product.is_active,
+        available.label('available')
+    ).join(
+        Cart, CartItem.cart_id == Cart.id
+    ).join(
+        Product, CartItem.product_id == Product.id
+    ).outerjoin(
+        InventoryReservation, and_(
+            InventoryReservation.user_id == Cart.user_id,
+            InventoryReservation.product_id == CartItem.product_id
+        )
+    ).filter(
+        Cart.user_id == user_id,
+        or_(
+            Product.is_active == False,
+            available < CartItem.quantity,
+            and_(CartItem.unit_price.isnot(None), CartItem.unit_price != Product.price)
+        )
+    ).order_by(CartItem.id).all()
+    
+    issues = []
+    for row in rows:
+        base = {'item_id': row.id, 'product_id': row.product_id, 'product_name': row.name}
+        
+        if not row.is_active:
+            issues.append(dict(base, issue='Product is no longer available', action='remove', suggested_quantity=0))
+            continue
+        
+        if row.available < row.quantity:
+            suggested = max(row.available, 0)
+            issues.append(dict(
+                base,
+                issue=f'Only {suggested} items available',
+                action='reduce_quantity' if suggested else 'remove',
+                available_quantity=suggested,
+                suggested_quantity=suggested
+            ))
+        
+        if row.previous_price is not None and row.previous_price != row.price:
+            issues.append(dict(
+                base,
+                issue='Price has changed',
+                action='review_price',
+                previous_price=float(row.previous_price),
+                current_price=float(row.price)
+            ))
+    
+    return issues
+
+
+def suggested_fixes(issues):
+    """Batch operations (see /cart/items/batch) that resolve quantity issues"""
+    fixes = {}
+    for issue in issues:
+        if 'suggested_quantity' in issue:
+            quantity = issue['suggested_quantity']
+            fixes[issue['product_id']] = (
+                {'op': 'set', 'product_id': issue['product_id'], 'quantity': quantity}
+                if quantity else
+                {'op': 'remove', 'product_id': issue['product_id']}
+            )
+    return list(fixes.values())
+
+
+# ----------------- In-memory carts (CART_BACKEND=memory) -----------------
+
+def serialize_snapshot(snapshot):
+    """Format an in-memory cart like serialize_cart; item IDs are product IDs"""
+    rows = []
+    if snapshot.items:
+        rows = db.session.query(Product, main_image_subquery().label('main_image')).filter(
+            Product.id.in_(snapshot.items.keys())
+        ).all()
+    products = {product.id: (product, main_image) for product, main_image in rows}
+    
+    items = []
+    total_items = 0
+    total_price = Decimal('0')
+    for product_id, (quantity, added_at, _) in snapshot.items.items():
+        if product_id not in products:
+            continue
+        product, main_image = products[product_id]
+        line_total = product.price * quantity
+        total_items += quantity
+        total_price += line_total
+        items.append({
+            'id': product_id,
+            'product_id': product_id,
+            'product': {
+                'id': product.id,
+                'name': product.name,
+                'nameAr': product.nameAr,
+                'sku': product.sku,
+                'price': float(product.price),
+                'stock_quantity': product.stock_quantity,
+                'is_in_stock': product.is_in_stock(),
+                'main_image': main_image
+            },
+            'quantity': quantity,
+            'unit_price': float(product.price),
+            'total_price': float(line_total),
+            'added_at': added_at.isoformat()
+        })
+    
+    return {
+        'id': snapshot.cart_id,
+        'user_id': snapshot.user_id,
+        'total_items': total_items,
+        'total_price': float(total_price),
+        'items': items,
+        'created_at': snapshot.created_at.isoformat() if snapshot.created_at else None,
+        'updated_at': snapshot.updated_at.isoformat() if snapshot.updated_at else None
+    }
+
+
+def get_snapshot_totals(snapshot):
+    """Totals for an in-memory cart, pricing its lines with one IN query"""
+    quantities = snapshot.quantities()
+    total_price = Decimal('0')
+    if quantities:
+        prices = db.session.query(Product.id, Product.price).filter(Product.id.in_(quantities.keys())).all()
+        total_price = sum((price * quantities[product_id] for product_id, price in prices), Decimal('0'))
+    return {
+        'total_items': sum(quantities.values()),
+        'total_price': float(total_price),
+        'unique_items': len(quantities)
+    }
+
+
+# ----------------- Batch mutations -----------------
+
+BATCH_OPERATIONS = ('add', 'set', 'remove')
+MAX_BATCH_OPERATIONS = 200
+
+
+def parse_batch_operations(operations):
+    """Validate the shape of batch operations, returning (operations, errors)"""
+    if not isinstance(operations, list) or not operations:
+        return [], [{'error': 'operations must be a non-empty list'}]
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return [], [{'error': f'At most {MAX_BATCH_OPERATIONS} operations are allowed'}]
+    
+    parsed = []
+    errors = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            errors.append({'index': index, 'error': 'Operation must be an object'})
+            continue
+        
+        op = operation.get('op', 'add')
+        product_id = operation.get('product_id')
+        quantity = operation.get('quantity', 1 if op == 'add' else None)
+        
+        if op not in BATCH_OPERATIONS:
+            errors.append({'index': index, 'error': f'Unknown operation {op}'})
+        elif not isinstance(product_id, int) or isinstance(product_id, bool):
+            errors.append({'index': index, 'error': 'Product ID is required'})
+        elif op == 'add' and (not isinstance(quantity, int) or quantity <= 0):
+            errors.append({'index': index, 'error': 'Quantity must be greater than 0'})
+        elif op == 'set' and (not isinstance(quantity, int) or quantity < 0):
+            errors.append({'index': index, 'error': 'Quantity cannot be negative'})
+        else:
+            parsed.append((index, op, product_id, quantity))
+    
+    return parsed, errors
+
+
+def load_batch_products(operations):
+    """Active products touched by a batch, keyed by ID, in one IN query"""
+    product_ids = {product_id for _, _, product_id, _ in operations}
+    return {
+        product.id: product
+        for product in Product.query.filter(
+            Product.id.in_(product_ids), Product.is_active == True
+        ).all()
+    }
+
+
+def resolve_batch_quantities(operations, quantities, products):
+    """Apply operations to a {product_id: quantity} map in place, returning errors
+
+    Touched products end up with their final quantity (0 for removed lines).
+    """
+    errors = []
+    for index, op, product_id, quantity in operations:
+        if op != 'remove' and product_id not in products:
+            errors.append({'index': index, 'product_id': product_id, 'error': 'Product not found'})
+            continue
+        if op == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        elif op == 'set':
+            quantities[product_id] = quantity
+        else:
+            quantities[product_id] = 0
+    
+    touched = {product_id for _, _, product_id, _ in operations}
+    for product_id in touched:
+        quantity = quantities.get(product_id, 0)
+        product = products.get(product_id)
+        if quantity > 0 and product and product.stock_quantity < quantity:
+            errors.append({
+                'product_id': product_id,
+                'error': 'Insufficient stock',
+                'available_quantity': product.stock_quantity
+            })
+    
+    return errors
+
+
+def apply_batch_operations(user_id, operations):
+    """Apply add/set/remove operations atomically, returning (cart, errors)
+
+    Products are validated with one IN query and existing cart lines with
+    another; nothing is written unless every operation is valid. Writes and
+    stock holds take a fixed number of statements whatever the batch size.
+    """
+    products = load_batch_products(operations)
+    product_ids = {product_id for _, _, product_id, _ in operations}
+    
+    cart = Cart.query.filter_by(user_id=user_id).first()
+    existing = {}
+    if cart:
+        existing = {
+            item.product_id: item
+            for item in CartItem.query.filter(
+                CartItem.cart_id == cart.id, CartItem.product_id.in_(product_ids)
+            ).all()
+        }
+    
+    # Resolve the final quantity of every touched product
+    quantities = {product_id: item.quantity for product_id, item in existing.items()}
+    errors = resolve_batch_quantities(operations, quantities, products)
+    if errors:
+        return cart, errors
+    
+    if not cart:
+        cart = db.session.get(Cart, get_or_create_cart_id(user_id))
+    
+    # New lines go in one multi-row INSERT; the ORM would insert them one by one
+    added = []
+    for product_id, quantity in quantities.items():
+        item = existing.get(product_id)
+        if item and quantity == 0:
+            db.session.delete(item)
+        elif item:
+            item.quantity = quantity
+            item.unit_price = products[product_id].price
+        elif quantity > 0:
+            added.append({
+                'cart_id': cart.id,
+                'product_id': product_id,
+                'quantity': quantity,
+                'unit_price': products[product_id].price
+            })
+    if added:
+        db.session.execute(insert(CartItem), added)
+    
+    # Hold stock for the final quantities in bulk; the caller rolls back on errors
+    for product_id in sorted(inventory.hold_many(user_id, quantities)):
+        product = products[product_id]
+        errors.append({
+            'product_id': product_id,
+            'error': 'Insufficient stock',
+            'available_quantity': product.get_available_quantity()
+        })
+    if errors:
+        return cart, errors
+    
+    cart.updated_at = datetime.now(timezone.utc)
+    return cart, []
@@ -0,0 +1,320 @@
+"""
+Optional in-memory cart backend with write-behind persistence.
+
+With CART_BACKEND=memory, active carts are kept in process memory and cart
+mutations do not touch the database on the request path. Changed carts are
+marked dirty and a background thread per worker writes them to Cart and
+CartItem in batches of CART_STORE_BATCH_SIZE every
+CART_STORE_FLUSH_INTERVAL seconds. Carts are loaded from the database on
+first access, and clean carts idle for CART_STORE_IDLE_TTL seconds are
+evicted.
+
+The store lives in the worker process, so it needs a single worker process
+(or requests routed to the same worker per user). Checkout runs inside
+checkout(), which persists the user's cart before the order reads it and
+holds the user's cart updates until the order is done, so orders see a
+consistent snapshot and no concurrent change is lost or written back over
+the cleared cart. Memory carts place no inventory reservations (see
+app.inventory): adding checks stock_quantity and checkout takes the stock.
+
+In memory mode cart lines are addressed by product ID: the item IDs
+returned and accepted by the cart endpoints are product IDs. Lines keep the
+price seen when they were added, written as CartItem.unit_price like the
+database backend does, so cart validation can report price changes.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from app import db
+from app.models import Cart, CartItem
+from app.cart.services import get_or_create_cart_id
+
+logger = logging.getLogger(__name__)
+
+USER_LOCK_STRIPES = 64
+
+
+class CartUpdateError(Exception):
+    """A cart update was rejected; the cart is left unchanged"""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+
+class CartState:
+    """A user's cart as held in memory"""
+
+    def __init__(self, user_id, cart_id=None, items=None, created_at=None, updated_at=None):
+        self.user_id = user_id
+        self.cart_id = cart_id
+        self.items = items or {}  # product_id -> (quantity, added_at, unit_price)
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.version = 0
+        self.persisted_version = 0
+        self.last_access = time.monotonic()
+
+    @property
+    def dirty(self):
+        return self.version != self.persisted_version
+
+    @property
+    def total_items(self):
+        return sum(quantity for quantity, _, _ in self.items.values())
+
+    def quantities(self):
+        return {product_id: quantity for product_id, (quantity, _, _) in self.items.items()}
+
+    def copy(self):
+        state = CartState(self.user_id, self.cart_id, dict(self.items), self.created_at, self.updated_at)
+        state.version = self.version
+        state.persisted_version = self.persisted_version
+        return state
+
+
+class MemoryCartStore:
+    """Per-process cart store flushed to the database in the background"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.flush_interval = 5
+        self.batch_size = 100
+        self.idle_ttl = 1800
+        self._carts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Serialize each user's updates against checkout; striped to bound memory
+        self._user_locks = [threading.Lock() for _ in range(USER_LOCK_STRIPES)]
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('CART_BACKEND', 'database') == 'memory'
+        self.flush_interval = app.config.get('CART_STORE_FLUSH_INTERVAL', 5)
+        self.batch_size = app.config.get('CART_STORE_BATCH_SIZE', 100)
+        self.idle_ttl = app.config.get('CART_STORE_IDLE_TTL', 1800)
+        if self.enabled:
+            atexit.register(self._flush_at_exit)
+
+    # ----------------- Request path -----------------
+
+    def get(self, user_id):
+        """Return a snapshot of the user's cart"""
+        state = self._get_state(user_id)
+        with self._lock:
+            return state.copy()
+
+    def update(self, user_id, func, prices=None):
+        """Apply func to a copy of the cart's {product_id: quantity} map atomically
+
+        Lines set to zero are removed; lines in `prices` ({product_id: price})
+        take that price snapshot. If func raises, the cart is left unchanged.
+        Returns func's result and a snapshot of the updated cart.
+        """
+        prices = prices or {}
+        with self._user_lock(user_id):
+            while True:
+                state = self._get_state(user_id)
+                with self._lock:
+                    # The cart may have been evicted after it was looked up
+                    if self._carts.get(user_id) is not state:
+                        continue
+                    quantities = state.quantities()
+                    result = func(quantities)
+                    now = datetime.now(timezone.utc)
+                    items = {}
+                    for product_id, quantity in quantities.items():
+                        if quantity > 0:
+                            _, added_at, unit_price = state.items.get(product_id, (0, now, None))
+                            items[product_id] = (quantity, added_at, prices.get(product_id, unit_price))
+                    if items != state.items:
+                        state.items = items
+                        state.created_at = state.created_at or now
+                        state.updated_at = now
+                        state.version += 1
+                    snapshot = state.copy()
+                    break
+        if snapshot.dirty:
+            self._ensure_worker()
+        return result, snapshot
+
+    def add_item(self, user_id, product_id, quantity, available, unit_price):
+        """Add to a line at unit_price, rejecting totals above `available`; returns (quantity, snapshot)"""
+        def add(quantities):
+            new_quantity = quantities.get(product_id, 0) + quantity
+            if new_quantity > available:
+                raise CartUpdateError('Insufficient stock for total quantity')
+            quantities[product_id] = new_quantity
+            return new_quantity
+        return self.update(user_id, add, {product_id: unit_price})
+
+    def set_item(self, user_id, product_id, quantity):
+        """Set an existing line's quantity (0 removes it); returns a snapshot"""
+        def set_quantity(quantities):
+            if product_id not in quantities:
+                raise CartUpdateError('Cart item not found')
+            quantities[product_id] = quantity
+        return self.update(user_id, set_quantity)[1]
+
+    def clear(self, user_id):
+        return self.update(user_id, lambda quantities: quantities.clear())[1]
+
+    def reset(self, user_id):
+        """Drop the user's cart from memory so it is reloaded from the database"""
+        with self._lock:
+            self._carts.pop(user_id, None)
+
+    @contextmanager
+    def checkout(self, user_id):
+        """Persist the user's cart, then hold its updates until the block exits
+
+        The cart is dropped from memory on exit, so updates that waited are
+        applied to the cart as the order left it in the database.
+        """
+        with self._user_lock(user_id):
+            self.flush_user(user_id)
+            try:
+                yield
+            finally:
+                self.reset(user_id)
+
+    def _user_lock(self, user_id):
+        return self._user_locks[hash(user_id) % USER_LOCK_STRIPES]
+
+    def _get_state(self, user_id):
+        with self._lock:
+            state = self._carts.get(user_id)
+        if state is None:
+            loaded = self._load(user_id)
+            with self._lock:
+                state = self._carts.setdefault(user_id, loaded)
+        state.last_access = time.monotonic()
+        return state
+
+    def _load(self, user_id):
+        cart = db.session.query(Cart.id, Cart.created_at, Cart.updated_at).filter_by(user_id=user_id).first()
+        if not cart:
+            return CartState(user_id)
+        rows = db.session.query(
+            CartItem.product_id, CartItem.quantity, CartItem.added_at, CartItem.unit_price
+        ).filter_by(cart_id=cart.id).order_by(CartItem.id).all()
+        items = {row.product_id: (row.quantity, row.added_at, row.unit_price) for row in rows}
+        return CartState(user_id, cart.id, items, cart.created_at, cart.updated_at)
+
+    # ----------------- Write-behind persistence -----------------
+
+    def flush_user(self, user_id):
+        """Persist one user's cart now; raises if the write fails"""
+        self.flush(user_ids={user_id}, raise_errors=True)
+
+    def flush(self, user_ids=None, raise_errors=False):
+        """Write dirty carts to the database in batches; returns the number written"""
+        written = 0
+        with self._flush_lock:
+            with self._lock:
+                dirty = [
+                    state.copy() for user_id, state in self._carts.items()
+                    if state.dirty and (user_ids is None or user_id in user_ids)
+                ]
+            for start in range(0, len(dirty), self.batch_size):
+                batch = dirty[start:start + self.batch_size]
+                try:
+                    self._write(batch)
+                    written += len(batch)
+                except Exception:
+                    db.session.rollback()
+                    if raise_errors:
+                        raise
+                    logger.exception('Failed to persist %d carts, retrying next cycle', len(batch))
+            if user_ids is None:
+                self._evict_idle()
+        return written
+
+    def _write(self, snapshots):
+        user_ids = [snapshot.user_id for snapshot in snapshots]
+        cart_ids = dict(db.session.query(Cart.user_id, Cart.id).filter(Cart.user_id.in_(user_ids)).all())
+        for snapshot in snapshots:
+            if snapshot.user_id not in cart_ids:
+                cart_ids[snapshot.user_id] = get_or_create_cart_id(snapshot.user_id)
+
+        existing = {
+            (item.cart_id, item.product_id): item
+            for item in CartItem.query.filter(CartItem.cart_id.in_(cart_ids.values())).all()
+        }
+        for snapshot in snapshots:
+            cart_id = cart_ids[snapshot.user_id]
+            for product_id, (quantity, added_at, unit_price) in snapshot.items.items():
+                item = existing.pop((cart_id, product_id), None)
+                if item:
+                    item.quantity = quantity
+                    item.unit_price = unit_price
+                else:
+                    db.session.add(CartItem(
+                        cart_id=cart_id, product_id=product_id, quantity=quantity,
+                        unit_price=unit_price, added_at=added_at
+                    ))
+            Cart.query.filter_by(id=cart_id).update(
+                {'updated_at': snapshot.updated_at}, synchronize_session=False
+            )
+        # Lines left over were removed from the carts in memory
+        for item in existing.values():
+            db.session.delete(item)
+        db.session.commit()
+
+        with self._lock:
+            for snapshot in snapshots:
+                state = self._carts.get(snapshot.user_id)
+                if state is not None:
+                    state.cart_id = cart_ids[snapshot.user_id]
+                    state.persisted_version = max(state.persisted_version, snapshot.version)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            idle = [
+                user_id for user_id, state in self._carts.items()
+                if not state.dirty and state.last_access < cutoff
+            ]
+            for user_id in idle:
+                del self._carts[user_id]
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._flush_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='cart-store', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception('Failed to flush cart store')
+
+    def _flush_at_exit(self):
+        if self._pid != os.getpid():
+            return
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception:
+            logger.exception('Failed to flush cart store at exit')
+
+
+cart_store = MemoryCartStore()
@@ -2,7 +2,10 @@ from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime, timezone
 from app.categories import bp
-from app.models import Category, User, UserRole
+from sqlalchemy import func
+from app.models import Category, Product, User, UserRole
+from app.i18n import get_request_language, localize_query, localized_value
+from app.cache import cached_response
 from app import db
 import re
 
@@ -28,38 +31,98 @@ def generate_slug(text):
     slug = re.sub(r'[\s_-]+', '-', slug).lower()
     return slug
 
+def get_product_counts(category_ids):
+    """Count products per category with a single grouped query"""
+    if not category_ids:
+        return {}
+    rows = db.session.query(Product.category_id, func.count(Product.id)).filter(
+        Product.category_id.in_(category_ids)
+    ).group_by(Product.category_id).all()
+    return dict(rows)
+
+def category_text(category, lang):
+    """Name/description fields in one language, or both when lang is None"""
+    if lang:
+        return {
+            'name': category.localized_name,
+            'description': category.localized_description
+        }
+    return {
+        'name': category.name,
+        'nameAr': category.nameAr,
+        'description': category.description,
+        'descriptionAr': category.descriptionAr
+    }
+
+def load_active_categories(lang):
+    """Load all active categories in one query, children grouped by parent"""
+    categories = localize_query(Category.query, Category, lang).filter_by(
+        is_active=True
+    ).order_by(Category.sort_order, Category.name).all()
+    
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_id, []).append(category)
+    return categories, children
+
+def serialize_child(child, product_counts, lang):
+    return {
+        'id': child.id,
+        'slug': child.slug,
+        'product_count': product_counts.get(child.id, 0),
+        **category_text(child, lang)
+    }
+
+def serialize_category_detail(category, lang):
+    children = localize_query(Category.query, Category, lang).filter_by(
+        parent_id=category.id, is_active=True
+    ).order_by(Category.sort_order, Category.name).all()
+    product_counts = get_product_counts([category.id] + [child.id for child in children])
+    
+    parent = category.parent
+    return {
+        'id': category.id,
+        'slug': category.slug,
+        'image_url': category.image_url,
+        'sort_order': category.sort_order,
+        'parent_id': category.parent_id,
+        'parent': {
+            'id': parent.id,
+            'name': localized_value(parent, 'name', lang),
+            'slug': parent.slug,
+            **({} if lang else {'nameAr': parent.nameAr})
+        } if parent else None,
+        'children': [serialize_child(child, product_counts, lang) for child in children],
+        'product_count': product_counts.get(category.id, 0),
+        'created_at': category.created_at.isoformat(),
+        'updated_at': category.updated_at.isoformat(),
+        **category_text(category, lang)
+    }
+
 @bp.route('', methods=['GET'])
+@cached_response(catalog=True)
 def get_categories():
     """Get all active categories"""
-    categories = Category.query.filter_by(is_active=True).order_by(Category.sort_order, Category.name).all()
+    lang = get_request_language()
+    categories, children = load_active_categories(lang)
+    product_counts = get_product_counts([category.id for category in categories])
     
-    category_list = []
-    for category in categories:
-        category_data = {
+    category_list = [
+        {
             'id': category.id,
-            'name': category.name,
-            'nameAr': category.nameAr,
-            'description': category.description,
-            'descriptionAr': category.descriptionAr,
             'slug': category.slug,
             'image_url': category.image_url,
             'sort_order': category.sort_order,
             'parent_id': category.parent_id,
-            'product_count': len(category.products),
+            'product_count': product_counts.get(category.id, 0),
             'children': [
-                {
-                    'id': child.id,
-                    'name': child.name,
-                    'nameAr': child.nameAr,
-                    'description': child.description,
-                    'descriptionAr': child.descriptionAr,
-                    'slug': child.slug,
-                    'product_count': len(child.products)
-                }
-                for child in category.children if child.is_active
-            ]
+                serialize_child(child, product_counts, lang)
+                for child in children.get(category.id, [])
+            ],
+            **category_text(category, lang)
         }
-        category_list.append(category_data)
+        for category in categories
+    ]
     
     return jsonify({
         'message': 'Categories retrieved successfully',
@@ -69,90 +132,33 @@ def get_categories():
 @bp.route('/<int:category_id>', methods=['GET'])
 def get_category(category_id):
     """Get category by ID"""
-    category = Category.query.filter_by(id=category_id, is_active=True).first()
+    lang = get_request_language()
+    category = localize_query(Category.query, Category, lang).filter_by(
+        id=category_id, is_active=True
+    ).first()
     
     if not category:
         return jsonify({'error': 'Category not found'}), 404
     
-    category_data = {
-        'id': category.id,
-        'name': category.name,
-        'nameAr': category.nameAr,
-        'description': category.description,
-        'descriptionAr': category.descriptionAr,
-        'slug': category.slug,
-        'image_url': category.image_url,
-        'sort_order': category.sort_order,
-        'parent_id': category.parent_id,
-        'parent': {
-            'id': category.parent.id,
-            'name': category.parent.name,
-            'nameAr': category.parent.nameAr,
-            'slug': category.parent.slug
-        } if category.parent else None,
-        'children': [
-            {
-                'id': child.id,
-                'name': child.name,
-                'nameAr': child.nameAr,
-                'slug': child.slug,
-                'description': child.description,
-                'descriptionAr': child.descriptionAr,
-                'product_count': len(child.products)
-            }
-            for child in category.children if child.is_active
-        ],
-        'product_count': len(category.products),
-        'created_at': category.created_at.isoformat(),
-        'updated_at': category.updated_at.isoformat()
-    }
-    
     return jsonify({
         'message': 'Category retrieved successfully',
-        'data': category_data
+        'data': serialize_category_detail(category, lang)
     }), 200
 
 @bp.route('/slug/<slug>', methods=['GET'])
 def get_category_by_slug(slug):
     """Get category by slug"""
-    category = Category.query.filter_by(slug=slug, is_active=True).first()
+    lang = get_request_language()
+    category = localize_query(Category.query, Category, lang).filter_by(
+        slug=slug, is_active=True
+    ).first()
     
     if not category:
         return jsonify({'error': 'Category not found'}), 404
     
-    category_data = {
-        'id': category.id,
-        'name': category.name,
-        'nameAr': category.nameAr,
-        'description': category.description,
-        'descriptionAr': category.descriptionAr,
-        'slug': category.slug,
-        'image_url': category.image_url,
-        'sort_order': category.sort_order,
-        'parent_id': category.parent_id,
-        'parent': {
-            'id': category.parent.id,
-            'name': category.parent.name,
-            'slug': category.parent.slug
-        } if category.parent else None,
-        'children': [
-            {
-                'id': child.id,
-                'name': child.name,
-                'nameAr': child.nameAr,
-                'slug': child.slug,
-                'description': child.description,
-                'descriptionAr': child.descriptionAr,
-                'product_count': len(child.products)
-            }
-            for child in category.children if child.is_active
-        ],
-        'product_count': len(category.products)
-    }
-    
     return jsonify({
         'message': 'Category retrieved successfully',
-        'data': category_data
+        'data': serialize_category_detail(category, lang)
     }), 200
 
 @bp.route('', methods=['POST'])
@@ -359,30 +365,30 @@ def delete_category(category_id):
         return jsonify({'error': 'Failed to delete category', 'details': str(e)}), 500
 
 @bp.route('/tree', methods=['GET'])
+@cached_response(catalog=True)
 def get_category_tree():
     """Get hierarchical category tree"""
-    # Get root categories (no parent)
-    root_categories = Category.query.filter_by(parent_id=None, is_active=True).order_by(Category.sort_order, Category.name).all()
+    lang = get_request_language()
+    categories, children = load_active_categories(lang)
+    product_counts = get_product_counts([category.id for category in categories])
     
-    def build_tree(categories):
+    def build_tree(nodes):
         tree = []
-        for category in categories:
+        for category in nodes:
             category_data = {
                 'id': category.id,
-                'name': category.name,
-                'nameAr': category.nameAr,
                 'slug': category.slug,
-                'description': category.description,
-                'descriptionAr': category.descriptionAr,
                 'image_url': category.image_url,
                 'sort_order': category.sort_order,
-                'product_count': len(category.products),
-                'children': build_tree([child for child in category.children if child.is_active])
+                'product_count': product_counts.get(category.id, 0),
+                'children': build_tree(children.get(category.id, [])),
+                **category_text(category, lang)
             }
             tree.append(category_data)
         return tree
     
-    tree = build_tree(root_categories)
+    # Root categories have no parent
+    tree = build_tree(children.get(None, []))
     
     return jsonify({
         'message': 'Category tree retrieved successfully',
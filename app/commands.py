@@ -0,0 +1,112 @@
+"""
+Maintenance commands for the Flask CLI, e.g. `flask inventory release-expired`,
+`flask jobs worker`, `flask schema upgrade` or `flask purge`.
+"""
+
+import time
+import click
+from flask.cli import AppGroup
+from app import inventory, jobs, purge, schema
+from app.orders.services import backfill_item_counts
+
+inventory_cli = AppGroup('inventory', help='Inventory reservation maintenance.')
+jobs_cli = AppGroup('jobs', help='Background job queue.')
+orders_cli = AppGroup('orders', help='Order maintenance.')
+schema_cli = AppGroup('schema', help='Database schema maintenance.')
+
+
+@inventory_cli.command('release-expired')
+@click.option('--batch-size', type=int, default=None, help='Holds deleted per transaction.')
+def release_expired_command(batch_size):
+    """Release expired inventory reservations"""
+    start = time.perf_counter()
+    released = inventory.release_expired(batch_size=batch_size, commit=True)
+    click.echo(f'Released {released} expired reservations in {time.perf_counter() - start:.2f}s')
+
+
+@inventory_cli.command('reconcile')
+def reconcile_command():
+    """Recompute reserved quantities from reservation rows"""
+    inventory.reconcile_reserved()
+    click.echo('Reserved quantities reconciled')
+
+
+@jobs_cli.command('worker')
+@click.option('--processes', type=int, default=None, help='Worker processes to run.')
+@click.option('--batch-size', type=int, default=None, help='Jobs claimed per poll.')
+@click.option('--poll-interval', type=float, default=None, help='Seconds to wait when the queue is empty.')
+def jobs_worker_command(processes, batch_size, poll_interval):
+    """Run background job workers until interrupted"""
+    # Imported for its @task decorators, which register the handlers
+    from app import tasks  # noqa: F401
+    if processes == 1:
+        worker = jobs.Worker(batch_size, poll_interval)
+        worker.run()
+    else:
+        jobs.run_pool(processes, batch_size, poll_interval)
+
+
+@jobs_cli.command('stats')
+def jobs_stats_command():
+    """Show job counts per task and status"""
+    stats = jobs.queue_stats()
+    click.echo(' '.join(f'{status}={count}' for status, count in stats['totals'].items()))
+    click.echo(f"Lag: {stats['lag_seconds']:.1f}s, stalled: {stats['stalled']}")
+    for task_name, counts in sorted(stats['tasks'].items()):
+        click.echo(f"  {task_name}: " + ' '.join(f'{status}={count}' for status, count in counts.items()))
+
+
+@jobs_cli.command('retry')
+@click.option('--task', 'task_name', default=None, help='Only retry jobs of this task.')
+def jobs_retry_command(task_name):
+    """Queue failed jobs again"""
+    click.echo(f'Queued {jobs.retry_failed(task_name)} failed jobs')
+
+
+@orders_cli.command('backfill-item-counts')
+def backfill_item_counts_command():
+    """Recompute Order.item_count from order items"""
+    updated = backfill_item_counts()
+    click.echo(f'Item counts set on {updated} orders')
+
+
+@schema_cli.command('upgrade')
+def schema_upgrade_command():
+    """Add tables, columns, indexes and constraints missing from an existing database"""
+    changes = schema.upgrade()
+    for change in changes:
+        click.echo(change)
+    click.echo(f'{len(changes)} schema changes applied' if changes else 'Schema is up to date')
+
+
+def report(name, count, seconds):
+    rate = count / seconds if seconds else 0
+    click.echo(f'{name}: {count} deleted in {seconds:.2f}s ({rate:.0f}/s)')
+
+
+@click.command('purge')
+@click.option('--cart-age-days', type=int, default=None, help='Delete carts idle for longer than this.')
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+@click.option('--pause', type=float, default=0, help='Seconds to sleep between batches.')
+def purge_command(cart_age_days, batch_size, pause):
+    """Purge abandoned carts, expired reservations, idempotency keys and completed jobs"""
+    stats = purge.purge_abandoned_carts(cart_age_days, batch_size, pause)
+    report('Abandoned carts', stats['carts'], stats['seconds'])
+    click.echo(f"  {stats['items']} cart items in {stats['batches']} batches")
+
+    stats = purge.purge_expired_reservations(batch_size)
+    report('Expired reservations', stats['reservations'], stats['seconds'])
+
+    stats = purge.purge_expired_idempotency_keys(batch_size)
+    report('Expired idempotency keys', stats['idempotency_keys'], stats['seconds'])
+
+    stats = purge.purge_completed_jobs(batch_size)
+    report('Completed jobs', stats['jobs'], stats['seconds'])
+
+
+def register_commands(app):
+    app.cli.add_command(inventory_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(orders_cli)
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(purge_command)
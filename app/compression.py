@@ -0,0 +1,87 @@
+"""
+Response compression for large JSON payloads.
+
+Responses are compressed with brotli when it is installed and accepted by
+the client, otherwise with gzip. Responses served by app.cache.cached_response
+carry their cache entry, which stores each compressed variant next to the
+raw body so hot responses are compressed once rather than per request.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+from flask import request
+
+DEFAULT_MIMETYPES = ['application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript']
+
+
+def compress_body(data, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class Compress:
+    """Flask extension compressing responses in after_request"""
+
+    def __init__(self, app=None):
+        self.min_size = 1024
+        self.mimetypes = set(DEFAULT_MIMETYPES)
+        self.levels = {'gzip': 6, 'br': 4}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES))
+        self.levels = {
+            'gzip': app.config.get('COMPRESS_GZIP_LEVEL', 6),
+            'br': app.config.get('COMPRESS_BR_LEVEL', 4)
+        }
+        if app.config.get('COMPRESS_ENABLED', True):
+            app.after_request(self.after_request)
+
+    def choose_encoding(self):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def compress(self, data, encoding):
+        return compress_body(data, encoding, self.levels[encoding])
+
+    def after_request(self, response):
+        if response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if (response.status_code < 200 or response.status_code >= 300
+                or response.status_code == 204
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+
+        entry = getattr(response, 'cache_entry', None)
+        if entry is not None:
+            if len(entry.body) < self.min_size:
+                return response
+            body = entry.get_encoded(encoding, self.compress)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            body = self.compress(data, encoding)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,143 @@
+"""
+Coupon lookup and redemption at checkout.
+
+Coupons are looked up by normalized (upper-case) code through coupon_cache,
+which holds detached copies of the Coupon rows, and unknown codes as None,
+so neither a hot promo code nor a mistyped one hits the database on every
+cart view. Coupon edits evict their codes once the transaction commits;
+entries also expire after COUPON_CACHE_TTL seconds so other workers catch
+up.
+
+The cached copy prices the discount, but its used_count may be stale, so
+checkout redeems the coupon with a single conditional UPDATE,
+
+    UPDATE coupon SET used_count = used_count + 1
+    WHERE id = :id AND is_active AND (usage_limit IS NULL OR used_count < usage_limit)
+      AND (expires_at IS NULL OR expires_at > now)
+
+as the last statement before the order commits, so concurrent orders can
+never take a coupon past its usage limit and the coupon row is locked
+only briefly.
+"""
+
+from datetime import datetime, timezone
+from sqlalchemy import event, inspect, or_, update
+from sqlalchemy.orm import Session
+from app import db
+from app.cache import TTLCache
+from app.models import Coupon
+from app.pricing import PricingError, money
+
+COPIED_FIELDS = (
+    'id', 'code', 'description', 'type', 'value', 'minimum_amount', 'maximum_discount',
+    'usage_limit', 'used_count', 'is_active', 'expires_at'
+)
+
+coupon_cache = TTLCache(maxsize=1000, ttl=300)
+
+_listeners_registered = False
+
+
+class CouponError(PricingError):
+    """The coupon cannot be applied; the message is shown to the customer"""
+
+
+def normalize_code(code):
+    """Upper-case code, or None for a blank or non-string code"""
+    if not isinstance(code, str):
+        return None
+    return code.strip().upper() or None
+
+
+def detached_copy(coupon):
+    """A transient Coupon safe to share between requests"""
+    values = {field: getattr(coupon, field) for field in COPIED_FIELDS}
+    values['minimum_amount'] = values['minimum_amount'] or 0
+    if values['expires_at'] is not None and values['expires_at'].tzinfo is None:
+        values['expires_at'] = values['expires_at'].replace(tzinfo=timezone.utc)
+    return Coupon(**values)
+
+
+def get_coupon(code):
+    """Return a detached copy of the coupon with this code, or None"""
+    code = normalize_code(code)
+    if not code:
+        return None
+    if code in coupon_cache:
+        return coupon_cache.get(code)
+    coupon = Coupon.query.filter_by(code=code).first()
+    copy = detached_copy(coupon) if coupon else None
+    coupon_cache.set(code, copy)
+    return copy
+
+
+def resolve(code, subtotal):
+    """Check a coupon against an order subtotal; returns (coupon, discount)"""
+    coupon = get_coupon(code)
+    if coupon is None:
+        raise CouponError('Invalid coupon code')
+    valid, message = coupon.is_valid(subtotal)
+    if not valid:
+        raise CouponError(message)
+    return coupon, money(min(coupon.calculate_discount(subtotal), subtotal))
+
+
+def redeem(coupon):
+    """Count one use in the current transaction; raises CouponError when none are left"""
+    now = datetime.now(timezone.utc)
+    result = db.session.execute(
+        update(Coupon).where(
+            Coupon.id == coupon.id,
+            Coupon.is_active == True,
+            or_(Coupon.usage_limit.is_(None), db.func.coalesce(Coupon.used_count, 0) < Coupon.usage_limit),
+            or_(Coupon.expires_at.is_(None), Coupon.expires_at > now)
+        ).values(
+            used_count=db.func.coalesce(Coupon.used_count, 0) + 1,
+            # Redemptions are not coupon edits
+            updated_at=Coupon.updated_at
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise CouponError('Coupon usage limit reached')
+
+
+def release(code):
+    """Give back one use of a coupon, e.g. for a cancelled order"""
+    db.session.execute(
+        update(Coupon).where(Coupon.code == code, Coupon.used_count > 0).values(
+            used_count=Coupon.used_count - 1,
+            updated_at=Coupon.updated_at
+        ).execution_options(synchronize_session=False)
+    )
+
+
+def _after_flush(session, flush_context):
+    codes = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Coupon):
+            # Evict the old code too when it was renamed
+            history = inspect(obj).attrs.code.history
+            codes.update(normalize_code(code) for code in (*history.added, *history.deleted, obj.code) if code)
+    if codes:
+        session.info.setdefault('coupons_changed', set()).update(codes)
+
+
+def _after_commit(session):
+    for code in session.info.pop('coupons_changed', ()):
+        coupon_cache.delete(code)
+
+
+def _after_rollback(session):
+    session.info.pop('coupons_changed', None)
+
+
+def init_app(app):
+    global _listeners_registered
+    coupon_cache.maxsize = app.config.get('COUPON_CACHE_MAX_ENTRIES', 1000)
+    coupon_cache.ttl = app.config.get('COUPON_CACHE_TTL', 300)
+    if _listeners_registered:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _listeners_registered = True
@@ -0,0 +1,66 @@
+"""
+Language projection for catalog responses.
+
+Catalog rows store English and Arabic copies of their text columns. When a
+client asks for a single language (?lang=en|ar, or ?lang=auto to negotiate
+via Accept-Language) only that language is selected from the database and
+serialized as plain `name`/`description`/`short_description` fields.
+Without `lang` both languages are returned as before.
+"""
+
+from flask import request
+from sqlalchemy import func
+from sqlalchemy.orm import defer, with_expression
+
+SUPPORTED_LANGUAGES = ('en', 'ar')
+
+# Localized field -> (English column, Arabic column)
+LOCALIZED_FIELDS = {
+    'name': ('name', 'nameAr'),
+    'description': ('description', 'descriptionAr'),
+    'short_description': ('short_description', 'short_descriptionAr'),
+}
+
+
+def get_request_language():
+    """Return 'en' or 'ar' when the client asked for one language, else None"""
+    lang = request.args.get('lang', '').strip().lower()
+    if lang == 'auto':
+        return request.accept_languages.best_match(SUPPORTED_LANGUAGES)
+    return lang if lang in SUPPORTED_LANGUAGES else None
+
+
+def localized_column(model, field, lang):
+    """SQL expression for a field in the given language, falling back to English"""
+    english_name, arabic_name = LOCALIZED_FIELDS[field]
+    english = getattr(model, english_name)
+    if lang == 'ar':
+        return func.coalesce(func.nullif(getattr(model, arabic_name), ''), english)
+    return english
+
+
+def localize_query(query, model, lang):
+    """Select only the requested language into the model's localized_* attributes"""
+    if not lang:
+        return query
+
+    options = []
+    for field, (english_name, arabic_name) in LOCALIZED_FIELDS.items():
+        target = getattr(model, f'localized_{field}', None)
+        if target is None:
+            continue
+        options.extend([
+            defer(getattr(model, english_name)),
+            defer(getattr(model, arabic_name)),
+            with_expression(target, localized_column(model, field, lang))
+        ])
+    # Rows already in the session would otherwise keep their previous projection
+    return query.options(*options).execution_options(populate_existing=True)
+
+
+def localized_value(obj, field, lang):
+    """Pick a language from an already loaded row (e.g. a related category)"""
+    english_name, arabic_name = LOCALIZED_FIELDS[field]
+    if lang == 'ar':
+        return getattr(obj, arabic_name) or getattr(obj, english_name)
+    return getattr(obj, english_name)
@@ -0,0 +1,171 @@
+"""
+Idempotency-Key support for endpoints with side effects.
+
+A client retrying POST /orders or a payment sends the same Idempotency-Key
+header with every attempt. The first request claims the key by inserting
+an IdempotencyKey row (unique per endpoint and user) and runs normally; its
+response is stored on the row for IDEMPOTENCY_KEY_TTL seconds. Retries
+find the row through the unique index and replay the stored response
+without running the endpoint again.
+
+A duplicate arriving while the first request is still running waits up to
+IDEMPOTENCY_WAIT_TIMEOUT seconds for it to finish, then replays its
+response (or gets 409). Reusing a key with a different request body is
+rejected with 422. Server errors (5xx) are not stored, so the client can
+retry them. A key left 'processing' by a crashed worker can be taken over
+after IDEMPOTENCY_LOCK_TIMEOUT seconds.
+"""
+
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.1
+
+
+def request_fingerprint():
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def replay(record):
+    response = current_app.response_class(
+        record.response_body, status=record.response_status, mimetype=record.response_mimetype
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def claim(scope, key, fingerprint):
+    """Claim a key for this request
+
+    Returns (record_id, None) when the caller should run the endpoint, or
+    (None, response) when the response is already decided.
+    """
+    config = current_app.config
+    ttl = timedelta(seconds=config.get('IDEMPOTENCY_KEY_TTL', 86400))
+    lock_timeout = timedelta(seconds=config.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    deadline = time.monotonic() + config.get('IDEMPOTENCY_WAIT_TIMEOUT', 10)
+
+    while True:
+        now = datetime.now(timezone.utc)
+        record = IdempotencyKey(
+            key=key, scope=scope, fingerprint=fingerprint, locked_at=now, expires_at=now + ttl
+        )
+        try:
+            db.session.add(record)
+            db.session.commit()
+            return record.id, None
+        except IntegrityError:
+            db.session.rollback()
+
+        # An expired key is free to be claimed again
+        expired = IdempotencyKey.query.filter(
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at <= now
+        ).delete(synchronize_session=False)
+        if expired:
+            db.session.commit()
+            continue
+
+        existing = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+        if existing is None:
+            continue
+        if existing.fingerprint != fingerprint:
+            db.session.rollback()
+            return None, (jsonify({'error': f'{HEADER} was already used for a different request'}), 422)
+        if existing.status == 'completed':
+            response = replay(existing)
+            db.session.rollback()
+            return None, response
+
+        # Take over a key abandoned by a crashed request
+        taken_over = IdempotencyKey.query.filter(
+            IdempotencyKey.id == existing.id,
+            IdempotencyKey.status == 'processing',
+            IdempotencyKey.locked_at <= now - lock_timeout
+        ).update({'locked_at': now}, synchronize_session=False)
+        db.session.commit()
+        if taken_over:
+            return existing.id, None
+
+        if time.monotonic() >= deadline:
+            return None, (jsonify({'error': f'A request with this {HEADER} is still in progress'}), 409)
+        time.sleep(POLL_INTERVAL)
+
+
+def complete(record_id, response):
+    """Store the response for replay, or free the key after a server error"""
+    query = IdempotencyKey.query.filter_by(id=record_id)
+    if response.status_code >= 500:
+        query.delete(synchronize_session=False)
+    else:
+        query.update({
+            'status': 'completed',
+            'response_status': response.status_code,
+            'response_body': response.get_data(as_text=True),
+            'response_mimetype': response.mimetype,
+            'expires_at': datetime.now(timezone.utc) + timedelta(
+                seconds=current_app.config.get('IDEMPOTENCY_KEY_TTL', 86400)
+            )
+        }, synchronize_session=False)
+    db.session.commit()
+
+
+def idempotent(f):
+    """Honour the Idempotency-Key header; apply below @jwt_required()"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        verify_jwt_in_request(optional=True)
+        scope = f'{f.__name__}:{get_jwt_identity() or "guest"}'
+        record_id, response = claim(scope, key, request_fingerprint())
+        if response is not None:
+            return response
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            IdempotencyKey.query.filter_by(id=record_id).delete(synchronize_session=False)
+            db.session.commit()
+            raise
+        complete(record_id, response)
+        return response
+    return wrapper
+
+
+def purge_expired_keys(batch_size=500):
+    """Delete expired keys in batches along the expires_at index; returns the count"""
+    deleted = 0
+    while True:
+        ids = [
+            row.id for row in db.session.query(IdempotencyKey.id).filter(
+                IdempotencyKey.expires_at <= datetime.now(timezone.utc)
+            ).order_by(IdempotencyKey.expires_at).limit(batch_size).all()
+        ]
+        if not ids:
+            db.session.rollback()
+            break
+        deleted += IdempotencyKey.query.filter(
+            IdempotencyKey.id.in_(ids)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        if len(ids) < batch_size:
+            break
+    return deleted
@@ -0,0 +1,352 @@
+"""
+Time-limited inventory reservations.
+
+Adding a product to the cart places a hold on its stock for
+INVENTORY_RESERVATION_TTL seconds, refreshed whenever the cart line
+changes, so items sitting in active carts are not sold to someone else at
+checkout. Each product keeps a `reserved_quantity` counter next to
+`stock_quantity`, changed in the same conditional UPDATE that checks
+availability:
+
+    available = stock_quantity - reserved_quantity
+
+so contended products never need a SUM over reservation rows.
+
+Expired holds keep counting until release_expired() deletes them in
+batches along the expires_at index (`flask inventory release-expired`,
+run from cron every minute or so). A hold that fails for lack of stock
+first releases the product's expired holds and retries once.
+
+Cart endpoints place holds with hold_many(), which sets the holds for a
+whole batch of products in a fixed number of statements.
+
+Holds are placed by the database cart backend only. With CART_BACKEND=memory
+carts hold no stock: cart writes never reach the database on the request
+path, so stock is checked against stock_quantity when adding and taken at
+checkout, where a shortfall fails the order.
+
+Checkout takes stock with decrement_stock(): a single conditional UPDATE
+over all of the order's products that only changes rows whose unreserved
+stock covers their quantity, so concurrent orders cannot oversell and no
+product row is read and locked ahead of the write.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import case, delete, insert, update
+from app import db
+from app.models import InventoryReservation, Product
+from app.products.availability import mark_stock_changed, stock_cache
+
+
+class InsufficientStock(Exception):
+    """Stock ran out for a product while taking it; roll back the order"""
+
+    def __init__(self, product_id):
+        super().__init__(f'Insufficient stock for product {product_id}')
+        self.product_id = product_id
+
+
+def reservations_enabled():
+    return current_app.config.get('INVENTORY_RESERVATIONS_ENABLED', True)
+
+
+def reservation_expiry():
+    ttl = current_app.config.get('INVENTORY_RESERVATION_TTL', 900)
+    return datetime.now(timezone.utc) + timedelta(seconds=ttl)
+
+
+def unreserve(quantities):
+    """Take {product_id: quantity} off the reserved counters in one UPDATE"""
+    if not quantities:
+        return
+    db.session.execute(
+        update(Product).where(Product.id.in_(quantities.keys())).values(
+            reserved_quantity=Product.reserved_quantity - case(quantities, value=Product.id),
+            # Holds are not product edits
+            updated_at=Product.updated_at
+        ).execution_options(synchronize_session=False)
+    )
+    mark_stock_changed(quantities.keys())
+
+
+def reserve(quantities):
+    """Add {product_id: quantity} to the reserved counters; returns the IDs short of stock
+
+    Like decrement_stock(), one conditional UPDATE only changes products
+    whose unreserved stock covers their quantity; products left out of the
+    RETURNING ids are short and unchanged. Databases without
+    UPDATE ... RETURNING get one conditional UPDATE per product.
+    """
+    if not quantities:
+        return set()
+    product_ids = sorted(quantities)
+
+    if db.session.get_bind().dialect.update_returning:
+        quantity = case(quantities, value=Product.id)
+        rows = db.session.execute(
+            update(Product).where(
+                Product.id.in_(product_ids),
+                Product.stock_quantity - Product.reserved_quantity >= quantity
+            ).values(
+                reserved_quantity=Product.reserved_quantity + quantity,
+                updated_at=Product.updated_at
+            ).returning(Product.id),
+            execution_options={'synchronize_session': False}
+        )
+        reserved = {row.id for row in rows}
+    else:
+        reserved = set()
+        for product_id in product_ids:
+            result = db.session.execute(
+                update(Product).where(
+                    Product.id == product_id,
+                    Product.stock_quantity - Product.reserved_quantity >= quantities[product_id]
+                ).values(
+                    reserved_quantity=Product.reserved_quantity + quantities[product_id],
+                    updated_at=Product.updated_at
+                ).execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                reserved.add(product_id)
+    mark_stock_changed(reserved)
+    return set(product_ids) - reserved
+
+
+def hold_many(user_id, quantities):
+    """Set the user's holds to {product_id: quantity}; returns the IDs short of stock
+
+    A quantity of 0 drops the hold. The cost does not grow with the number
+    of products: one locking SELECT of the user's holds, one UPDATE each
+    for the freed and the newly held counters, and at most one DELETE,
+    UPDATE and INSERT of hold rows. Products short of stock first have
+    their expired holds released and are retried once.
+
+    Runs in the caller's transaction; roll back when the result is not empty.
+    """
+    if not reservations_enabled() or not quantities:
+        return set()
+    quantities = {product_id: max(quantity, 0) for product_id, quantity in quantities.items()}
+
+    rows = db.session.query(
+        InventoryReservation.id, InventoryReservation.product_id, InventoryReservation.quantity
+    ).filter(
+        InventoryReservation.user_id == user_id,
+        InventoryReservation.product_id.in_(quantities.keys())
+    ).with_for_update().all()
+    held = {row.product_id: row for row in rows}
+
+    freed = {}
+    wanted = {}
+    for product_id, quantity in quantities.items():
+        delta = quantity - (held[product_id].quantity if product_id in held else 0)
+        if delta < 0:
+            freed[product_id] = -delta
+        elif delta > 0:
+            wanted[product_id] = delta
+    unreserve(freed)
+
+    short = reserve(wanted)
+    if short:
+        # Expired holds may be all that stands in the way (possibly our own)
+        release_expired(product_ids=short)
+        still_held = {
+            row.product_id for row in db.session.query(InventoryReservation.product_id).filter(
+                InventoryReservation.user_id == user_id,
+                InventoryReservation.product_id.in_(short)
+            )
+        }
+        for product_id in short:
+            if product_id in held and product_id not in still_held:
+                del held[product_id]
+                wanted[product_id] = quantities[product_id]
+        short = reserve({product_id: wanted[product_id] for product_id in short})
+        if short:
+            return short
+
+    expires_at = reservation_expiry()
+    dropped = [held[product_id].id for product_id, quantity in quantities.items() if product_id in held and not quantity]
+    kept = {held[product_id].id: quantity for product_id, quantity in quantities.items() if product_id in held and quantity}
+    added = [
+        {'user_id': user_id, 'product_id': product_id, 'quantity': quantity, 'expires_at': expires_at}
+        for product_id, quantity in quantities.items() if product_id not in held and quantity
+    ]
+    if dropped:
+        db.session.execute(
+            delete(InventoryReservation).where(InventoryReservation.id.in_(dropped)),
+            execution_options={'synchronize_session': False}
+        )
+    if kept:
+        db.session.execute(
+            update(InventoryReservation).where(InventoryReservation.id.in_(kept.keys())).values(
+                quantity=case(kept, value=InventoryReservation.id),
+                expires_at=expires_at
+            ),
+            execution_options={'synchronize_session': False}
+        )
+    if added:
+        db.session.execute(insert(InventoryReservation), added)
+    return set()
+
+
+def hold(user_id, product_id, quantity):
+    """Set the user's hold on a product to `quantity`; returns False if stock is short
+
+    Runs in the caller's transaction; roll back when it returns False.
+    """
+    return not hold_many(user_id, {product_id: quantity})
+
+
+def release(user_id, product_ids=None):
+    """Delete the user's holds (optionally only for some products) and free their stock
+
+    Costs three statements however many holds there are: the locking
+    SELECT, one UPDATE of the reserved counters and one DELETE.
+    """
+    query = InventoryReservation.query.filter_by(user_id=user_id)
+    if product_ids is not None:
+        query = query.filter(InventoryReservation.product_id.in_(product_ids))
+    reservations = query.with_for_update().all()
+    if not reservations:
+        return 0
+
+    unreserve({reservation.product_id: reservation.quantity for reservation in reservations})
+    InventoryReservation.query.filter(
+        InventoryReservation.id.in_([reservation.id for reservation in reservations])
+    ).delete(synchronize_session='fetch')
+    return len(reservations)
+
+
+def decrement_stock(quantities):
+    """Take {product_id: quantity} from stock, raising InsufficientStock on a shortfall
+
+    All products are updated with one statement,
+        UPDATE product SET stock_quantity = stock_quantity - CASE id ... END
+        WHERE id IN (...) AND stock_quantity - reserved_quantity >= CASE id ... END
+    and a product left out of the RETURNING ids is short; roll back the
+    transaction then. Release the buyer's own holds first. Databases
+    without UPDATE ... RETURNING get one conditional UPDATE per product,
+    in ID order.
+    """
+    if not quantities:
+        return
+    product_ids = sorted(quantities)
+
+    if db.session.get_bind().dialect.update_returning:
+        quantity = case(quantities, value=Product.id)
+        rows = db.session.execute(
+            update(Product).where(
+                Product.id.in_(product_ids),
+                Product.stock_quantity - Product.reserved_quantity >= quantity
+            ).values(
+                stock_quantity=Product.stock_quantity - quantity
+            ).returning(Product.id),
+            execution_options={'synchronize_session': False}
+        )
+        taken = {row.id for row in rows}
+        short = [product_id for product_id in product_ids if product_id not in taken]
+        if short:
+            raise InsufficientStock(short[0])
+    else:
+        for product_id in product_ids:
+            result = db.session.execute(
+                update(Product).where(
+                    Product.id == product_id,
+                    Product.stock_quantity - Product.reserved_quantity >= quantities[product_id]
+                ).values(
+                    stock_quantity=Product.stock_quantity - quantities[product_id]
+                ).execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                raise InsufficientStock(product_id)
+    mark_stock_changed(product_ids, listed=True)
+
+
+def restock(quantities):
+    """Return {product_id: quantity} to stock in one UPDATE, e.g. for a cancelled order"""
+    if not quantities:
+        return
+    db.session.execute(
+        update(Product).where(Product.id.in_(quantities.keys())).values(
+            stock_quantity=Product.stock_quantity + case(quantities, value=Product.id)
+        ).execution_options(synchronize_session=False)
+    )
+    mark_stock_changed(quantities.keys(), listed=True)
+
+
+def get_user_holds(user_id, product_ids):
+    """The user's held quantity per product, in one query"""
+    rows = db.session.query(
+        InventoryReservation.product_id, InventoryReservation.quantity
+    ).filter(
+        InventoryReservation.user_id == user_id,
+        InventoryReservation.product_id.in_(product_ids)
+    ).all()
+    return dict(rows)
+
+
+def available_for_user(product, holds):
+    """Stock the user can buy: unreserved stock plus the user's own hold"""
+    return product.get_available_quantity() + holds.get(product.id, 0)
+
+
+def release_expired(batch_size=None, product_ids=None, commit=False):
+    """Delete expired holds in batches of batch_size, freeing their stock
+
+    Each batch costs one SELECT, one DELETE and one UPDATE of the reserved
+    counters, grouped by product. With commit each batch is its own
+    transaction so locks stay short; the request path calls it without
+    commit for the products it could not hold.
+    Returns the number of holds released.
+    """
+    batch_size = batch_size or current_app.config.get('INVENTORY_RELEASE_BATCH_SIZE', 500)
+    now = datetime.now(timezone.utc)
+    released = 0
+
+    while True:
+        query = db.session.query(
+            InventoryReservation.id, InventoryReservation.product_id, InventoryReservation.quantity
+        ).filter(InventoryReservation.expires_at <= now)
+        if product_ids is not None:
+            query = query.filter(InventoryReservation.product_id.in_(product_ids))
+        query = query.order_by(InventoryReservation.expires_at).limit(batch_size)
+        if db.session.get_bind().dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        rows = query.all()
+        if not rows:
+            break
+
+        freed = defaultdict(int)
+        for row in rows:
+            freed[row.product_id] += row.quantity
+        InventoryReservation.query.filter(
+            InventoryReservation.id.in_([row.id for row in rows])
+        ).delete(synchronize_session='fetch')
+        unreserve(freed)
+
+        if commit:
+            db.session.commit()
+        released += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return released
+
+
+def reconcile_reserved():
+    """Recompute every product's reserved counter from the reservation rows"""
+    held = db.session.query(
+        InventoryReservation.product_id,
+        db.func.sum(InventoryReservation.quantity).label('quantity')
+    ).group_by(InventoryReservation.product_id).subquery()
+    db.session.execute(
+        update(Product).values(
+            reserved_quantity=db.func.coalesce(
+                db.select(held.c.quantity).where(held.c.product_id == Product.id).scalar_subquery(), 0
+            ),
+            updated_at=Product.updated_at
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    stock_cache.clear()
@@ -0,0 +1,377 @@
+"""
+Durable background jobs stored in the database.
+
+Request handlers call enqueue() or enqueue_many() to add Job rows in their
+own transaction, so a job exists exactly when the order or payment that
+caused it was committed, and the request returns without waiting for email
+servers or webhook receivers. `flask jobs worker` runs a pool of worker processes
+that claim due jobs in batches and run the registered task for each.
+
+A claim is a single UPDATE that marks up to JOB_BATCH_SIZE due jobs as
+running under a fresh lock token:
+
+    UPDATE job SET status = 'running', lock_token = :token, ...
+    WHERE id IN (SELECT id FROM job WHERE <due> ORDER BY run_at LIMIT :n)
+
+On PostgreSQL and MySQL the ids are first selected FOR UPDATE SKIP LOCKED,
+so concurrent workers never wait on each other. SQLite has no row locks;
+there the single UPDATE runs under the database write lock, which gives
+the same guarantee that a job is claimed by one worker only.
+
+A claimed job is invisible to other workers for JOB_VISIBILITY_TIMEOUT
+seconds. If its worker dies, the job becomes due again after that and is
+retried, so tasks must be idempotent and finish well within the timeout.
+A failing task is retried with exponential backoff (JOB_RETRY_BACKOFF
+doubling per attempt, capped at JOB_RETRY_BACKOFF_MAX, with jitter) up to
+its max_attempts, then left as 'failed' for `flask jobs retry`.
+"""
+
+import logging
+import os
+import random
+import signal
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import and_, insert, or_, update
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a task whose job can never succeed; it fails without retries"""
+
+
+def task(name):
+    """Register a function as the task `name`; it is called with the job payload as kwargs"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(task_name, payload=None, delay=0, max_attempts=None):
+    """Add a job to the caller's transaction; it runs once that commits"""
+    job = Job(
+        task=task_name,
+        payload=payload or {},
+        max_attempts=max_attempts or current_app.config.get('JOB_MAX_ATTEMPTS', 5),
+        run_at=datetime.now(timezone.utc) + timedelta(seconds=delay)
+    )
+    db.session.add(job)
+    return job
+
+
+def enqueue_many(jobs, delay=0):
+    """Add (task_name, payload) jobs to the caller's transaction with one INSERT"""
+    if not jobs:
+        return
+    run_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+    max_attempts = current_app.config.get('JOB_MAX_ATTEMPTS', 5)
+    db.session.execute(insert(Job), [
+        {'task': task_name, 'payload': payload, 'max_attempts': max_attempts, 'run_at': run_at}
+        for task_name, payload in jobs
+    ])
+
+
+def due_filter(now):
+    """Queued jobs whose run_at has passed, and running jobs past their visibility timeout"""
+    return or_(
+        and_(Job.status == 'queued', Job.run_at <= now),
+        and_(Job.status == 'running', Job.locked_until <= now)
+    )
+
+
+def retry_delay(attempts):
+    config = current_app.config
+    delay = min(
+        config.get('JOB_RETRY_BACKOFF', 30) * 2 ** (attempts - 1),
+        config.get('JOB_RETRY_BACKOFF_MAX', 3600)
+    )
+    # Jitter spreads out retries of jobs that failed together
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def claim(batch_size, visibility_timeout):
+    """Mark up to batch_size due jobs as running; returns (token, jobs)"""
+    now = datetime.now(timezone.utc)
+    token = uuid.uuid4().hex
+    candidates = db.select(Job.id).where(due_filter(now)).order_by(Job.run_at).limit(batch_size)
+
+    if db.session.get_bind().dialect.name in ('postgresql', 'mysql'):
+        ids = db.session.execute(candidates.with_for_update(skip_locked=True)).scalars().all()
+        if not ids:
+            db.session.rollback()
+            return token, []
+        condition = Job.id.in_(ids)
+    else:
+        condition = and_(Job.id.in_(candidates), due_filter(now))
+
+    try:
+        claimed = db.session.execute(
+            update(Job).where(condition).values(
+                status='running',
+                lock_token=token,
+                locked_until=now + timedelta(seconds=visibility_timeout),
+                attempts=Job.attempts + 1,
+                started_at=now
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+    except OperationalError:
+        # SQLite reports a busy database instead of waiting for a lock forever
+        db.session.rollback()
+        logger.warning('Job claim failed, retrying on the next poll', exc_info=True)
+        return token, []
+
+    if not claimed:
+        return token, []
+    return token, Job.query.filter_by(lock_token=token).order_by(Job.run_at).all()
+
+
+def finish(job_id, token, **values):
+    """Update a claimed job unless another worker has taken it over since"""
+    updated = Job.query.filter_by(id=job_id, lock_token=token).update(
+        values, synchronize_session=False
+    )
+    db.session.commit()
+    return updated == 1
+
+
+def run_job(job, token):
+    """Run one claimed job and record the outcome; returns 'completed', 'retried' or 'failed'"""
+    job_id, task_name, payload = job.id, job.task, job.payload or {}
+    attempts, max_attempts = job.attempts, job.max_attempts
+    now = datetime.now(timezone.utc)
+
+    handler = TASKS.get(task_name)
+    error = None
+    if handler is None:
+        error = PermanentJobError(f'Unknown task {task_name}')
+    elif attempts > max_attempts:
+        # The last attempt ran past the visibility timeout
+        error = PermanentJobError('Visibility timeout exceeded on the last attempt')
+    else:
+        try:
+            handler(**payload)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            error = e
+
+    if error is None:
+        finish(
+            job_id, token, status='completed', lock_token=None, locked_until=None,
+            last_error=None, finished_at=datetime.now(timezone.utc)
+        )
+        return 'completed'
+
+    message = f'{type(error).__name__}: {error}'
+    if isinstance(error, PermanentJobError) or attempts >= max_attempts:
+        logger.error('Job %s (%s) failed after %d attempts: %s', job_id, task_name, attempts, message)
+        finish(
+            job_id, token, status='failed', lock_token=None, locked_until=None,
+            last_error=message, finished_at=datetime.now(timezone.utc)
+        )
+        return 'failed'
+
+    logger.warning('Job %s (%s) attempt %d failed: %s', job_id, task_name, attempts, message)
+    finish(
+        job_id, token, status='queued', lock_token=None, locked_until=None,
+        last_error=message, run_at=now + timedelta(seconds=retry_delay(attempts))
+    )
+    return 'retried'
+
+
+class WorkerMetrics:
+    """Counters for one worker process, logged every JOB_METRICS_INTERVAL seconds"""
+
+    def __init__(self):
+        self.counts = {'completed': 0, 'retried': 0, 'failed': 0}
+        self.claims = 0
+        self.busy_seconds = 0.0
+        self.started = time.monotonic()
+
+    def record(self, outcome, seconds):
+        self.counts[outcome] += 1
+        self.busy_seconds += seconds
+
+    def as_dict(self):
+        processed = sum(self.counts.values())
+        uptime = time.monotonic() - self.started
+        return {
+            **self.counts,
+            'processed': processed,
+            'claims': self.claims,
+            'avg_seconds': round(self.busy_seconds / processed, 4) if processed else 0,
+            'jobs_per_second': round(processed / uptime, 2) if uptime else 0,
+            'utilization': round(self.busy_seconds / uptime, 4) if uptime else 0
+        }
+
+
+class Worker:
+    """Claims and runs jobs until stop() is called"""
+
+    def __init__(self, batch_size=None, poll_interval=None):
+        config = current_app.config
+        self.batch_size = batch_size or config.get('JOB_BATCH_SIZE', 10)
+        self.poll_interval = poll_interval or config.get('JOB_POLL_INTERVAL', 1.0)
+        self.visibility_timeout = config.get('JOB_VISIBILITY_TIMEOUT', 300)
+        self.metrics_interval = config.get('JOB_METRICS_INTERVAL', 60)
+        self.metrics = WorkerMetrics()
+        self.stopping = False
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run_once(self):
+        """Claim one batch and run it; returns the number of jobs claimed"""
+        token, jobs = claim(self.batch_size, self.visibility_timeout)
+        if jobs:
+            self.metrics.claims += 1
+        for job in jobs:
+            # Jobs left unstarted on shutdown become due again after the timeout
+            if self.stopping:
+                break
+            start = time.monotonic()
+            outcome = run_job(job, token)
+            self.metrics.record(outcome, time.monotonic() - start)
+        return len(jobs)
+
+    def run(self):
+        logger.info('Job worker %d started', os.getpid())
+        next_report = time.monotonic() + self.metrics_interval
+        while not self.stopping:
+            try:
+                claimed = self.run_once()
+            except Exception:
+                db.session.rollback()
+                logger.exception('Job worker %d failed to process a batch', os.getpid())
+                claimed = 0
+            if time.monotonic() >= next_report:
+                logger.info('Job worker %d metrics: %s', os.getpid(), self.metrics.as_dict())
+                next_report = time.monotonic() + self.metrics_interval
+            # Keep going while there is a backlog, otherwise poll
+            if claimed < self.batch_size and not self.stopping:
+                time.sleep(self.poll_interval)
+        logger.info('Job worker %d stopped: %s', os.getpid(), self.metrics.as_dict())
+
+
+def _worker_process(app, batch_size, poll_interval):
+    with app.app_context():
+        # Connections inherited from the parent must not be shared after fork
+        db.engine.dispose(close=False)
+        worker = Worker(batch_size, poll_interval)
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        worker.run()
+
+
+def run_pool(processes=None, batch_size=None, poll_interval=None):
+    """Run a pool of forked worker processes, restarting any that die, until SIGTERM/SIGINT"""
+    import multiprocessing
+
+    app = current_app._get_current_object()
+    processes = processes or app.config.get('JOB_WORKER_PROCESSES', 2)
+    context = multiprocessing.get_context('fork')
+    stopping = []
+
+    def start():
+        process = context.Process(
+            target=_worker_process, args=(app, batch_size, poll_interval), name='job-worker'
+        )
+        process.start()
+        return process
+
+    def stop(*args):
+        stopping.append(True)
+
+    db.engine.dispose()
+    pool = [start() for _ in range(processes)]
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        time.sleep(1)
+        for index, process in enumerate(pool):
+            if not process.is_alive() and not stopping:
+                logger.error('Job worker %d exited with %s, restarting', process.pid, process.exitcode)
+                pool[index] = start()
+
+    # Let workers finish the job they are running
+    for process in pool:
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGTERM)
+    for process in pool:
+        process.join(app.config.get('JOB_VISIBILITY_TIMEOUT', 300))
+
+
+def queue_stats():
+    """Job counts per task and status, plus how far the queue is behind"""
+    now = datetime.now(timezone.utc)
+    rows = db.session.query(
+        Job.task, Job.status, db.func.count(Job.id)
+    ).group_by(Job.task, Job.status).all()
+
+    tasks = {}
+    totals = {'queued': 0, 'running': 0, 'completed': 0, 'failed': 0}
+    for task_name, status, count in rows:
+        tasks.setdefault(task_name, {})[status] = count
+        totals[status] = totals.get(status, 0) + count
+
+    oldest_due = db.session.query(db.func.min(Job.run_at)).filter(
+        Job.status == 'queued', Job.run_at <= now
+    ).scalar()
+    stalled = Job.query.filter(Job.status == 'running', Job.locked_until <= now).count()
+    if oldest_due is not None and oldest_due.tzinfo is None:
+        oldest_due = oldest_due.replace(tzinfo=timezone.utc)
+
+    return {
+        'totals': totals,
+        'tasks': tasks,
+        'lag_seconds': round((now - oldest_due).total_seconds(), 3) if oldest_due else 0,
+        'stalled': stalled
+    }
+
+
+def retry_failed(task_name=None):
+    """Queue failed jobs again with a fresh set of attempts; returns the count"""
+    query = Job.query.filter(Job.status == 'failed')
+    if task_name:
+        query = query.filter(Job.task == task_name)
+    retried = query.update({
+        'status': 'queued',
+        'attempts': 0,
+        'run_at': datetime.now(timezone.utc),
+        'finished_at': None
+    }, synchronize_session=False)
+    db.session.commit()
+    return retried
+
+
+def purge_finished_jobs(retention_days=None, batch_size=500):
+    """Delete completed jobs older than JOB_RETENTION_DAYS in batches; returns the count"""
+    retention_days = retention_days or current_app.config.get('JOB_RETENTION_DAYS', 7)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    deleted = 0
+    while True:
+        # run_at precedes finished_at, so the (status, run_at) index narrows the scan
+        ids = [
+            row.id for row in db.session.query(Job.id).filter(
+                Job.status == 'completed', Job.run_at < cutoff, Job.finished_at < cutoff
+            ).order_by(Job.run_at).limit(batch_size).all()
+        ]
+        if not ids:
+            db.session.rollback()
+            break
+        deleted += Job.query.filter(Job.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        if len(ids) < batch_size:
+            break
+    return deleted
@@ -0,0 +1,77 @@
+"""
+Fast JSON provider for the Flask app.
+
+Serializes with orjson when it is installed and falls back to the standard
+library encoder otherwise. Both paths encode Decimal, datetime/date, UUID
+and Enum values (e.g. OrderStatus) natively, so routes can hand model
+values straight to jsonify.
+
+Decimal is encoded as a string, matching Flask's default provider, so
+existing responses (e.g. marshmallow Decimal fields) keep their format.
+Dates are encoded as ISO 8601, the format the routes produce by hand.
+"""
+
+import dataclasses
+import decimal
+import uuid
+from datetime import date
+from enum import Enum
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is always available
+    orjson = None
+
+
+def default(o):
+    """Encode types the JSON encoders do not support natively"""
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if isinstance(o, Enum):
+        return o.value
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """orjson-backed provider with a stdlib fallback"""
+
+    default = staticmethod(default)
+
+    def _orjson_options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps_bytes(self, obj, indent=False):
+        """Serialize to UTF-8 bytes, using orjson when possible"""
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=default, option=self._orjson_options(indent))
+            except TypeError:
+                # e.g. integers wider than 64 bits; let the stdlib encoder handle it
+                pass
+        return super().dumps(obj, indent=2 if indent else None).encode()
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(
+            self.dumps_bytes(obj, indent=indent) + b"\n", mimetype=self.mimetype
+        )
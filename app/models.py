@@ -1,8 +1,7 @@
-from app import db
+from app import db, order_numbers
 from datetime import datetime, timezone
 from werkzeug.security import generate_password_hash, check_password_hash
 from enum import Enum
-import uuid
 
 class UserRole(Enum):
     ADMIN = "admin"
@@ -78,6 +77,10 @@ class Category(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
+    # Single-language projections, populated by app.i18n.localize_query
+    localized_name = db.query_expression()
+    localized_description = db.query_expression()
+    
     # Self-referential relationship for hierarchical categories
     parent = db.relationship('Category', remote_side=[id], backref='children')
     products = db.relationship('Product', backref='category', lazy=True)
@@ -106,6 +109,7 @@ class Product(db.Model):
     compare_price = db.Column(db.Numeric(10, 2))  # Original price for discounts
     cost_price = db.Column(db.Numeric(10, 2))
     stock_quantity = db.Column(db.Integer, default=0, nullable=False)
+    reserved_quantity = db.Column(db.Integer, default=0, nullable=False)  # Held by carts, maintained by app.inventory
     low_stock_threshold = db.Column(db.Integer, default=10)
     weight = db.Column(db.Numeric(8, 2))
     dimensions = db.Column(db.String(100))  # e.g., "10x5x3 cm"
@@ -120,8 +124,13 @@ class Product(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
+    # Single-language projections, populated by app.i18n.localize_query
+    localized_name = db.query_expression()
+    localized_description = db.query_expression()
+    localized_short_description = db.query_expression()
+    
     # Relationships
-    images = db.relationship('ProductImage', backref='product', lazy=True, cascade='all, delete-orphan')
+    images = db.relationship('ProductImage', backref='product', lazy=True, cascade='all, delete-orphan', order_by='ProductImage.id')
     tags = db.relationship('Tag', secondary=product_tags, backref=db.backref('products', lazy=True))
     cart_items = db.relationship('CartItem', backref='product', lazy=True)
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
@@ -141,9 +150,12 @@ class Product(db.Model):
     def is_low_stock(self):
         return self.stock_quantity <= self.low_stock_threshold
     
+    def get_available_quantity(self):
+        return max(self.stock_quantity - (self.reserved_quantity or 0), 0)
+    
     def get_main_image(self):
-        main_image = next((img for img in self.images if img.is_primary), None)
-        return main_image.url if main_image else None
+        # ProductImage has no is_primary flag yet, so the first image is the main one
+        return self.images[0].url if self.images else None
     
     def __repr__(self):
         return f'<Product {self.name}>'
@@ -162,9 +174,9 @@ class ProductImage(db.Model):
 
 class Cart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), index=True)  # Abandoned cart purge
     
     # Relationships
     items = db.relationship('CartItem', backref='cart', lazy=True, cascade='all, delete-orphan')
@@ -187,8 +199,12 @@ class CartItem(db.Model):
     cart_id = db.Column(db.Integer, db.ForeignKey('cart.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
+    unit_price = db.Column(db.Numeric(10, 2))  # Price when added, to detect price changes
     added_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     
+    # One line per product, so concurrent adds upsert instead of duplicating rows
+    __table_args__ = (db.UniqueConstraint('cart_id', 'product_id', name='_cart_product_item'),)
+    
     def get_total_price(self):
         return self.product.price * self.quantity
     
@@ -229,7 +245,7 @@ class Address(db.Model):
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(50), unique=True, nullable=False, index=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # None for guest orders
     status = db.Column(db.Enum(OrderStatus), default=OrderStatus.PENDING, nullable=False)
     
     # Pricing
@@ -238,6 +254,11 @@ class Order(db.Model):
     shipping_amount = db.Column(db.Numeric(10, 2), default=0)
     discount_amount = db.Column(db.Numeric(10, 2), default=0)
     total_amount = db.Column(db.Numeric(10, 2), nullable=False)
+    coupon_code = db.Column(db.String(50))  # Redeemed coupon, released if the order is cancelled
+    item_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # Total quantity, set at creation
+    
+    # Serialized order, stored once it is delivered or cancelled (app.orders.snapshots)
+    snapshot = db.deferred(db.Column(db.JSON(none_as_null=True)))
     
     # Address snapshots
     shipping_address = db.Column(db.JSON)
@@ -266,7 +287,7 @@ class Order(db.Model):
     
     @staticmethod
     def generate_order_number():
-        return f"ORD-{uuid.uuid4().hex[:8].upper()}"
+        return order_numbers.generate_order_number()
     
     def get_total_items(self):
         return sum(item.quantity for item in self.items)
@@ -375,6 +396,130 @@ class Coupon(db.Model):
     def __repr__(self):
         return f'<Coupon {self.code}>'
 
+# Pricing tables, compiled into in-memory lookups by app.pricing
+class TaxRate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    country = db.Column(db.String(2))  # ISO code; None applies everywhere
+    state = db.Column(db.String(100))  # None applies to the whole country
+    rate = db.Column(db.Numeric(6, 4), nullable=False)  # 0.1000 = 10%
+    name = db.Column(db.String(100))
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (db.UniqueConstraint('country', 'state', name='_country_state_tax_rate'),)
+    
+    def __repr__(self):
+        return f'<TaxRate {self.country}/{self.state} {self.rate}>'
+
+class ShippingRule(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    method = db.Column(db.String(50), nullable=False, default='standard')  # standard, express
+    name = db.Column(db.String(100), nullable=False)
+    country = db.Column(db.String(2))  # ISO code; None applies everywhere
+    
+    # Tier bounds: min inclusive, max exclusive, None for unbounded
+    min_weight = db.Column(db.Numeric(8, 2), default=0, nullable=False)
+    max_weight = db.Column(db.Numeric(8, 2))
+    min_subtotal = db.Column(db.Numeric(10, 2), default=0, nullable=False)
+    max_subtotal = db.Column(db.Numeric(10, 2))
+    
+    # Cost: base_cost plus cost_per_kg for the weight above min_weight
+    base_cost = db.Column(db.Numeric(10, 2), default=0, nullable=False)
+    cost_per_kg = db.Column(db.Numeric(10, 2), default=0, nullable=False)
+    
+    estimated_days = db.Column(db.String(20))
+    priority = db.Column(db.Integer, default=0, nullable=False)  # Lower wins among matching rules
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    def __repr__(self):
+        return f'<ShippingRule {self.method} {self.name}>'
+
+class SearchQueryStat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    query_text = db.Column(db.String(200), unique=True, nullable=False, index=True)  # normalized
+    search_count = db.Column(db.Integer, default=0, nullable=False, index=True)
+    zero_result_count = db.Column(db.Integer, default=0, nullable=False)
+    last_result_count = db.Column(db.Integer, default=0)
+    last_searched_at = db.Column(db.DateTime)
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    def get_zero_result_rate(self):
+        if not self.search_count:
+            return 0
+        return self.zero_result_count / self.search_count
+    
+    def __repr__(self):
+        return f'<SearchQueryStat {self.query_text} x{self.search_count}>'
+
+class InventoryReservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    # One hold per user and product, sized to the cart line
+    __table_args__ = (db.UniqueConstraint('user_id', 'product_id', name='_user_product_reservation'),)
+    
+    def is_expired(self):
+        expires_at = self.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at <= datetime.now(timezone.utc)
+    
+    def __repr__(self):
+        return f'<InventoryReservation product={self.product_id} x{self.quantity}>'
+
+class IdempotencyKey(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), nullable=False)
+    scope = db.Column(db.String(100), nullable=False)  # endpoint and user
+    fingerprint = db.Column(db.String(64), nullable=False)  # SHA-256 of method, path and body
+    status = db.Column(db.String(20), default='processing', nullable=False)  # processing, completed
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_mimetype = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    __table_args__ = (db.UniqueConstraint('scope', 'key', name='_scope_idempotency_key'),)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.scope} {self.key}>'
+
+# Background jobs, processed by `flask jobs worker` (see app.jobs)
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, completed, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    lock_token = db.Column(db.String(32), index=True)  # Set by the claim that is running the job
+    locked_until = db.Column(db.DateTime)  # Visibility timeout; the job is claimable again after it
+    last_error = db.Column(db.Text)
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.task} {self.status}>'
+
 # Activity Log for audit trail
 class ActivityLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
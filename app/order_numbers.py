@@ -0,0 +1,139 @@
+"""
+Order number generators.
+
+ORDER_NUMBER_STRATEGY picks the generator used by Order.generate_order_number:
+
+    snowflake  time-ordered 64-bit IDs (default)
+    uuid       8 random hex characters, the original format
+
+Snowflake IDs pack a millisecond timestamp, a node ID, a worker ID and a
+per-millisecond sequence:
+
+    41 bits  milliseconds since 2024-01-01 UTC
+     6 bits  ORDER_NUMBER_NODE_ID (0-63), one per host or container
+    10 bits  ORDER_NUMBER_WORKER_ID (0-1023), one per live process on the node
+     7 bits  sequence, 128 IDs per millisecond per process
+
+gunicorn.conf.py gives every gunicorn worker the lowest slot not held by
+another live worker and exports it as ORDER_NUMBER_WORKER_ID after the
+fork, so restarted workers never share a slot. Other multi-process servers
+must set a distinct ORDER_NUMBER_WORKER_ID per process. Outside debug and
+testing, generating a snowflake without a worker ID raises an error rather
+than risking duplicate order numbers.
+
+IDs are unique across hosts and workers without database coordination and
+are rendered as 13 Crockford base32 characters, so numbers sort by
+creation time and new orders land at the right edge of the order_number
+index instead of scattering inserts across it.
+
+Extra strategies can be added with register_generator().
+"""
+
+import os
+import threading
+import time
+import uuid
+from flask import current_app, has_app_context
+
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+
+NODE_BITS = 6
+WORKER_BITS = 10
+SEQUENCE_BITS = 7
+
+
+def encode_base32(value, length=13):
+    """Fixed-width Crockford base32, so string order matches numeric order"""
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(CROCKFORD_ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+class SnowflakeGenerator:
+    """Thread-safe generator of time-ordered 64-bit IDs"""
+
+    def __init__(self, node_id=0, worker_id=0):
+        if not 0 <= node_id < 1 << NODE_BITS:
+            raise ValueError(f'ORDER_NUMBER_NODE_ID must be between 0 and {(1 << NODE_BITS) - 1}')
+        if not 0 <= worker_id < 1 << WORKER_BITS:
+            raise ValueError(f'ORDER_NUMBER_WORKER_ID must be between 0 and {(1 << WORKER_BITS) - 1}')
+        self.node_id = node_id
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000 - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # Same millisecond, or the clock stepped back: keep counting
+                self._sequence += 1
+                if self._sequence >= 1 << SEQUENCE_BITS:
+                    self._last_ms += 1
+                    self._sequence = 0
+
+            return (
+                self._last_ms << (NODE_BITS + WORKER_BITS + SEQUENCE_BITS)
+                | self.node_id << (WORKER_BITS + SEQUENCE_BITS)
+                | self.worker_id << SEQUENCE_BITS
+                | self._sequence
+            )
+
+
+_snowflakes = {}
+_snowflakes_lock = threading.Lock()
+
+
+def get_snowflake(node_id, worker_id):
+    with _snowflakes_lock:
+        key = (node_id, worker_id)
+        if key not in _snowflakes:
+            _snowflakes[key] = SnowflakeGenerator(node_id, worker_id)
+        return _snowflakes[key]
+
+
+def get_worker_id(config):
+    """This process's ORDER_NUMBER_WORKER_ID; raises outside debug and testing when unset"""
+    # gunicorn.conf.py exports it after the fork, possibly after the config was loaded
+    worker_id = config.get('ORDER_NUMBER_WORKER_ID') or os.environ.get('ORDER_NUMBER_WORKER_ID')
+    if worker_id not in (None, ''):
+        return int(worker_id)
+    if config.get('DEBUG') or config.get('TESTING'):
+        return 0
+    raise RuntimeError(
+        'ORDER_NUMBER_WORKER_ID is not set; run gunicorn with gunicorn.conf.py '
+        'or give each process a distinct ORDER_NUMBER_WORKER_ID (0-1023)'
+    )
+
+
+def snowflake_order_number(config):
+    generator = get_snowflake(config.get('ORDER_NUMBER_NODE_ID', 0), get_worker_id(config))
+    return f"ORD-{encode_base32(generator.next_id())}"
+
+
+def uuid_order_number(config):
+    return f"ORD-{uuid.uuid4().hex[:8].upper()}"
+
+
+GENERATORS = {
+    'snowflake': snowflake_order_number,
+    'uuid': uuid_order_number,
+}
+
+
+def register_generator(name, func):
+    """Add a strategy; func(config) returns a new order number"""
+    GENERATORS[name] = func
+
+
+def generate_order_number():
+    config = current_app.config if has_app_context() else {}
+    strategy = config.get('ORDER_NUMBER_STRATEGY', 'snowflake')
+    return GENERATORS[strategy](config)
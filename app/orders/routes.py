@@ -1,24 +1,40 @@
 from flask import request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timezone
-from decimal import Decimal
 from app.orders import bp
+from app.orders import snapshots
+from app.orders.services import load_checkout_lines, price_order, save_order
 from app.models import (
-    Order, OrderItem, Cart, Address, Product, Payment,
+    Order, Cart, CartItem, Address, Product, Payment,
     OrderStatus, PaymentStatus, User
 )
-from app import db
+from app.cart.store import cart_store
+from app.idempotency import idempotent
+from app.tasks import enqueue_order_event
+from app import coupons, db, inventory, pricing
 
 @bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_order():
     """Create order from cart"""
     user_id = int(get_jwt_identity())
     data = request.get_json()
     
-    # Get user's cart
+    if not cart_store.enabled:
+        return place_order(user_id, data)
+    
+    # Persist the in-memory cart so the order reads a consistent snapshot, and
+    # hold the user's cart updates until the order has cleared the cart
+    with cart_store.checkout(user_id):
+        return place_order(user_id, data)
+
+def place_order(user_id, data):
+    """Create the order from the user's persisted cart"""
+    # Get user's cart with its products in one query
     cart = Cart.query.filter_by(user_id=user_id).first()
-    if not cart or not cart.items:
+    lines = load_checkout_lines(cart.id) if cart else []
+    if not lines:
         return jsonify({'error': 'Cart is empty'}), 400
     
     # Validate required data
@@ -44,30 +60,35 @@ def create_order():
     if not billing_address:
         return jsonify({'error': 'Billing address not found'}), 404
     
-    # Validate cart items
-    for item in cart.items:
-        if not item.product.is_active:
-            return jsonify({'error': f'Product {item.product.name} is no longer available'}), 400
+    # Validate cart items; stock held for this user's cart counts as available
+    holds = inventory.get_user_holds(user_id, [item.product_id for item, _ in lines])
+    for item, product in lines:
+        if not product.is_active:
+            return jsonify({'error': f'Product {product.name} is no longer available'}), 400
         
-        if item.product.stock_quantity < item.quantity:
-            return jsonify({'error': f'Insufficient stock for {item.product.name}'}), 400
+        if inventory.available_for_user(product, holds) < item.quantity:
+            return jsonify({'error': f'Insufficient stock for {product.name}'}), 400
     
-    # Calculate totals
-    subtotal = cart.get_total_price()
-    tax_rate = Decimal('0.10')  # 10% tax - make this configurable
-    tax_amount = subtotal * tax_rate
-    shipping_amount = Decimal('10.00')  # Fixed shipping - make this configurable
-    discount_amount = Decimal('0.00')  # TODO: Apply coupons
-    total_amount = subtotal + tax_amount + shipping_amount - discount_amount
+    # Calculate totals for the shipping destination, applying the coupon if any
+    try:
+        quote, coupon = price_order(
+            [(product, item.quantity) for item, product in lines],
+            shipping_address.country,
+            shipping_address.state,
+            data
+        )
+    except pricing.PricingError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Create order
     order = Order(
         user_id=user_id,
-        subtotal=subtotal,
-        tax_amount=tax_amount,
-        shipping_amount=shipping_amount,
-        discount_amount=discount_amount,
-        total_amount=total_amount,
+        subtotal=quote.subtotal,
+        tax_amount=quote.tax_amount,
+        shipping_amount=quote.shipping_amount,
+        discount_amount=quote.discount_amount,
+        total_amount=quote.total_amount,
+        coupon_code=coupon.code if coupon else None,
         currency=current_app.config.get('DEFAULT_CURRENCY', 'USD'),
         shipping_address={
             'first_name': shipping_address.first_name,
@@ -96,39 +117,32 @@ def create_order():
         notes=data.get('notes')
     )
     
+    # Create payment record
+    payment_method = data.get('payment_method', 'pending')
+    payment = Payment(
+        payment_method=payment_method,
+        amount=quote.total_amount,
+        currency=order.currency,
+        status=PaymentStatus.PENDING
+    )
+    
     try:
-        db.session.add(order)
-        db.session.flush()  # Get order ID
-        
-        # Create order items
-        for cart_item in cart.items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.product.price,
-                total_price=cart_item.product.price * cart_item.quantity,
-                product_name=cart_item.product.name,
-                product_sku=cart_item.product.sku
-            )
-            db.session.add(order_item)
-            
-            # Update product stock
-            cart_item.product.stock_quantity -= cart_item.quantity
-        
-        # Create payment record
-        payment_method = data.get('payment_method', 'pending')
-        payment = Payment(
-            order_id=order.id,
-            payment_method=payment_method,
-            amount=total_amount,
-            currency=order.currency,
-            status=PaymentStatus.PENDING
-        )
-        db.session.add(payment)
+        # Order and payment in one flush, all order items in one INSERT
+        save_order(order, payment, [(product, item.quantity) for item, product in lines])
+        
+        # Release this user's holds, then take the stock in one conditional UPDATE
+        inventory.release(user_id)
+        inventory.decrement_stock({item.product_id: item.quantity for item, _ in lines})
         
         # Clear cart
-        cart.clear()
+        CartItem.query.filter_by(cart_id=cart.id).delete(synchronize_session=False)
+        
+        # Email, analytics and webhooks run in background jobs committed with the order
+        enqueue_order_event(order, 'order.created')
+        
+        # Count the coupon use last so its row stays locked only until commit
+        if coupon:
+            coupons.redeem(coupon)
         
         db.session.commit()
         
@@ -141,6 +155,7 @@ def create_order():
             'tax_amount': float(order.tax_amount),
             'shipping_amount': float(order.shipping_amount),
             'discount_amount': float(order.discount_amount),
+            'coupon_code': order.coupon_code,
             'total_amount': float(order.total_amount),
             'currency': order.currency,
             'payment': {
@@ -157,12 +172,22 @@ def create_order():
             'data': order_data
         }), 201
         
+    except inventory.InsufficientStock as e:
+        db.session.rollback()
+        product = db.session.get(Product, e.product_id)
+        return jsonify({'error': f'Insufficient stock for {product.name}'}), 400
+        
+    except coupons.CouponError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+        
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to create order', 'details': str(e)}), 500
 
 @bp.route('/<int:order_id>/payment', methods=['POST'])
 @jwt_required()
+@idempotent
 def process_payment(order_id):
     """Process payment for order"""
     user_id = int(get_jwt_identity())
@@ -198,6 +223,8 @@ def process_payment(order_id):
         order.status = OrderStatus.PAID
         order.updated_at = datetime.now(timezone.utc)
         
+        enqueue_order_event(order, 'order.paid')
+        
         db.session.commit()
         
         return jsonify({
@@ -230,10 +257,14 @@ def cancel_order(order_id):
     
     try:
         # Restore product stock
+        restocked = {}
         for item in order.items:
-            product = Product.query.get(item.product_id)
-            if product:
-                product.stock_quantity += item.quantity
+            restocked[item.product_id] = restocked.get(item.product_id, 0) + item.quantity
+        inventory.restock(restocked)
+        
+        # Give the coupon use back
+        if order.coupon_code:
+            coupons.release(order.coupon_code)
         
         # Update order status
         order.status = OrderStatus.CANCELLED
@@ -243,6 +274,7 @@ def cancel_order(order_id):
         if order.payment and order.payment.status == PaymentStatus.COMPLETED:
             order.payment.status = PaymentStatus.REFUNDED
         
+        snapshots.refresh_snapshot(order)
         db.session.commit()
         
         return jsonify({
@@ -264,46 +296,11 @@ def get_order_by_number(order_number):
     """Get order by order number"""
     user_id = int(get_jwt_identity())
     
-    order = Order.query.filter_by(order_number=order_number, user_id=user_id).first()
+    order = snapshots.order_details_query().filter_by(order_number=order_number, user_id=user_id).first()
     if not order:
         return jsonify({'error': 'Order not found'}), 404
     
-    order_data = {
-        'id': order.id,
-        'order_number': order.order_number,
-        'status': order.status.value,
-        'subtotal': float(order.subtotal),
-        'tax_amount': float(order.tax_amount),
-        'shipping_amount': float(order.shipping_amount),
-        'discount_amount': float(order.discount_amount),
-        'total_amount': float(order.total_amount),
-        'currency': order.currency,
-        'shipping_address': order.shipping_address,
-        'billing_address': order.billing_address,
-        'tracking_number': order.tracking_number,
-        'notes': order.notes,
-        'items': [
-            {
-                'id': item.id,
-                'product_id': item.product_id,
-                'product_name': item.product_name,
-                'product_sku': item.product_sku,
-                'quantity': item.quantity,
-                'unit_price': float(item.unit_price),
-                'total_price': float(item.total_price)
-            }
-            for item in order.items
-        ],
-        'payment': {
-            'method': order.payment.payment_method,
-            'status': order.payment.status.value,
-            'amount': float(order.payment.amount)
-        } if order.payment else None,
-        'created_at': order.created_at.isoformat(),
-        'updated_at': order.updated_at.isoformat(),
-        'shipped_at': order.shipped_at.isoformat() if order.shipped_at else None,
-        'delivered_at': order.delivered_at.isoformat() if order.delivered_at else None
-    }
+    order_data = snapshots.get_order_data(order)
     
     return jsonify({
         'message': 'Order retrieved successfully',
@@ -311,6 +308,7 @@ def get_order_by_number(order_number):
     }), 200
 
 @bp.route('/guest', methods=['POST'])
+@idempotent
 def create_guest_order():
     """Create order for guest user"""
     data = request.get_json()
@@ -328,80 +326,79 @@ def create_guest_order():
     if not items_data:
         return jsonify({'error': 'Order items are required'}), 400
     
-    # Validate items and calculate totals
-    subtotal = Decimal('0.00')
-    order_items = []
-    
+    # Merge duplicate product lines; IDs may arrive as strings, so key by int
+    quantities = {}
     for item_data in items_data:
-        product_id = item_data.get('product_id')
-        quantity = item_data.get('quantity', 1)
+        try:
+            product_id = int(item_data.get('product_id'))
+            quantity = int(item_data.get('quantity', 1))
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'error': 'Invalid item data'}), 400
         
-        if not product_id or quantity <= 0:
+        if product_id <= 0 or quantity <= 0:
             return jsonify({'error': 'Invalid item data'}), 400
         
-        product = Product.query.filter_by(id=product_id, is_active=True).first()
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    
+    # Validate items against a single IN query and calculate totals
+    products = {
+        product.id: product
+        for product in Product.query.filter(
+            Product.id.in_(quantities.keys()), Product.is_active == True
+        ).all()
+    }
+    
+    lines = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
         if not product:
             return jsonify({'error': f'Product {product_id} not found'}), 404
         
-        if product.stock_quantity < quantity:
+        if product.get_available_quantity() < quantity:
             return jsonify({'error': f'Insufficient stock for {product.name}'}), 400
         
-        item_total = product.price * quantity
-        subtotal += item_total
-        
-        order_items.append({
-            'product': product,
-            'quantity': quantity,
-            'unit_price': product.price,
-            'total_price': item_total
-        })
+        lines.append((product, quantity))
     
-    # Calculate totals
-    tax_rate = Decimal('0.10')
-    tax_amount = subtotal * tax_rate
-    shipping_amount = Decimal('10.00')
-    total_amount = subtotal + tax_amount + shipping_amount
+    # Calculate totals for the shipping destination, applying the coupon if any
+    shipping_address = data['shipping_address']
+    try:
+        quote, coupon = price_order(lines, shipping_address.get('country'), shipping_address.get('state'), data)
+    except pricing.PricingError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Create guest order
     order = Order(
         user_id=None,  # Guest order
-        subtotal=subtotal,
-        tax_amount=tax_amount,
-        shipping_amount=shipping_amount,
-        total_amount=total_amount,
+        subtotal=quote.subtotal,
+        tax_amount=quote.tax_amount,
+        shipping_amount=quote.shipping_amount,
+        discount_amount=quote.discount_amount,
+        total_amount=quote.total_amount,
+        coupon_code=coupon.code if coupon else None,
         shipping_address=data['shipping_address'],
         billing_address=data.get('billing_address', data['shipping_address']),
         notes=data.get('notes')
     )
     
+    # Create payment record
+    payment = Payment(
+        payment_method='pending',
+        amount=quote.total_amount,
+        status=PaymentStatus.PENDING
+    )
+    
     try:
-        db.session.add(order)
-        db.session.flush()
-        
-        # Create order items
-        for item_data in order_items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item_data['product'].id,
-                quantity=item_data['quantity'],
-                unit_price=item_data['unit_price'],
-                total_price=item_data['total_price'],
-                product_name=item_data['product'].name,
-                product_sku=item_data['product'].sku
-            )
-            db.session.add(order_item)
-            
-            # Update stock
-            item_data['product'].stock_quantity -= item_data['quantity']
-        
-        # Create payment record
-        payment = Payment(
-            order_id=order.id,
-            payment_method='pending',
-            amount=total_amount,
-            status=PaymentStatus.PENDING
-        )
-        db.session.add(payment)
+        # Order and payment in one flush, all order items in one INSERT
+        save_order(order, payment, lines)
+        
+        # Take the stock for all lines in one conditional UPDATE
+        inventory.decrement_stock(quantities)
+        
+        enqueue_order_event(order, 'order.created', email=data['contact_email'])
+        
+        # Count the coupon use last so its row stays locked only until commit
+        if coupon:
+            coupons.redeem(coupon)
         
         db.session.commit()
         
@@ -414,6 +411,15 @@ def create_guest_order():
             }
         }), 201
         
+    except inventory.InsufficientStock as e:
+        db.session.rollback()
+        product = db.session.get(Product, e.product_id)
+        return jsonify({'error': f'Insufficient stock for {product.name}'}), 400
+        
+    except coupons.CouponError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+        
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to create guest order', 'details': str(e)}), 500
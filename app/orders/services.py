@@ -0,0 +1,98 @@
+"""
+Order persistence shared by the checkout routes.
+"""
+
+from decimal import Decimal
+from sqlalchemy import insert, update
+from app import coupons, db, pricing
+from app.models import CartItem, Order, OrderItem, Product
+
+
+def load_checkout_lines(cart_id):
+    """Cart items with their products, in one query"""
+    return db.session.query(CartItem, Product).join(
+        Product, CartItem.product_id == Product.id
+    ).filter(
+        CartItem.cart_id == cart_id
+    ).order_by(CartItem.id).all()
+
+
+def price_order(lines, country, state, data):
+    """Quote (product, quantity) lines, applying data['coupon_code'] if given
+
+    Returns (quote, coupon); raises pricing.PricingError, including
+    coupons.CouponError, with a message for the customer.
+    """
+    return price_measures(pricing.measure(lines), country, state, data)
+
+
+def price_measures(measures, country, state, data):
+    """Same as price_order, from (subtotal, weight, ships) measures"""
+    coupon = None
+    discount = Decimal('0')
+    if data.get('coupon_code'):
+        coupon, discount = coupons.resolve(data['coupon_code'], measures[0])
+    quote = pricing.quote_measures(
+        measures,
+        country=country,
+        state=state,
+        method=data.get('shipping_method', 'standard'),
+        discount=discount
+    )
+    return quote, coupon
+
+
+def save_order(order, payment, lines):
+    """Insert an order, its payment and its lines
+
+    The order and payment go out in one flush and the lines in a single
+    multi-row INSERT (executemany / insertmanyvalues), so an order costs
+    the same three statements whatever its line count. `lines` holds
+    (product, quantity) pairs; prices are snapshotted from the products
+    and the total quantity is stored as order.item_count.
+    """
+    order.payment = payment
+    order.item_count = sum(quantity for _, quantity in lines)
+    db.session.add(order)
+    db.session.flush()
+    
+    db.session.execute(insert(OrderItem), [
+        {
+            'order_id': order.id,
+            'product_id': product.id,
+            'quantity': quantity,
+            'unit_price': product.price,
+            'total_price': product.price * quantity,
+            'product_name': product.name,
+            'product_sku': product.sku
+        }
+        for product, quantity in lines
+    ])
+
+
+def load_order_items(order_ids):
+    """Items for a page of orders in one query, as {order_id: [OrderItem]}"""
+    items = {order_id: [] for order_id in order_ids}
+    if order_ids:
+        for item in OrderItem.query.filter(
+            OrderItem.order_id.in_(order_ids)
+        ).order_by(OrderItem.order_id, OrderItem.id).all():
+            items[item.order_id].append(item)
+    return items
+
+
+def backfill_item_counts():
+    """Set item_count on every order from its items in one UPDATE; returns the row count
+
+    Clears the stored order snapshots, which include the count.
+    """
+    total = db.select(db.func.coalesce(db.func.sum(OrderItem.quantity), 0)).where(
+        OrderItem.order_id == Order.id
+    ).scalar_subquery()
+    result = db.session.execute(
+        update(Order).values(item_count=total, snapshot=None, updated_at=Order.updated_at).execution_options(
+            synchronize_session=False
+        )
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,132 @@
+"""
+Serialized order details shared by the customer and admin order views.
+
+Delivered and cancelled orders are final, so their serialized form is
+stored in Order.snapshot (a deferred JSON column) when they reach that
+state, or on first view for orders finalized earlier, and served from it
+with a single query. Other orders are rendered from Order, OrderItem and
+Payment rows and kept in order_cache under (id, updated_at), so a view
+re-renders them only after a change bumps updated_at. Entries also expire
+after ORDER_CACHE_TTL seconds.
+
+Any ORM change to an order that does not set the snapshot itself clears it,
+so a snapshot can never outlive an admin edit.
+"""
+
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+from app import db
+from app.cache import TTLCache
+from app.models import Order, OrderItem, OrderStatus
+
+TERMINAL_STATUSES = (OrderStatus.DELIVERED, OrderStatus.CANCELLED)
+
+order_cache = TTLCache(maxsize=1024, ttl=300)
+
+_listeners_registered = False
+
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
+
+def serialize_order(order):
+    """Full order details; loads the items and payment"""
+    items = OrderItem.query.filter_by(order_id=order.id).order_by(OrderItem.id).all()
+    payment = order.payment
+    return {
+        'id': order.id,
+        'order_number': order.order_number,
+        'status': order.status.value,
+        'subtotal': float(order.subtotal),
+        'tax_amount': float(order.tax_amount),
+        'shipping_amount': float(order.shipping_amount),
+        'discount_amount': float(order.discount_amount),
+        'coupon_code': order.coupon_code,
+        'total_amount': float(order.total_amount),
+        'currency': order.currency,
+        'shipping_address': order.shipping_address,
+        'billing_address': order.billing_address,
+        'tracking_number': order.tracking_number,
+        'notes': order.notes,
+        'items_count': order.item_count,
+        'items': [
+            {
+                'id': item.id,
+                'product_id': item.product_id,
+                'product_name': item.product_name,
+                'product_sku': item.product_sku,
+                'quantity': item.quantity,
+                'unit_price': float(item.unit_price),
+                'total_price': float(item.total_price)
+            }
+            for item in items
+        ],
+        'payment': {
+            'method': payment.payment_method,
+            'status': payment.status.value,
+            'amount': float(payment.amount)
+        } if payment else None,
+        'created_at': isoformat(order.created_at),
+        'updated_at': isoformat(order.updated_at),
+        'shipped_at': isoformat(order.shipped_at),
+        'delivered_at': isoformat(order.delivered_at)
+    }
+
+
+def order_details_query():
+    """Order query that loads the snapshot column with the row"""
+    return Order.query.options(db.undefer(Order.snapshot))
+
+
+def get_order_data(order):
+    """Serialized order from its snapshot, the render cache or the rows"""
+    if order.snapshot is not None:
+        return order.snapshot
+
+    key = (order.id, order.updated_at)
+    data = order_cache.get(key)
+    if data is not None:
+        return data
+
+    data = serialize_order(order)
+    if order.status in TERMINAL_STATUSES:
+        # Finalized before snapshots existed; store it unless it changed meanwhile
+        db.session.execute(
+            update(Order).where(
+                Order.id == order.id,
+                Order.updated_at == order.updated_at,
+                Order.snapshot.is_(None)
+            ).values(snapshot=data, updated_at=Order.updated_at).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    else:
+        order_cache.set(key, data)
+    return data
+
+
+def refresh_snapshot(order):
+    """Store the snapshot of an order reaching a final state; call after its last change"""
+    if order.status in TERMINAL_STATUSES:
+        db.session.flush()
+        order.snapshot = serialize_order(order)
+    else:
+        order.snapshot = None
+
+
+def _before_flush(session, flush_context, instances):
+    for obj in session.dirty:
+        if not isinstance(obj, Order) or not session.is_modified(obj, include_collections=False):
+            continue
+        if not inspect(obj).attrs.snapshot.history.has_changes():
+            obj.snapshot = None
+
+
+def init_app(app):
+    global _listeners_registered
+    order_cache.maxsize = app.config.get('ORDER_CACHE_MAX_ENTRIES', 1024)
+    order_cache.ttl = app.config.get('ORDER_CACHE_TTL', 300)
+    if _listeners_registered:
+        return
+    event.listen(Session, 'before_flush', _before_flush)
+    _listeners_registered = True
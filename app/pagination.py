@@ -0,0 +1,141 @@
+"""
+Pagination with a configurable total-count strategy per endpoint.
+
+Strategies (PAGINATION_COUNT_STRATEGIES maps endpoint -> strategy):
+
+    exact     COUNT(*) over the filtered set on every request
+    cached    COUNT(*) cached per filter signature for PAGINATION_COUNT_TTL,
+              still reported as exact
+    estimate  query planner row estimate (PostgreSQL); small estimates and
+              other databases fall back to an exact or cached count
+
+One extra row is fetched with every page, so has_next is always exact and
+the count is skipped entirely when the last page is reached. Responses
+report whether the total is exact via `total_is_exact`.
+"""
+
+import json
+import logging
+import math
+from flask import current_app
+from app import db
+from app.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+count_cache = TTLCache(maxsize=1024, ttl=60)
+
+
+class Page:
+    """Subset of Flask-SQLAlchemy's Pagination used by the routes"""
+
+    def __init__(self, items, page, per_page, total, total_is_exact, has_next):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.total_is_exact = total_is_exact
+        self.has_next = has_next
+
+    @property
+    def pages(self):
+        if not self.total:
+            return 0
+        return math.ceil(self.total / self.per_page)
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    def to_dict(self):
+        return {
+            'page': self.page,
+            'pages': self.pages,
+            'per_page': self.per_page,
+            'total': self.total,
+            'total_is_exact': self.total_is_exact,
+            'has_next': self.has_next,
+            'has_prev': self.has_prev
+        }
+
+
+def count_signature(endpoint, count_query):
+    compiled = count_query.statement.compile(dialect=db.engine.dialect)
+    return (endpoint, str(compiled), repr(sorted(compiled.params.items())))
+
+
+def exact_count(count_query):
+    return count_query.count()
+
+
+def cached_count(endpoint, count_query):
+    """Return (total, is_exact) using the count cache
+
+    Entries keep the exactness of the count they came from, so a cached
+    COUNT(*) is reported as exact on every hit.
+    """
+    key = count_signature(endpoint, count_query)
+    cached = count_cache.get(key)
+    if cached is not None:
+        return cached
+    result = exact_count(count_query), True
+    count_cache.set(key, result, current_app.config.get('PAGINATION_COUNT_TTL', 60))
+    return result
+
+
+def estimated_count(count_query):
+    """Planner row estimate, or None when the database cannot provide one"""
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    try:
+        sql = count_query.statement.compile(
+            dialect=db.engine.dialect,
+            compile_kwargs={'literal_binds': True}
+        )
+        plan = db.session.connection().exec_driver_sql(
+            f'EXPLAIN (FORMAT JSON) {sql}'
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    except Exception:
+        logger.warning('Could not estimate row count for pagination', exc_info=True)
+        return None
+
+
+def paginate(query, page, per_page, endpoint):
+    """Paginate a query using the endpoint's configured count strategy"""
+    page = max(page, 1)
+    per_page = max(per_page, 1)
+    offset = (page - 1) * per_page
+
+    rows = query.limit(per_page + 1).offset(offset).all()
+    has_next = len(rows) > per_page
+    items = rows[:per_page]
+
+    # On the last page the total follows from the offset
+    if not has_next and (items or page == 1):
+        return Page(items, page, per_page, offset + len(items), True, has_next)
+
+    strategy = current_app.config.get('PAGINATION_COUNT_STRATEGIES', {}).get(endpoint, 'exact')
+    count_query = query.order_by(None)
+
+    if strategy == 'estimate':
+        total = estimated_count(count_query)
+        if total is None:
+            total, is_exact = cached_count(endpoint, count_query)
+        elif total < current_app.config.get('PAGINATION_ESTIMATE_THRESHOLD', 1000):
+            total, is_exact = exact_count(count_query), True
+        else:
+            is_exact = False
+    elif strategy == 'cached':
+        total, is_exact = cached_count(endpoint, count_query)
+    else:
+        total, is_exact = exact_count(count_query), True
+
+    # Keep inexact totals consistent with the rows actually seen
+    minimum = offset + len(items) + (1 if has_next else 0) if items else 0
+    if total < minimum:
+        total, is_exact = minimum, False
+
+    return Page(items, page, per_page, total, is_exact, has_next)
@@ -0,0 +1,252 @@
+"""
+Tax and shipping pricing shared by checkout, the cart and shipping quotes.
+
+TaxRate and ShippingRule rows are compiled into in-memory lookup tables on
+first use:
+
+- tax rates keyed by (country, state), falling back to (country, None),
+  then (None, None), then DEFAULT_TAX_RATE;
+- shipping rules grouped by country and method, sorted by priority, with
+  rules for any country (None) checked after the country's own. The first
+  rule whose weight and subtotal tiers match prices the method. A method
+  no rule covers is priced by the built-in rates (default_shipping_cost).
+
+quote() prices a whole order in one pass over its lines without touching
+the database. A committed change to either table drops the compiled tables
+in this worker; the others pick it up within PRICING_CACHE_TTL seconds.
+
+With empty tables every order is charged DEFAULT_TAX_RATE tax and offered
+standard and express shipping at the built-in rates the shipping quote has
+always shown.
+"""
+
+import threading
+import time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import ShippingRule, TaxRate
+
+CENT = Decimal('0.01')
+SHIPPING_METHODS = {
+    'standard': {'name': 'Standard Shipping', 'description': 'Standard delivery', 'estimated_days': '5-7'},
+    'express': {'name': 'Express Shipping', 'description': 'Fast delivery', 'estimated_days': '1-2'}
+}
+
+_tables = None
+_loaded_at = 0
+_lock = threading.Lock()
+_listeners_registered = False
+
+
+class PricingError(Exception):
+    """The order cannot be priced, e.g. the shipping method is unavailable"""
+
+
+def money(amount):
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def normalize(code):
+    return code.strip().upper() if code else None
+
+
+def parse_amount(value):
+    """Non-negative Decimal from request data, or None if it is not one"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    return value if value.is_finite() and value >= 0 else None
+
+
+def default_shipping_cost(method, country, weight, subtotal):
+    """Built-in cost of a method no rule covers
+
+    DEFAULT_SHIPPING_COST plus $2/kg over 5 kg, free over $100 and $15 more
+    outside the US; express costs double, or $25 when standard is free.
+    """
+    cost = Decimal(current_app.config.get('DEFAULT_SHIPPING_COST', '10.00'))
+    if weight > 5:
+        cost += (weight - 5) * 2
+    if subtotal > 100:
+        cost = Decimal('0')
+    if normalize(country) != 'US':
+        cost += 15
+    if method == 'express':
+        return cost * 2 if cost > 0 else Decimal('25')
+    return cost
+
+
+def shipping_option(method, name, cost, estimated_days):
+    details = SHIPPING_METHODS[method]
+    return {
+        'method': method,
+        'name': name or details['name'],
+        'cost': money(cost),
+        'estimated_days': estimated_days or details['estimated_days'],
+        'description': details['description']
+    }
+
+
+class PricingTables:
+    """Tax rates and shipping rules compiled for lookups"""
+
+    def __init__(self, tax_rates, shipping_rules):
+        self.tax = {
+            (normalize(rate.country), normalize(rate.state)): rate.rate
+            for rate in tax_rates
+        }
+        self.shipping = {}
+        for rule in sorted(shipping_rules, key=lambda rule: (rule.priority, rule.id)):
+            self.shipping.setdefault(normalize(rule.country), {}).setdefault(rule.method, []).append((
+                rule.min_weight or Decimal('0'), rule.max_weight,
+                rule.min_subtotal or Decimal('0'), rule.max_subtotal,
+                rule.base_cost or Decimal('0'), rule.cost_per_kg or Decimal('0'),
+                rule.name, rule.estimated_days
+            ))
+
+    def tax_rate(self, country, state):
+        country, state = normalize(country), normalize(state)
+        for key in ((country, state), (country, None), (None, None)):
+            if key in self.tax:
+                return self.tax[key]
+        return Decimal(current_app.config.get('DEFAULT_TAX_RATE', '0.10'))
+
+    def shipping_option(self, method, country, weight, subtotal):
+        """Price one method, or None when no rule covers the order"""
+        for rules in (self.shipping.get(normalize(country), {}), self.shipping.get(None, {})):
+            for min_weight, max_weight, min_subtotal, max_subtotal, base, per_kg, name, days in rules.get(method, ()):
+                if weight < min_weight or (max_weight is not None and weight >= max_weight):
+                    continue
+                if subtotal < min_subtotal or (max_subtotal is not None and subtotal >= max_subtotal):
+                    continue
+                return shipping_option(method, name, base + per_kg * (weight - min_weight), days)
+        if method in SHIPPING_METHODS:
+            return shipping_option(method, None, default_shipping_cost(method, country, weight, subtotal), None)
+        return None
+
+    def shipping_options(self, country, weight, subtotal):
+        options = []
+        for method in SHIPPING_METHODS:
+            option = self.shipping_option(method, country, weight, subtotal)
+            if option:
+                options.append(option)
+        return options
+
+
+def get_tables():
+    """Compiled pricing tables, reloaded after a change or PRICING_CACHE_TTL"""
+    global _tables, _loaded_at
+    ttl = current_app.config.get('PRICING_CACHE_TTL', 300)
+    tables = _tables
+    if tables is not None and time.monotonic() - _loaded_at < ttl:
+        return tables
+    with _lock:
+        if _tables is None or time.monotonic() - _loaded_at >= ttl:
+            _tables = PricingTables(
+                TaxRate.query.filter_by(is_active=True).all(),
+                ShippingRule.query.filter_by(is_active=True).all()
+            )
+            _loaded_at = time.monotonic()
+        return _tables
+
+
+def invalidate():
+    global _tables
+    _tables = None
+
+
+def _after_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (TaxRate, ShippingRule)):
+            session.info['pricing_changed'] = True
+            return
+
+
+def _after_commit(session):
+    if session.info.pop('pricing_changed', False):
+        invalidate()
+
+
+def _after_rollback(session):
+    session.info.pop('pricing_changed', None)
+
+
+def init_app(app):
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _listeners_registered = True
+
+
+def measure(lines):
+    """Subtotal, shipping weight and whether anything ships, for (product, quantity) lines"""
+    subtotal = Decimal('0')
+    weight = Decimal('0')
+    ships = False
+    for product, quantity in lines:
+        subtotal += product.price * quantity
+        if product.requires_shipping and not product.is_digital:
+            ships = True
+            weight += (product.weight or Decimal('0')) * quantity
+    return subtotal, weight, ships
+
+
+class Quote:
+    """Priced order totals"""
+
+    def __init__(self, subtotal, discount_amount, tax_rate, tax_amount, shipping):
+        self.subtotal = money(subtotal)
+        self.discount_amount = money(discount_amount)
+        self.tax_rate = tax_rate
+        self.tax_amount = tax_amount
+        self.shipping = shipping
+        self.shipping_amount = shipping['cost'] if shipping else Decimal('0.00')
+        self.total_amount = self.subtotal - self.discount_amount + self.tax_amount + self.shipping_amount
+
+    def as_dict(self):
+        return {
+            'subtotal': float(self.subtotal),
+            'discount_amount': float(self.discount_amount),
+            'tax_rate': float(self.tax_rate),
+            'tax_amount': float(self.tax_amount),
+            'shipping_method': self.shipping['method'] if self.shipping else None,
+            'shipping_amount': float(self.shipping_amount),
+            'total_amount': float(self.total_amount)
+        }
+
+
+def quote(lines, country=None, state=None, method='standard', discount=Decimal('0')):
+    """Price (product, quantity) lines for a destination; raises PricingError"""
+    return quote_measures(measure(lines), country, state, method, discount)
+
+
+def quote_measures(measures, country=None, state=None, method='standard', discount=Decimal('0')):
+    """Same as quote, from the (subtotal, weight, ships) that measure returns"""
+    tables = get_tables()
+    subtotal, weight, ships = measures
+
+    shipping = None
+    if ships:
+        shipping = tables.shipping_option(method, country, weight, subtotal)
+        if shipping is None:
+            raise PricingError(f'Shipping method {method} is not available for this address')
+
+    rate = tables.tax_rate(country, state)
+    tax_amount = money((subtotal - discount) * rate)
+    return Quote(subtotal, discount, rate, tax_amount, shipping)
+
+
+def shipping_options(lines, country):
+    """All shipping methods available for (product, quantity) lines"""
+    subtotal, weight, ships = measure(lines)
+    if not ships:
+        return []
+    return get_tables().shipping_options(country, weight, subtotal)
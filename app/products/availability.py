@@ -0,0 +1,110 @@
+"""
+Stock availability served from an in-process counter cache.
+
+stock_cache holds (stock_quantity, reserved_quantity, low_stock_threshold,
+is_active) per product. Products missing from it are read with a single
+IN query and cached. Stock changes evict the affected products once their
+transaction commits:
+
+- ORM changes to a product's stock columns (orders, cancellations,
+  update_stock, product edits) are detected after each flush;
+- bulk UPDATEs (inventory holds, conditional decrements) call
+  mark_stock_changed(). Those that change stock_quantity, which catalog
+  responses show, also invalidate the catalog; holds only move
+  reserved_quantity, so adding to a cart leaves cached listings alone.
+
+Every worker has its own cache, so entries also expire after
+STOCK_CACHE_TTL seconds to bound staleness across workers.
+"""
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app import db
+from app.cache import TTLCache, mark_catalog_changed
+from app.models import Product
+
+STOCK_FIELDS = ('stock_quantity', 'reserved_quantity', 'low_stock_threshold', 'is_active')
+
+stock_cache = TTLCache(maxsize=10000, ttl=30)
+
+_listeners_registered = False
+
+
+def mark_stock_changed(product_ids, session=None, listed=False):
+    """Evict products from the stock cache when the current transaction commits
+
+    Pass listed=True when stock_quantity changed, to invalidate the catalog too.
+    """
+    session = session or db.session()
+    session.info.setdefault('stock_changed', set()).update(product_ids)
+    if listed:
+        mark_catalog_changed(session)
+
+
+def _after_flush(session, flush_context):
+    changed = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Product) or obj.id is None:
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not any(
+            state.attrs[field].history.has_changes() for field in STOCK_FIELDS
+        ):
+            continue
+        changed.add(obj.id)
+    if changed:
+        mark_stock_changed(changed, session)
+
+
+def _after_commit(session):
+    for product_id in session.info.pop('stock_changed', ()):
+        stock_cache.delete(product_id)
+
+
+def _after_rollback(session):
+    session.info.pop('stock_changed', None)
+
+
+def init_app(app):
+    global _listeners_registered
+    stock_cache.maxsize = app.config.get('STOCK_CACHE_MAX_ENTRIES', 10000)
+    stock_cache.ttl = app.config.get('STOCK_CACHE_TTL', 30)
+    if _listeners_registered:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _listeners_registered = True
+
+
+def get_stock_levels(product_ids):
+    """Return {product_id: (stock, reserved, low_stock_threshold, is_active)}"""
+    levels = {}
+    missing = []
+    for product_id in product_ids:
+        level = stock_cache.get(product_id)
+        if level is None:
+            missing.append(product_id)
+        else:
+            levels[product_id] = level
+
+    if missing:
+        rows = db.session.query(
+            Product.id, *(getattr(Product, field) for field in STOCK_FIELDS)
+        ).filter(Product.id.in_(missing)).all()
+        for product_id, *level in rows:
+            levels[product_id] = tuple(level)
+            stock_cache.set(product_id, tuple(level))
+
+    return levels
+
+
+def serialize_availability(product_id, level):
+    stock, reserved, low_stock_threshold, is_active = level
+    available = max(stock - (reserved or 0), 0) if is_active else 0
+    return {
+        'product_id': product_id,
+        'available_quantity': available,
+        'is_in_stock': available > 0,
+        'is_low_stock': 0 < available <= (low_stock_threshold or 0)
+    }
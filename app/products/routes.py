@@ -1,13 +1,21 @@
 from flask import request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime, timezone
-from sqlalchemy import or_, and_
+from sqlalchemy import or_
 from app.products import bp
+from app.products.search import (
+    search_analytics, normalize_query, build_search_query, load_products_by_ids
+)
+from app.products.availability import get_stock_levels, serialize_availability
 from app.products.schemas import (
     ProductCreateSchema, ProductUpdateSchema,
-    ProductListSchema, ProductDetailSchema,ProductImageSchema
+    ProductListSchema, ProductDetailSchema,ProductImageSchema,
+    LocalizedProductListSchema, LocalizedProductDetailSchema
 )
 from app.models import Product, Category, Tag, User, UserRole, ProductImage
+from app.i18n import get_request_language, localize_query, localized_column
+from app.cache import cached_response, get_catalog_version
+from app.pagination import paginate
 from app import db
 import re
 
@@ -33,6 +41,18 @@ def generate_slug(text):
     return slug
 
 
+def list_schema(lang):
+    if lang:
+        return LocalizedProductListSchema(context={'lang': lang})
+    return ProductListSchema()
+
+
+def detail_schema(lang):
+    if lang:
+        return LocalizedProductDetailSchema(context={'lang': lang})
+    return ProductDetailSchema()
+
+
 def build_product_query(args):
     query = Product.query.filter_by(is_active=True)
 
@@ -83,6 +103,7 @@ def build_product_query(args):
 # ----------------- Routes -----------------
 
 @bp.route('', methods=['GET'])
+@cached_response(catalog=True)
 def get_products():
     args = request.args
     page = args.get('page', 1, type=int)
@@ -92,12 +113,13 @@ def get_products():
     )
     sort_by = args.get('sort_by', 'created_at')
     sort_order = args.get('sort_order', 'desc')
+    lang = get_request_language()
 
-    query = build_product_query(args)
+    query = localize_query(build_product_query(args), Product, lang)
 
     sort_column = {
         'price': Product.price,
-        'name': Product.name,
+        'name': localized_column(Product, 'name', lang),
         'created_at': Product.created_at
     }.get(sort_by, Product.created_at)
 
@@ -105,20 +127,13 @@ def get_products():
         sort_column.desc() if sort_order == 'desc' else sort_column.asc()
     )
 
-    products = query.paginate(page=page, per_page=per_page, error_out=False)
-    schema = ProductListSchema()
+    products = paginate(query, page, per_page, 'products')
+    schema = list_schema(lang)
 
     return jsonify({
         'message': 'Products retrieved successfully',
         'data': schema.dump(products.items, many=True),
-        'pagination': {
-            'page': products.page,
-            'pages': products.pages,
-            'per_page': products.per_page,
-            'total': products.total,
-            'has_next': products.has_next,
-            'has_prev': products.has_prev
-        },
+        'pagination': products.to_dict(),
         'filters': {
             key: args.get(key)
             for key in [
@@ -131,52 +146,78 @@ def get_products():
 
 @bp.route('/<int:product_id>', methods=['GET'])
 def get_product(product_id):
-    product = Product.query.filter_by(id=product_id, is_active=True).first()
+    lang = get_request_language()
+    product = localize_query(Product.query, Product, lang).filter_by(id=product_id, is_active=True).first()
     if not product:
         return jsonify({'error': 'Product not found'}), 404
-    schema = ProductDetailSchema()
+    schema = detail_schema(lang)
     return jsonify({'message': 'Product retrieved successfully', 'data': schema.dump(product)}), 200
 
 
 @bp.route('/slug/<slug>', methods=['GET'])
 def get_product_by_slug(slug):
-    product = Product.query.filter_by(slug=slug, is_active=True).first()
+    lang = get_request_language()
+    product = localize_query(Product.query, Product, lang).filter_by(slug=slug, is_active=True).first()
     if not product:
         return jsonify({'error': 'Product not found'}), 404
-    schema = ProductDetailSchema()
+    schema = detail_schema(lang)
     return jsonify({'message': 'Product retrieved successfully', 'data': schema.dump(product)}), 200
 
 
 @bp.route('/search', methods=['GET'])
 def search_products():
-    query_text = request.args.get('q', '').strip()
+    raw_query = request.args.get('q', '').strip()
+    query_text = normalize_query(raw_query)
     if not query_text:
         return jsonify({'error': 'Search query is required'}), 400
+    lang = get_request_language()
 
-    search_filter = or_(
-        Product.name.ilike(f"%{query_text}%"),
-        Product.nameAr.ilike(f"%{query_text}%"),
-        Product.description.ilike(f"%{query_text}%"),
-        Product.descriptionAr.ilike(f"%{query_text}%"),
-        Product.short_description.ilike(f"%{query_text}%"),
-        Product.short_descriptionAr.ilike(f"%{query_text}%"),
-        Product.sku.ilike(f"%{query_text}%"),
-        Product.tags.any(Tag.name.ilike(f"%{query_text}%"))
-    )
+    product_ids = search_analytics.get_cached_ids(query_text)
+    if product_ids is None:
+        catalog_version = get_catalog_version()
+        products = localize_query(build_search_query(query_text), Product, lang).all()
+        search_analytics.cache_result(query_text, [product.id for product in products], catalog_version)
+    else:
+        products = load_products_by_ids(product_ids, lang)
 
-    products = Product.query.filter(
-        and_(Product.is_active == True, search_filter)
-    ).order_by(Product.created_at.desc()).limit(20).all()
+    search_analytics.record(query_text, len(products))
 
-    schema = ProductListSchema()
+    schema = list_schema(lang)
     return jsonify({
         'message': 'Search completed successfully',
         'data': schema.dump(products, many=True),
-        'query': query_text,
+        'query': raw_query,
         'count': len(products)
     }), 200
 
 
+@bp.route('/availability', methods=['GET'])
+def get_availability():
+    """Stock availability for many products, e.g. ?ids=1,2,3"""
+    try:
+        product_ids = list(dict.fromkeys(
+            int(value) for value in request.args.get('ids', '').split(',') if value.strip()
+        ))
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of product IDs'}), 400
+
+    if not product_ids:
+        return jsonify({'error': 'ids is required'}), 400
+    max_ids = current_app.config.get('AVAILABILITY_MAX_IDS', 100)
+    if len(product_ids) > max_ids:
+        return jsonify({'error': f'At most {max_ids} product IDs are allowed'}), 400
+
+    levels = get_stock_levels(product_ids)
+    return jsonify({
+        'message': 'Availability retrieved successfully',
+        'data': [
+            serialize_availability(product_id, levels[product_id])
+            for product_id in product_ids if product_id in levels
+        ],
+        'not_found': [product_id for product_id in product_ids if product_id not in levels]
+    }), 200
+
+
 @bp.route('', methods=['POST'])
 @jwt_required()
 @require_admin()
@@ -1,5 +1,6 @@
 from marshmallow import Schema, fields, validate, validates, ValidationError
 from app.models import Product
+from app.i18n import localized_value
 from marshmallow import Schema, fields, validate
 
 class ProductImageSchema(Schema):
@@ -185,3 +186,43 @@ class ProductDetailSchema(Schema):
     
     def get_review_count(self, obj):
         return obj.get_review_count()
+
+
+class LocalizedProductListSchema(ProductListSchema):
+    """Single-language listing; expects a query built with localize_query"""
+    name = fields.Str(attribute='localized_name')
+    description = fields.Str(attribute='localized_description')
+    short_description = fields.Str(attribute='localized_short_description')
+    
+    class Meta:
+        exclude = ('nameAr', 'descriptionAr', 'short_descriptionAr')
+    
+    def get_category(self, obj):
+        if obj.category:
+            lang = self.context.get('lang')
+            return {
+                'id': obj.category.id,
+                'name': localized_value(obj.category, 'name', lang),
+                'slug': obj.category.slug
+            }
+        return None
+
+class LocalizedProductDetailSchema(ProductDetailSchema):
+    """Single-language detail; expects a query built with localize_query"""
+    name = fields.Str(attribute='localized_name')
+    description = fields.Str(attribute='localized_description')
+    short_description = fields.Str(attribute='localized_short_description')
+    
+    class Meta:
+        exclude = ('nameAr', 'descriptionAr', 'short_descriptionAr')
+    
+    def get_category(self, obj):
+        if obj.category:
+            lang = self.context.get('lang')
+            return {
+                'id': obj.category.id,
+                'name': localized_value(obj.category, 'name', lang),
+                'slug': obj.category.slug,
+                'description': localized_value(obj.category, 'description', lang)
+            }
+        return None
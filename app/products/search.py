@@ -0,0 +1,225 @@
+"""
+Search query analytics and hot-query result caching.
+
+Searches are recorded into a bounded in-memory buffer without touching the
+database. A background thread per worker aggregates the buffer, writes the
+counts to SearchQueryStat and refreshes the set of hot (most searched)
+queries. Hot queries have their result ID lists cached until the catalog
+changes, after which they are recomputed in the background. A result is
+only cached if the catalog version it was read at is still current, so a
+search racing an invalidation cannot store a stale result.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.cache import TTLCache, get_catalog_version, on_catalog_change
+from app.i18n import localize_query
+from app.models import Product, Tag, SearchQueryStat
+
+logger = logging.getLogger(__name__)
+
+SEARCH_RESULT_LIMIT = 20
+MAX_QUERY_LENGTH = 200
+
+
+def normalize_query(text):
+    """Collapse whitespace and case so equivalent queries share stats and cache entries"""
+    return ' '.join(text.split()).lower()[:MAX_QUERY_LENGTH]
+
+
+def build_search_query(query_text):
+    """Build the product search query for normalized query text"""
+    pattern = f"%{query_text}%"
+    search_filter = or_(
+        Product.name.ilike(pattern),
+        Product.nameAr.ilike(pattern),
+        Product.description.ilike(pattern),
+        Product.descriptionAr.ilike(pattern),
+        Product.short_description.ilike(pattern),
+        Product.short_descriptionAr.ilike(pattern),
+        Product.sku.ilike(pattern),
+        Product.tags.any(Tag.name.ilike(pattern))
+    )
+
+    return Product.query.filter(
+        and_(Product.is_active == True, search_filter)
+    ).order_by(Product.created_at.desc()).limit(SEARCH_RESULT_LIMIT)
+
+
+def load_products_by_ids(product_ids, lang=None):
+    """Load active products keeping the order of product_ids"""
+    if not product_ids:
+        return []
+    products = localize_query(Product.query, Product, lang).filter(
+        Product.id.in_(product_ids), Product.is_active == True
+    ).all()
+    position = {product_id: index for index, product_id in enumerate(product_ids)}
+    return sorted(products, key=lambda product: position[product.id])
+
+
+class SearchAnalytics:
+    """Buffered search logger and hot-query result cache"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.flush_interval = 30
+        self.hot_limit = 100
+        self.hot_queries = frozenset()
+        self.results = TTLCache()
+        self.dropped = 0
+        self._queue = None
+        self._buffer_size = 10000
+        self._carry = {}
+        self._thread = None
+        self._pid = None
+        self._needs_warm = False
+        self._flush_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('SEARCH_ANALYTICS_ENABLED', True)
+        self.flush_interval = app.config.get('SEARCH_ANALYTICS_FLUSH_INTERVAL', 30)
+        self.hot_limit = app.config.get('SEARCH_HOT_QUERY_LIMIT', 100)
+        self._buffer_size = app.config.get('SEARCH_ANALYTICS_BUFFER_SIZE', 10000)
+        self._queue = queue.Queue(maxsize=self._buffer_size)
+        self.results = TTLCache(
+            maxsize=self.hot_limit,
+            ttl=app.config.get('SEARCH_CACHE_TTL', 300)
+        )
+        on_catalog_change(self._on_catalog_change)
+
+    # ----------------- Request path -----------------
+
+    def record(self, query_text, result_count):
+        """Buffer a search event; never blocks the request"""
+        if not self.enabled:
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((query_text, result_count, datetime.now(timezone.utc)))
+        except queue.Full:
+            self.dropped += 1
+
+    def get_cached_ids(self, query_text):
+        return self.results.get(query_text)
+
+    def cache_result(self, query_text, product_ids, catalog_version):
+        """Cache a hot query's result, read at catalog_version, unless the catalog changed since"""
+        if query_text not in self.hot_queries or get_catalog_version() != catalog_version:
+            return
+        self.results.set(query_text, product_ids)
+        # An invalidation between the check and the set has already cleared the cache
+        if get_catalog_version() != catalog_version:
+            self.results.delete(query_text)
+
+    def buffered(self):
+        """Searches recorded in this worker and not yet written"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # ----------------- Background flushing -----------------
+
+    def flush(self):
+        """Write buffered searches to the database and refresh hot queries"""
+        with self._flush_lock:
+            pending = self._drain()
+            if pending:
+                self._write(pending)
+            self._refresh_hot_queries()
+            if self._needs_warm:
+                self._needs_warm = False
+                self._warm()
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._flush_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._queue = queue.Queue(maxsize=self._buffer_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='search-analytics', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception('Failed to flush search analytics')
+
+    def _drain(self):
+        pending, self._carry = self._carry, {}
+        while True:
+            try:
+                query_text, result_count, searched_at = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            stat = pending.setdefault(query_text, {
+                'count': 0,
+                'zero': 0,
+                'last_result_count': result_count,
+                'last_searched_at': searched_at
+            })
+            stat['count'] += 1
+            stat['zero'] += 1 if result_count == 0 else 0
+            stat['last_result_count'] = result_count
+            stat['last_searched_at'] = searched_at
+        return pending
+
+    def _write(self, pending):
+        try:
+            for query_text, stat in pending.items():
+                updated = SearchQueryStat.query.filter_by(query_text=query_text).update({
+                    SearchQueryStat.search_count: SearchQueryStat.search_count + stat['count'],
+                    SearchQueryStat.zero_result_count: SearchQueryStat.zero_result_count + stat['zero'],
+                    SearchQueryStat.last_result_count: stat['last_result_count'],
+                    SearchQueryStat.last_searched_at: stat['last_searched_at']
+                }, synchronize_session=False)
+                if not updated:
+                    db.session.add(SearchQueryStat(
+                        query_text=query_text,
+                        search_count=stat['count'],
+                        zero_result_count=stat['zero'],
+                        last_result_count=stat['last_result_count'],
+                        last_searched_at=stat['last_searched_at']
+                    ))
+            db.session.commit()
+        except SQLAlchemyError:
+            # Another worker may have inserted the same query; retry next cycle
+            db.session.rollback()
+            self._carry = pending
+            logger.warning('Search analytics flush failed, retrying %d queries later', len(pending))
+
+    def _refresh_hot_queries(self):
+        rows = db.session.query(SearchQueryStat.query_text).order_by(
+            SearchQueryStat.search_count.desc()
+        ).limit(self.hot_limit).all()
+        self.hot_queries = frozenset(row.query_text for row in rows)
+
+    def _warm(self):
+        for query_text in self.hot_queries:
+            if self.results.get(query_text) is None:
+                catalog_version = get_catalog_version()
+                rows = build_search_query(query_text).with_entities(Product.id).all()
+                self.cache_result(query_text, [row.id for row in rows], catalog_version)
+
+    def _on_catalog_change(self):
+        self.results.clear()
+        self._needs_warm = True
+
+
+search_analytics = SearchAnalytics()
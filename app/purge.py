@@ -0,0 +1,78 @@
+"""
+Batched purge of abandoned carts and expired rows.
+
+Each batch selects at most PURGE_BATCH_SIZE ids through an index
+(Cart.updated_at, InventoryReservation.expires_at, IdempotencyKey.expires_at,
+Job status and run_at), deletes them by primary key and commits, so no
+statement scans or locks a large part of a table. On PostgreSQL rows
+locked by live requests are skipped and picked up by the next run. Run `flask purge` from cron.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from app import db, inventory
+from app.idempotency import purge_expired_keys
+from app.jobs import purge_finished_jobs
+from app.models import Cart, CartItem
+
+
+def purge_abandoned_carts(max_age_days=None, batch_size=None, pause=0):
+    """Delete carts idle for more than max_age_days in batches; returns stats"""
+    max_age_days = max_age_days or current_app.config.get('CART_ABANDONED_AFTER_DAYS', 30)
+    batch_size = batch_size or current_app.config.get('PURGE_BATCH_SIZE', 500)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+    stats = {'carts': 0, 'items': 0, 'batches': 0}
+    start = time.perf_counter()
+
+    while True:
+        query = db.session.query(Cart.id).filter(
+            Cart.updated_at < cutoff
+        ).order_by(Cart.updated_at).limit(batch_size)
+        if db.session.get_bind().dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        cart_ids = [row.id for row in query.all()]
+        if not cart_ids:
+            db.session.rollback()
+            break
+
+        stats['items'] += CartItem.query.filter(
+            CartItem.cart_id.in_(cart_ids)
+        ).delete(synchronize_session=False)
+        stats['carts'] += Cart.query.filter(
+            Cart.id.in_(cart_ids)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        stats['batches'] += 1
+
+        if len(cart_ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def purge_expired_reservations(batch_size=None):
+    """Release expired inventory holds in batches; returns stats"""
+    start = time.perf_counter()
+    released = inventory.release_expired(
+        batch_size=batch_size or current_app.config.get('PURGE_BATCH_SIZE', 500),
+        commit=True
+    )
+    return {'reservations': released, 'seconds': time.perf_counter() - start}
+
+
+def purge_expired_idempotency_keys(batch_size=None):
+    """Delete expired Idempotency-Key records in batches; returns stats"""
+    start = time.perf_counter()
+    deleted = purge_expired_keys(batch_size or current_app.config.get('PURGE_BATCH_SIZE', 500))
+    return {'idempotency_keys': deleted, 'seconds': time.perf_counter() - start}
+
+
+def purge_completed_jobs(batch_size=None):
+    """Delete completed background jobs past their retention in batches; returns stats"""
+    start = time.perf_counter()
+    deleted = purge_finished_jobs(batch_size=batch_size or current_app.config.get('PURGE_BATCH_SIZE', 500))
+    return {'jobs': deleted, 'seconds': time.perf_counter() - start}
@@ -0,0 +1,140 @@
+"""
+In-place upgrade of databases created from older versions of the models.
+
+db.create_all() creates missing tables but never alters existing ones, so
+columns, indexes and unique constraints added to existing tables since
+(Product.reserved_quantity, CartItem.unit_price and its (cart_id,
+product_id) constraint, the unique Cart.user_id and the Cart.updated_at
+index, Order.item_count, coupon_code and snapshot, the nullable
+Order.user_id for guest orders) are applied here by comparing the models
+with the live schema. Every step checks first, so the upgrade is safe to
+run repeatedly. Run `flask schema upgrade` after deploying a new version.
+"""
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import delete, func, inspect, literal, select, text, update
+from app import db
+from app.models import Cart, CartItem, Order
+from app.orders.services import backfill_item_counts
+
+
+def column_default(column, dialect):
+    """Server default used to fill existing rows of a NOT NULL column"""
+    if column.server_default is not None:
+        return column.server_default.arg
+    if column.default is None or not column.default.is_scalar:
+        raise RuntimeError(f'{column.table.name}.{column.name} is NOT NULL without a scalar default')
+    value = literal(column.default.arg, column.type)
+    return text(str(value.compile(dialect=dialect, compile_kwargs={'literal_binds': True})))
+
+
+def add_missing_columns(op, inspector, table):
+    existing = {column['name'] for column in inspector.get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        server_default = None if column.nullable else column_default(column, op.get_bind().dialect)
+        op.add_column(table.name, db.Column(
+            column.name, column.type, nullable=column.nullable, server_default=server_default
+        ))
+        added.append(column.name)
+    return added
+
+
+def drop_not_null(op, inspector, table):
+    """Make columns nullable that the models no longer require"""
+    required = {column['name'] for column in inspector.get_columns(table.name) if not column['nullable']}
+    relaxed = [
+        column for column in table.columns
+        if column.nullable and not column.primary_key and column.name in required
+    ]
+    if relaxed:
+        # SQLite cannot alter a column, so batch mode rebuilds the table there
+        with op.batch_alter_table(table.name) as batch:
+            for column in relaxed:
+                batch.alter_column(column.name, existing_type=column.type, nullable=True)
+    return [column.name for column in relaxed]
+
+
+def drop_duplicate_carts(connection):
+    """Keep each user's oldest cart, the one older versions read, and delete the rest"""
+    keep = select(func.min(Cart.id)).group_by(Cart.user_id)
+    connection.execute(delete(CartItem).where(CartItem.cart_id.not_in(keep)))
+    connection.execute(delete(Cart).where(Cart.id.not_in(keep)))
+
+
+def merge_duplicate_cart_items(connection):
+    """Fold repeated (cart_id, product_id) lines into the oldest one"""
+    duplicates = connection.execute(
+        select(CartItem.cart_id, CartItem.product_id, func.min(CartItem.id), func.sum(CartItem.quantity))
+        .group_by(CartItem.cart_id, CartItem.product_id)
+        .having(func.count() > 1)
+    ).all()
+    for cart_id, product_id, keep_id, quantity in duplicates:
+        connection.execute(update(CartItem).where(CartItem.id == keep_id).values(quantity=quantity))
+        connection.execute(delete(CartItem).where(
+            CartItem.cart_id == cart_id, CartItem.product_id == product_id, CartItem.id != keep_id
+        ))
+
+
+# Rows older versions could duplicate, cleared before a unique constraint is added
+DEDUPLICATE = {
+    Cart.__tablename__: drop_duplicate_carts,
+    CartItem.__tablename__: merge_duplicate_cart_items
+}
+
+
+def unique_column_sets(table):
+    """(name, columns) of the table's unique constraints not backed by a model index"""
+    for constraint in table.constraints:
+        if isinstance(constraint, db.UniqueConstraint):
+            columns = tuple(column.name for column in constraint.columns)
+            yield constraint.name or f'uq_{table.name}_{"_".join(columns)}', columns
+
+
+def add_unique_constraints(op, inspector, table):
+    """Create missing unique constraints as unique indexes, which any dialect can add in place"""
+    existing = {
+        tuple(constraint['column_names']) for constraint in inspector.get_unique_constraints(table.name)
+    } | {
+        tuple(index['column_names']) for index in inspector.get_indexes(table.name) if index['unique']
+    }
+    added = []
+    for name, columns in unique_column_sets(table):
+        if columns in existing:
+            continue
+        if table.name in DEDUPLICATE:
+            DEDUPLICATE[table.name](op.get_bind())
+        op.create_index(name, table.name, list(columns), unique=True)
+        added.append(name)
+    return added
+
+
+def upgrade():
+    """Bring the database schema up to the models; returns the changes made"""
+    changes = []
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+        op = Operations(MigrationContext.configure(connection))
+
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                table.create(connection)
+                changes.append(f'created table {table.name}')
+                continue
+            changes += [f'added {table.name}.{name}' for name in add_missing_columns(op, inspector, table)]
+            changes += [f'made {table.name}.{name} nullable' for name in drop_not_null(op, inspector, table)]
+            changes += [f'added unique {name}' for name in add_unique_constraints(op, inspector, table)]
+
+            indexes = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    changes.append(f'created index {index.name}')
+
+    if f'added {Order.__tablename__}.item_count' in changes:
+        changes.append(f'backfilled item counts on {backfill_item_counts()} orders')
+    return changes
@@ -2,8 +2,10 @@ from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timezone
 from app.shipping import bp
-from app.models import Address, User
-from app import db
+from app.models import Address, Cart, User
+from app.orders.services import load_checkout_lines
+from app.cart.store import cart_store
+from app import db, pricing
 
 @bp.route('/addresses', methods=['GET'])
 @jwt_required()
@@ -309,47 +311,32 @@ def calculate_shipping():
     if not address:
         return jsonify({'error': 'Address not found'}), 404
     
-    # Simple shipping calculation (make this more sophisticated based on requirements)
-    total_weight = data.get('total_weight', 0)
-    total_value = data.get('total_value', 0)
-    
-    # Base shipping rates
-    base_shipping = 10.00
-    
-    # Add weight-based charges
-    if total_weight > 5:  # kg
-        base_shipping += (total_weight - 5) * 2.00
-    
-    # Free shipping for orders over certain amount
-    if total_value > 100:
-        base_shipping = 0
-    
-    # International shipping
-    if address.country.upper() != 'US':
-        base_shipping += 15.00
-    
-    # Express shipping option
-    express_shipping = base_shipping * 2 if base_shipping > 0 else 25.00
+    # Quote the given weight and value, or the user's cart by default
+    tables = pricing.get_tables()
+    if 'total_weight' in data or 'total_value' in data:
+        total_weight = pricing.parse_amount(data.get('total_weight', 0))
+        total_value = pricing.parse_amount(data.get('total_value', 0))
+        if total_weight is None or total_value is None:
+            return jsonify({'error': 'total_weight and total_value must be non-negative numbers'}), 400
+        options = tables.shipping_options(address.country, total_weight, total_value)
+    else:
+        if cart_store.enabled:
+            cart_store.flush_user(user_id)
+        cart = Cart.query.filter_by(user_id=user_id).first()
+        lines = [(product, item.quantity) for item, product in load_checkout_lines(cart.id)] if cart else []
+        options = pricing.shipping_options(lines, address.country)
     
     shipping_options = [
         {
-            'method': 'standard',
-            'name': 'Standard Shipping',
-            'cost': base_shipping,
-            'estimated_days': '5-7',
-            'description': 'Standard delivery'
+            'method': option['method'],
+            'name': option['name'],
+            'cost': float(option['cost']),
+            'estimated_days': option['estimated_days'],
+            'description': option['description']
         }
+        for option in options
     ]
     
-    if total_value > 50:  # Offer express only for higher value orders
-        shipping_options.append({
-            'method': 'express',
-            'name': 'Express Shipping',
-            'cost': express_shipping,
-            'estimated_days': '1-2',
-            'description': 'Fast delivery'
-        })
-    
     return jsonify({
         'message': 'Shipping calculated successfully',
         'data': {
@@ -358,6 +345,7 @@ def calculate_shipping():
                 'full_address': address.get_full_address(),
                 'country': address.country
             },
-            'shipping_options': shipping_options
+            'shipping_options': shipping_options,
+            'tax_rate': float(tables.tax_rate(address.country, address.state))
         }
     }), 200
@@ -0,0 +1,131 @@
+"""
+Background tasks run by the job queue (app.jobs) after checkout.
+
+enqueue_order_event() is called inside the order or payment transaction
+and queues one job per side effect, so a slow mail server or webhook
+receiver delays only its own job and each is retried on its own:
+
+- send_order_email: confirmation email over SMTP (MAIL_* settings), only
+  queued when MAIL_SERVER is set
+- record_order_event: analytics entry in ActivityLog
+- deliver_webhook: JSON POST to each of WEBHOOK_URLS, signed with
+  WEBHOOK_SECRET
+"""
+
+import hashlib
+import hmac
+import json
+import smtplib
+import urllib.error
+import urllib.request
+from email.message import EmailMessage
+from flask import current_app
+from app import db
+from app.jobs import PermanentJobError, enqueue_many, task
+from app.models import ActivityLog, Order
+
+EMAIL_SUBJECTS = {
+    'order.created': 'We received your order {order_number}',
+    'order.paid': 'Payment received for order {order_number}'
+}
+
+
+def enqueue_order_event(order, event, email=None):
+    """Queue the email, analytics and webhook jobs for an order event in one INSERT"""
+    data = {
+        'order_id': order.id,
+        'order_number': order.order_number,
+        'status': order.status.value,
+        'total_amount': float(order.total_amount),
+        'currency': order.currency
+    }
+    jobs = [('record_order_event', {'order_id': order.id, 'event': event})]
+    if current_app.config.get('MAIL_SERVER'):
+        jobs.append(('send_order_email', {'order_id': order.id, 'event': event, 'to': email}))
+    jobs += [
+        ('deliver_webhook', {'url': url, 'event': event, 'data': data})
+        for url in current_app.config.get('WEBHOOK_URLS', [])
+    ]
+    enqueue_many(jobs)
+
+
+def send_email(to, subject, body):
+    config = current_app.config
+    message = EmailMessage()
+    message['From'] = config.get('MAIL_DEFAULT_SENDER') or config.get('MAIL_USERNAME')
+    message['To'] = to
+    message['Subject'] = subject
+    message.set_content(body)
+
+    with smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config.get('MAIL_TIMEOUT', 30)) as smtp:
+        if config.get('MAIL_USE_TLS'):
+            smtp.starttls()
+        if config.get('MAIL_USERNAME'):
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        smtp.send_message(message)
+
+
+@task('send_order_email')
+def send_order_email(order_id, event, to=None):
+    order = db.session.get(Order, order_id)
+    if order is None:
+        raise PermanentJobError(f'Order {order_id} not found')
+    to = to or (order.user.email if order.user else None)
+    # Jobs queued before MAIL_SERVER was unset have nowhere to go
+    if not to or event not in EMAIL_SUBJECTS or not current_app.config.get('MAIL_SERVER'):
+        return
+
+    lines = [f'{item.product_name} x{item.quantity}: {item.total_price} {order.currency}' for item in order.items]
+    body = '\n'.join([
+        f'Order {order.order_number} ({order.status.value})',
+        '',
+        *lines,
+        '',
+        f'Subtotal: {order.subtotal} {order.currency}',
+        f'Tax: {order.tax_amount} {order.currency}',
+        f'Shipping: {order.shipping_amount} {order.currency}',
+        f'Discount: {order.discount_amount} {order.currency}',
+        f'Total: {order.total_amount} {order.currency}'
+    ])
+    send_email(to, EMAIL_SUBJECTS[event].format(order_number=order.order_number), body)
+
+
+@task('record_order_event')
+def record_order_event(order_id, event):
+    order = db.session.get(Order, order_id)
+    if order is None:
+        raise PermanentJobError(f'Order {order_id} not found')
+    db.session.add(ActivityLog(
+        user_id=order.user_id,
+        action=event,
+        resource_type='order',
+        resource_id=order.id,
+        details={
+            'order_number': order.order_number,
+            'total_amount': float(order.total_amount),
+            'currency': order.currency,
+            'item_count': order.item_count
+        }
+    ))
+
+
+@task('deliver_webhook')
+def deliver_webhook(url, event, data):
+    config = current_app.config
+    body = json.dumps({'event': event, 'data': data}).encode()
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-Webhook-Event': event
+    })
+    if config.get('WEBHOOK_SECRET'):
+        signature = hmac.new(config['WEBHOOK_SECRET'].encode(), body, hashlib.sha256).hexdigest()
+        request.add_header('X-Webhook-Signature', f'sha256={signature}')
+
+    try:
+        with urllib.request.urlopen(request, timeout=config.get('WEBHOOK_TIMEOUT', 10)):
+            pass
+    except urllib.error.HTTPError as e:
+        # Client errors other than timeouts and rate limits will not go away on retry
+        if 400 <= e.code < 500 and e.code not in (408, 429):
+            raise PermanentJobError(f'Webhook {url} rejected {event} with {e.code}')
+        raise
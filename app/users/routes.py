@@ -4,6 +4,9 @@ from datetime import datetime, timezone
 from app.users import bp
 from app.users.schemas import UpdateUserSchema, UserProfileSchema, UserListSchema
 from app.models import User, Order, OrderItem
+from app.pagination import paginate
+from app.orders import snapshots
+from app.orders.services import load_order_items
 from app import db
 
 @bp.route('/profile', methods=['GET'])
@@ -62,11 +65,12 @@ def update_profile():
 @bp.route('/orders', methods=['GET'])
 @jwt_required()
 def get_user_orders():
-    """Get current user's order history"""
+    """Get current user's order history (?summary=true leaves out items)"""
     user_id = int(get_jwt_identity())
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 50)
     status = request.args.get('status')
+    summary = request.args.get('summary', 'false').lower() in ['true', '1', 'yes']
     
     # Build query
     query = Order.query.filter_by(user_id=user_id)
@@ -78,9 +82,11 @@ def get_user_orders():
     query = query.order_by(Order.created_at.desc())
     
     # Paginate
-    orders = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    orders = paginate(query, page, per_page, 'user_orders')
+    
+    # One query for the items of every order on the page, so a page costs
+    # at most three queries (page, count, items)
+    items = {} if summary else load_order_items([order.id for order in orders.items])
     
     # Format orders
     order_list = []
@@ -94,8 +100,10 @@ def get_user_orders():
             'created_at': order.created_at.isoformat(),
             'shipped_at': order.shipped_at.isoformat() if order.shipped_at else None,
             'delivered_at': order.delivered_at.isoformat() if order.delivered_at else None,
-            'items_count': order.get_total_items(),
-            'items': [
+            'items_count': order.item_count
+        }
+        if not summary:
+            order_data['items'] = [
                 {
                     'id': item.id,
                     'product_name': item.product_name,
@@ -104,22 +112,14 @@ def get_user_orders():
                     'unit_price': float(item.unit_price),
                     'total_price': float(item.total_price)
                 }
-                for item in order.items
+                for item in items[order.id]
             ]
-        }
         order_list.append(order_data)
     
     return jsonify({
         'message': 'Orders retrieved successfully',
         'data': order_list,
-        'pagination': {
-            'page': orders.page,
-            'pages': orders.pages,
-            'per_page': orders.per_page,
-            'total': orders.total,
-            'has_next': orders.has_next,
-            'has_prev': orders.has_prev
-        }
+        'pagination': orders.to_dict()
     }), 200
 
 @bp.route('/orders/<int:order_id>', methods=['GET'])
@@ -127,46 +127,12 @@ def get_user_orders():
 def get_user_order(order_id):
     """Get specific order details for current user"""
     user_id = int(get_jwt_identity())
-    order = Order.query.filter_by(id=order_id, user_id=user_id).first()
+    order = snapshots.order_details_query().filter_by(id=order_id, user_id=user_id).first()
     
     if not order:
         return jsonify({'error': 'Order not found'}), 404
     
-    order_data = {
-        'id': order.id,
-        'order_number': order.order_number,
-        'status': order.status.value,
-        'subtotal': float(order.subtotal),
-        'tax_amount': float(order.tax_amount),
-        'shipping_amount': float(order.shipping_amount),
-        'discount_amount': float(order.discount_amount),
-        'total_amount': float(order.total_amount),
-        'currency': order.currency,
-        'shipping_address': order.shipping_address,
-        'billing_address': order.billing_address,
-        'tracking_number': order.tracking_number,
-        'notes': order.notes,
-        'created_at': order.created_at.isoformat(),
-        'shipped_at': order.shipped_at.isoformat() if order.shipped_at else None,
-        'delivered_at': order.delivered_at.isoformat() if order.delivered_at else None,
-        'items': [
-            {
-                'id': item.id,
-                'product_id': item.product_id,
-                'product_name': item.product_name,
-                'product_sku': item.product_sku,
-                'quantity': item.quantity,
-                'unit_price': float(item.unit_price),
-                'total_price': float(item.total_price)
-            }
-            for item in order.items
-        ],
-        'payment': {
-            'method': order.payment.payment_method,
-            'status': order.payment.status.value,
-            'amount': float(order.payment.amount)
-        } if order.payment else None
-    }
+    order_data = snapshots.get_order_data(order)
     
     return jsonify({
         'message': 'Order retrieved successfully',
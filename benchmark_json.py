@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark the JSON providers on a large product listing payload.
+
+Compares Flask's default (stdlib) provider with FastJSONProvider (orjson)
+on a 10k-product page shaped like ProductListSchema output.
+
+Usage: python benchmark_json.py [product_count] [rounds]
+"""
+
+import sys
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+from app import create_app
+from app.json_provider import FastJSONProvider, orjson
+from app.models import OrderStatus
+
+
+def build_payload(count):
+    now = datetime.now(timezone.utc)
+    products = [
+        {
+            'id': i,
+            'name': f'Product {i}',
+            'nameAr': f'منتج {i}',
+            'description': 'A reasonably long product description used for benchmarking. ' * 3,
+            'descriptionAr': 'وصف طويل للمنتج يستخدم لقياس الأداء. ' * 3,
+            'sku': f'SKU-{i:06d}',
+            'price': Decimal('199.99') + i,
+            'compare_price': Decimal('249.99'),
+            'stock_quantity': i % 50,
+            'is_active': True,
+            'is_featured': i % 7 == 0,
+            'is_in_stock': i % 50 > 0,
+            'main_image': f'https://cdn.example.com/products/{i}.jpg',
+            'category': {'id': i % 20, 'name': f'Category {i % 20}', 'slug': f'category-{i % 20}'},
+            'tags': [{'id': 1, 'name': 'new'}, {'id': 2, 'name': 'sale'}],
+            'status': OrderStatus.PAID,
+            'created_at': now,
+        }
+        for i in range(count)
+    ]
+    return {'message': 'Products retrieved successfully', 'data': products}
+
+
+def time_provider(provider, payload, rounds):
+    provider.dumps(payload)  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        provider.dumps(payload)
+    return (time.perf_counter() - start) / rounds
+
+
+class StdlibProvider(DefaultJSONProvider):
+    """Flask's default provider with the same type handling as FastJSONProvider"""
+    default = staticmethod(FastJSONProvider.default)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    app = create_app('testing')
+    payload = build_payload(count)
+
+    print(f"📦 Serializing {count} products, {rounds} rounds each")
+    stdlib_time = time_provider(StdlibProvider(app), payload, rounds)
+    print(f"🐢 stdlib json: {stdlib_time * 1000:8.1f} ms per payload")
+
+    if orjson is None:
+        print("⚠️  orjson is not installed - FastJSONProvider is using the stdlib fallback")
+        return
+
+    fast_time = time_provider(FastJSONProvider(app), payload, rounds)
+    print(f"🚀 orjson:      {fast_time * 1000:8.1f} ms per payload")
+    print(f"✅ Speedup: {stdlib_time / fast_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
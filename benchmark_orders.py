@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark order creation for small and large (B2B) carts.
+
+Checks out carts of 1, 10 and 500 lines through POST /api/v1/orders on an
+in-memory SQLite database and reports the SQL statements executed and the
+time taken per checkout. Carts are filled through the cart endpoints, so
+every line holds an inventory reservation as it would in production.
+
+Usage: python benchmark_orders.py [rounds]
+"""
+
+import sys
+import time
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app import create_app, db
+from app.cart.services import MAX_BATCH_OPERATIONS
+from app.models import User, Address, Product
+
+LINE_COUNTS = (1, 10, 500)
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def setup_data(max_lines):
+    user = User(email='buyer@example.com', username='buyer', first_name='B2B', last_name='Buyer')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.flush()
+    address = Address(
+        user_id=user.id, first_name='B2B', last_name='Buyer', address_line_1='1 Main St',
+        city='Cairo', state='Cairo', postal_code='11511', country='EG'
+    )
+    products = [
+        Product(name=f'Part {i}', sku=f'PART-{i:04d}', slug=f'part-{i}', price=5, stock_quantity=10 ** 6)
+        for i in range(max_lines)
+    ]
+    db.session.add_all([address, *products])
+    db.session.commit()
+    return user.id, address.id, [product.id for product in products]
+
+
+def fill_cart(client, headers, product_ids, lines):
+    """Add `lines` products to the cart through the batch endpoint"""
+    client.delete('/api/v1/cart/clear', headers=headers)
+    for start in range(0, lines, MAX_BATCH_OPERATIONS):
+        operations = [
+            {'op': 'add', 'product_id': product_id, 'quantity': 2}
+            for product_id in product_ids[start:min(start + MAX_BATCH_OPERATIONS, lines)]
+        ]
+        response = client.post('/api/v1/cart/items/batch', json={'operations': operations}, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f'Filling the cart failed: {response.get_json()}')
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    app = create_app('testing')
+    app.config['RESPONSE_CACHE_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        user_id, address_id, product_ids = setup_data(max(LINE_COUNTS))
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+        client = app.test_client()
+        counter = StatementCounter(db.engine)
+
+        print(f"🧾 Order creation, {rounds} rounds per cart size")
+        for lines in LINE_COUNTS:
+            elapsed = 0
+            statements = 0
+            for _ in range(rounds):
+                fill_cart(client, headers, product_ids, lines)
+                counter.count = 0
+                start = time.perf_counter()
+                response = client.post('/api/v1/orders', json={'shipping_address_id': address_id}, headers=headers)
+                elapsed += time.perf_counter() - start
+                statements += counter.count
+                if response.status_code != 201:
+                    print(f"❌ Checkout failed: {response.get_json()}")
+                    return
+            print(f"📦 {lines:4d} lines: {statements / rounds:6.1f} statements, "
+                  f"{elapsed / rounds * 1000:8.1f} ms per order")
+
+
+if __name__ == '__main__':
+    main()
@@ -31,12 +31,101 @@ class Config:
     # Currency
     DEFAULT_CURRENCY = os.environ.get('DEFAULT_CURRENCY', 'USD')
     
-    # Email (for future features)
-    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'localhost')
+    # Pricing: fallbacks when no TaxRate / ShippingRule rows match, and coupon lookups
+    DEFAULT_TAX_RATE = os.environ.get('DEFAULT_TAX_RATE', '0.10')
+    DEFAULT_SHIPPING_COST = os.environ.get('DEFAULT_SHIPPING_COST', '10.00')
+    PRICING_CACHE_TTL = int(os.environ.get('PRICING_CACHE_TTL', 300))  # seconds
+    COUPON_CACHE_TTL = int(os.environ.get('COUPON_CACHE_TTL', 300))  # seconds
+    COUPON_CACHE_MAX_ENTRIES = int(os.environ.get('COUPON_CACHE_MAX_ENTRIES', 1000))
+    
+    # Rendered details of orders still in progress; finished orders use Order.snapshot
+    ORDER_CACHE_TTL = int(os.environ.get('ORDER_CACHE_TTL', 300))  # seconds
+    ORDER_CACHE_MAX_ENTRIES = int(os.environ.get('ORDER_CACHE_MAX_ENTRIES', 1024))
+    
+    # Total counts for paginated listings: exact, cached or estimate per endpoint
+    PAGINATION_COUNT_STRATEGIES = dict(
+        item.strip().split('=', 1)
+        for item in os.environ.get(
+            'PAGINATION_COUNT_STRATEGIES',
+            'products=cached,admin_users=cached,admin_orders=estimate,user_orders=exact'
+        ).split(',')
+        if '=' in item
+    )
+    PAGINATION_COUNT_TTL = int(os.environ.get('PAGINATION_COUNT_TTL', 60))  # seconds
+    PAGINATION_ESTIMATE_THRESHOLD = int(os.environ.get('PAGINATION_ESTIMATE_THRESHOLD', 1000))
+    
+    # Search analytics
+    SEARCH_ANALYTICS_ENABLED = os.environ.get('SEARCH_ANALYTICS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SEARCH_ANALYTICS_FLUSH_INTERVAL = int(os.environ.get('SEARCH_ANALYTICS_FLUSH_INTERVAL', 30))  # seconds
+    SEARCH_ANALYTICS_BUFFER_SIZE = int(os.environ.get('SEARCH_ANALYTICS_BUFFER_SIZE', 10000))
+    SEARCH_HOT_QUERY_LIMIT = int(os.environ.get('SEARCH_HOT_QUERY_LIMIT', 100))
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 300))  # seconds
+    
+    # Response caching and compression
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 60))  # seconds
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 256))
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # bytes
+    COMPRESS_MIMETYPES = ['application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript']
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+    
+    # Stock availability cache (GET /products/availability)
+    STOCK_CACHE_TTL = int(os.environ.get('STOCK_CACHE_TTL', 30))  # seconds
+    STOCK_CACHE_MAX_ENTRIES = int(os.environ.get('STOCK_CACHE_MAX_ENTRIES', 10000))
+    AVAILABILITY_MAX_IDS = int(os.environ.get('AVAILABILITY_MAX_IDS', 100))
+    
+    # Cart backend: 'database' or 'memory' (in-process store with write-behind persistence;
+    # memory carts place no inventory reservations)
+    CART_BACKEND = os.environ.get('CART_BACKEND', 'database')
+    CART_STORE_FLUSH_INTERVAL = int(os.environ.get('CART_STORE_FLUSH_INTERVAL', 5))  # seconds
+    CART_STORE_BATCH_SIZE = int(os.environ.get('CART_STORE_BATCH_SIZE', 100))
+    CART_STORE_IDLE_TTL = int(os.environ.get('CART_STORE_IDLE_TTL', 1800))  # seconds
+    
+    # Inventory reservations held by carts
+    INVENTORY_RESERVATIONS_ENABLED = os.environ.get('INVENTORY_RESERVATIONS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    INVENTORY_RESERVATION_TTL = int(os.environ.get('INVENTORY_RESERVATION_TTL', 900))  # seconds
+    INVENTORY_RELEASE_BATCH_SIZE = int(os.environ.get('INVENTORY_RELEASE_BATCH_SIZE', 500))
+    
+    # Order numbers: 'snowflake' (time-ordered) or 'uuid'
+    ORDER_NUMBER_STRATEGY = os.environ.get('ORDER_NUMBER_STRATEGY', 'snowflake')
+    ORDER_NUMBER_NODE_ID = int(os.environ.get('ORDER_NUMBER_NODE_ID', 0))  # 0-63, unique per host
+    ORDER_NUMBER_WORKER_ID = os.environ.get('ORDER_NUMBER_WORKER_ID')  # 0-1023, unique per process; set by gunicorn.conf.py
+    
+    # Idempotency-Key support for order creation and payment
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 86400))  # seconds
+    IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', 10))  # seconds
+    IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))  # seconds
+    
+    # Purge of abandoned carts and expired rows (flask purge)
+    CART_ABANDONED_AFTER_DAYS = int(os.environ.get('CART_ABANDONED_AFTER_DAYS', 30))
+    PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 500))
+    
+    # Background jobs (flask jobs worker)
+    JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', 2))
+    JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', 10))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))  # seconds
+    JOB_VISIBILITY_TIMEOUT = int(os.environ.get('JOB_VISIBILITY_TIMEOUT', 300))  # seconds
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_BACKOFF = int(os.environ.get('JOB_RETRY_BACKOFF', 30))  # seconds, doubled per attempt
+    JOB_RETRY_BACKOFF_MAX = int(os.environ.get('JOB_RETRY_BACKOFF_MAX', 3600))  # seconds
+    JOB_METRICS_INTERVAL = int(os.environ.get('JOB_METRICS_INTERVAL', 60))  # seconds
+    JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+    
+    # Order event webhooks, delivered by background jobs
+    WEBHOOK_URLS = [url.strip() for url in os.environ.get('WEBHOOK_URLS', '').split(',') if url.strip()]
+    WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
+    WEBHOOK_TIMEOUT = int(os.environ.get('WEBHOOK_TIMEOUT', 10))  # seconds
+    
+    # Email (order notifications, sent by background jobs); no emails are queued without MAIL_SERVER
+    MAIL_SERVER = os.environ.get('MAIL_SERVER')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', 'on', '1']
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
+    MAIL_TIMEOUT = int(os.environ.get('MAIL_TIMEOUT', 30))  # seconds
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -63,6 +152,7 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     JWT_ACCESS_TOKEN_EXPIRES = 60  # 1 minute for testing
+    SEARCH_ANALYTICS_ENABLED = False
 
 config = {
     'development': DevelopmentConfig,
@@ -0,0 +1,25 @@
+"""
+Gunicorn settings, read automatically from the working directory.
+
+Every worker gets a slot (0-1023) that no other live worker holds, exported
+as ORDER_NUMBER_WORKER_ID for the snowflake order number generator
+(app.order_numbers). Slots are handed out by the arbiter, which knows the
+live workers, and a restarted worker takes the lowest free slot, so two
+workers on one node can never issue the same order number.
+"""
+
+import os
+
+ORDER_NUMBER_WORKER_SLOTS = 1024
+
+
+def pre_fork(server, worker):
+    # Runs in the arbiter before the new worker is added to server.WORKERS
+    taken = {getattr(live, 'order_number_slot', None) for live in server.WORKERS.values()}
+    worker.order_number_slot = next(
+        slot for slot in range(ORDER_NUMBER_WORKER_SLOTS) if slot not in taken
+    )
+
+
+def post_fork(server, worker):
+    os.environ['ORDER_NUMBER_WORKER_ID'] = str(worker.order_number_slot)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Concurrent checkout stress test: proves orders never oversell stock.
+
+Fires many guest and cart checkouts for one product from parallel threads
+and checks that the number of units sold never exceeds the initial stock
+and that stock never goes negative.
+
+Runs against a temporary SQLite file by default; set DATABASE_URL to run
+against PostgreSQL (the database is dropped and recreated, so never point
+it at real data).
+
+Usage: python stress_test_stock.py [orders] [threads] [stock]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models import User, Address, Product, Cart, CartItem, OrderItem
+from config import config, TestingConfig
+
+TEMP_DIR = tempfile.mkdtemp()
+
+
+class StressConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f"sqlite:///{os.path.join(TEMP_DIR, 'stress.db')}"
+    # Let SQLite writers wait for the lock instead of failing immediately
+    SQLALCHEMY_ENGINE_OPTIONS = {} if os.environ.get('DATABASE_URL') else {'connect_args': {'timeout': 30}}
+    INVENTORY_RESERVATIONS_ENABLED = False
+    RESPONSE_CACHE_ENABLED = False
+    JWT_ACCESS_TOKEN_EXPIRES = 3600
+
+
+def setup_data(app, orders, stock):
+    """Create the product plus one user with a one-item cart per cart checkout"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        product = Product(name='Flash Sale Item', sku='FLASH-1', slug='flash-sale-item', price=10, stock_quantity=stock)
+        db.session.add(product)
+        db.session.flush()
+
+        tokens = []
+        for i in range(orders // 2):
+            user = User(email=f'buyer{i}@example.com', username=f'buyer{i}', first_name='Buyer', last_name=str(i))
+            user.set_password('password')
+            db.session.add(user)
+            db.session.flush()
+            address = Address(
+                user_id=user.id, first_name='Buyer', last_name=str(i), address_line_1='1 Main St',
+                city='Cairo', state='Cairo', postal_code='11511', country='EG'
+            )
+            cart = Cart(user_id=user.id)
+            db.session.add_all([address, cart])
+            db.session.flush()
+            db.session.add(CartItem(cart_id=cart.id, product_id=product.id, quantity=1, unit_price=product.price))
+            tokens.append((create_access_token(identity=str(user.id)), address.id))
+        db.session.commit()
+        return product.id, tokens
+
+
+def checkout(app, product_id, token=None, address_id=None):
+    client = app.test_client()
+    if token:
+        response = client.post(
+            '/api/v1/orders',
+            json={'shipping_address_id': address_id},
+            headers={'Authorization': f'Bearer {token}'}
+        )
+    else:
+        response = client.post('/api/v1/orders/guest', json={
+            'items': [{'product_id': product_id, 'quantity': 1}],
+            'shipping_address': {'address_line_1': '1 Main St', 'city': 'Cairo', 'country': 'EG'},
+            'contact_email': 'guest@example.com'
+        })
+    return response.status_code
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    stock = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    config['stress'] = StressConfig
+    app = create_app('stress')
+    product_id, tokens = setup_data(app, orders, stock)
+
+    jobs = [(token, address_id) for token, address_id in tokens]
+    jobs += [(None, None)] * (orders - len(jobs))
+
+    print(f"🛒 {orders} checkouts for {stock} units from {threads} threads")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        statuses = list(executor.map(lambda job: checkout(app, product_id, *job), jobs))
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        final_stock = db.session.get(Product, product_id).stock_quantity
+        sold = db.session.query(db.func.coalesce(db.func.sum(OrderItem.quantity), 0)).scalar()
+
+    succeeded = statuses.count(201)
+    rejected = statuses.count(400)
+    failed = len(statuses) - succeeded - rejected
+    print(f"⏱️  {elapsed:.2f}s ({len(statuses) / elapsed:.0f} checkouts/s)")
+    print(f"✅ {succeeded} orders, 🚫 {rejected} rejected for stock, ❌ {failed} errors")
+    print(f"📦 Units sold: {sold}, stock left: {final_stock}")
+
+    if final_stock < 0 or sold > stock or sold + final_stock != stock:
+        print("❌ OVERSOLD")
+        sys.exit(1)
+    print("🎉 No oversell")
+
+
+if __name__ == '__main__':
+    main()
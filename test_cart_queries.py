@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Query-count regression test for GET /api/v1/cart
+
+The cart is loaded with its products and main images in one query, so
+viewing it costs the same statements whatever its size. Run with pytest.
+"""
+
+import pytest
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models import Cart, CartItem, Category, Product, ProductImage, User
+
+# Cart lookup plus the single lines query
+CART_VIEW_QUERIES = 2
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def create_cart(line_count):
+    """A user whose cart holds line_count products with two images each; returns the user id"""
+    user = User(email='cart@example.com', username='cart', first_name='Cart', last_name='User')
+    user.set_password('password')
+    category = Category(name='Books', slug='books')
+    db.session.add_all([user, category])
+    db.session.flush()
+
+    cart = Cart(user_id=user.id)
+    db.session.add(cart)
+    db.session.flush()
+    for i in range(line_count):
+        product = Product(
+            name=f'Product {i}', slug=f'product-{i}', sku=f'SKU-{i}',
+            price=10 + i, stock_quantity=100, category_id=category.id
+        )
+        db.session.add(product)
+        db.session.flush()
+        db.session.add_all([
+            ProductImage(product_id=product.id, url=f'/images/{i}-main.jpg'),
+            ProductImage(product_id=product.id, url=f'/images/{i}-side.jpg'),
+            CartItem(cart_id=cart.id, product_id=product.id, quantity=i + 1, unit_price=product.price)
+        ])
+    db.session.commit()
+    return user.id
+
+
+def count_cart_view_queries(app, user_id):
+    """Statements executed by one GET /api/v1/cart, and its response data"""
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+    # Start from an empty identity map, as a fresh request would
+    db.session.expunge_all()
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = app.test_client().get('/api/v1/cart', headers=headers)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert response.status_code == 200
+    return len(statements), response.get_json()['data']
+
+
+@pytest.mark.parametrize('line_count', [1, 5, 25])
+def test_cart_view_query_count_is_constant(app, line_count):
+    user_id = create_cart(line_count)
+
+    count, data = count_cart_view_queries(app, user_id)
+
+    assert count == CART_VIEW_QUERIES
+    assert len(data['items']) == line_count
+    assert data['total_items'] == sum(range(1, line_count + 1))
+    for i, item in enumerate(data['items']):
+        assert item['product']['main_image'] == f'/images/{i}-main.jpg'